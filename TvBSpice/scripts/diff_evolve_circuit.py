@@ -33,8 +33,8 @@ def simulation(sim_vec, do_plot=False):
 
     p = spice_read.spice_read(RESULTS_FILE).get_plots()[0]
     time = p.get_scalevector().get_data()
-    utp = p.get_datavector(2).get_data()[0]
-    ltp = p.get_datavector(3).get_data()[0]
+    utp = p['utp'].get_data()[0]
+    ltp = p['ltp'].get_data()[0]
     results = {'utp': utp, 'ltp':ltp}
     cost = fitness(results, targets)
 
@@ -49,8 +49,8 @@ def simulation(sim_vec, do_plot=False):
         print "Lower Trip Point: %sV"%(str(ltp))
         print
         print "Cost: %s"%(str(cost))
-        vin = p.get_datavector(0)
-        vout = p.get_datavector(1)
+        vin = p['v(in)']
+        vout = p['v(out)']
         
         plot(time, vin.get_data(), label=vin.name)
         plot(time, vout.get_data(), label=vout.name)
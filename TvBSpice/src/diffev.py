@@ -6,6 +6,13 @@ Copyright 2005 by Robert Kern.
 """
 
 import numpy as np
+import os
+import cPickle as pickle
+import collections
+import Queue
+import sqlite3
+import multiprocessing
+import multiprocessing.pool
 
 # Licence:
 # Copyright (c) 2001, 2002 Enthought, Inc.
@@ -85,13 +92,281 @@ import numpy as np
 #        shift[:] = False
 #    Next generation.
 
+def _call(item):
+    # Module level, so the process pool can pickle it.
+    func, vector, args = item
+    return func(vector, *args)
+
+def _call_tagged(item):
+    # Exceptions are returned, the pools of Python 2 drop them for
+    # apply_async and the result would never arrive.
+    tag, func, vector, args = item
+    try:
+        return tag, True, func(vector, *args)
+    except Exception, e:
+        return tag, False, e
+
+class Evaluator(object):
+    """Evaluate the vectors one after the other in this process.
+
+    An evaluator is called as evaluator(func, vectors, args) and returns the
+    function values in the order of the vectors. For the asynchronous mode
+    single vectors are started with submit(func, vector, args, tag), and
+    next_result() waits for the next finished one and returns (tag, value).
+    Here the vectors are evaluated by next_result() in the order of
+    submission. The other evaluators derive from this class.
+    """
+    def __init__(self):
+        self.waiting = collections.deque()
+
+    def __call__(self, func, vectors, args=()):
+        return [func(v, *args) for v in vectors]
+
+    def submit(self, func, vector, args, tag):
+        self.waiting.append((tag, func, vector, args))
+
+    def next_result(self):
+        tag, func, vector, args = self.waiting.popleft()
+        return tag, self(func, [vector], args)[0]
+
+    def cancel(self):
+        """Drop the submitted vectors whose results were not collected.
+        """
+        self.waiting.clear()
+
+    def close(self):
+        self.cancel()
+
+class BatchEvaluator(Evaluator):
+    """Pass all vectors to a vectorized function in a single call.
+
+    func(batch, *args) gets a 2-d array with one vector per row and has to
+    return a sequence with one value per row.
+    """
+    def __call__(self, func, vectors, args=()):
+        vectors = np.asarray(vectors)
+        if len(vectors) == 0:
+            return []
+        values = list(np.asarray(func(vectors, *args), dtype=float).ravel())
+        if len(values) != len(vectors):
+            raise ValueError("vectorized func returned %i values for %i "
+                             "vectors" % (len(values), len(vectors)))
+        return values
+
+class PoolEvaluator(Evaluator):
+    """Evaluate the vectors in a pool of workers.
+
+    pool_factory(processes) creates the pool, e.g. multiprocessing.Pool or
+    multiprocessing.pool.ThreadPool. The pool is created on the first call
+    and kept until close(). The values are returned in the order of the
+    vectors, whatever worker finished first. next_result() returns the
+    results in the order they finish. While it waits it checks every
+    poll_interval seconds that no worker has died, the results of a dead
+    worker never arrive.
+    """
+    def __init__(self, pool_factory, processes=None, chunksize=1,
+                 poll_interval=1.0):
+        Evaluator.__init__(self)
+        self.pool_factory = pool_factory
+        self.processes = processes
+        self.chunksize = chunksize
+        self.poll_interval = poll_interval
+        self.pool = None
+        self.workers = []
+        self.results = Queue.Queue()
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = self.pool_factory(self.processes)
+            self.workers = []
+            self.dead_workers()
+        return self.pool
+
+    def dead_workers(self):
+        """Return the workers that died since the pool was created.
+        """
+        # The pool replaces dead workers, so all workers seen are kept to
+        # look at their exit codes.
+        for w in getattr(self.pool, '_pool', []):
+            if w not in self.workers:
+                self.workers.append(w)
+        return [w for w in self.workers if w.exitcode not in (None, 0)]
+
+    def __call__(self, func, vectors, args=()):
+        return self.get_pool().map(_call, [(func, v, args) for v in vectors],
+                                   self.chunksize)
+
+    def submit(self, func, vector, args, tag):
+        self.get_pool().apply_async(_call_tagged, ((tag, func, vector, args),),
+                                    callback=self.results.put)
+
+    def next_result(self):
+        while True:
+            try:
+                tag, ok, value = self.results.get(timeout=self.poll_interval)
+                break
+            except Queue.Empty:
+                dead = self.dead_workers()
+                if dead:
+                    raise RuntimeError("%i pool worker(s) died (exit codes %s),"
+                                       " their results will not arrive" %
+                                       (len(dead), [w.exitcode for w in dead]))
+        if not ok:
+            raise value
+        return tag, value
+
+    def cancel(self):
+        """Stop the pool and drop the results that were not collected.
+
+        A new pool is created on the next call.
+        """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.workers = []
+        self.results = Queue.Queue()
+
+    def close(self):
+        # join() of a pool waits for lost results forever.
+        if self.dead_workers():
+            self.cancel()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        self.workers = []
+        self.results = Queue.Queue()
+
+class ThreadPoolEvaluator(PoolEvaluator):
+    """Evaluate the vectors in a pool of threads.
+
+    Useful when func spends its time outside of the interpreter, e.g. in a
+    simulator subprocess. func has to be thread safe (no shared temporary
+    files).
+    """
+    def __init__(self, processes=None, chunksize=1, poll_interval=1.0):
+        PoolEvaluator.__init__(self, multiprocessing.pool.ThreadPool,
+                               processes, chunksize, poll_interval)
+
+class ProcessPoolEvaluator(PoolEvaluator):
+    """Evaluate the vectors in a pool of processes.
+
+    func and args are pickled for every call, so func has to be a module
+    level function.
+    """
+    def __init__(self, processes=None, chunksize=1, poll_interval=1.0):
+        PoolEvaluator.__init__(self, multiprocessing.Pool, processes,
+                               chunksize, poll_interval)
+
+class FitnessCache(object):
+    """Function values by quantized parameter vector.
+
+    resolution -- quantization step, a scalar or one step per dimension.
+      Vectors that round to the same multiples of the steps share a value.
+      If None, only identical vectors do.
+    maxsize -- number of values kept in memory, the least recently used
+      ones are dropped first
+    filename -- optional sqlite database with the values of all runs using
+      it, several processes can share it
+    namespace -- name of the function in the database, runs of different
+      functions (or args) must not share one
+
+    Public Members
+    --------------
+    hits -- lookups answered without evaluating the function
+    disk_hits -- the part of hits answered from the database
+    misses -- lookups that needed an evaluation
+    """
+    def __init__(self, resolution=None, maxsize=4096, filename=None,
+                 namespace=''):
+        if resolution is not None:
+            resolution = np.asarray(resolution, dtype=float)
+        self.resolution = resolution
+        self.maxsize = maxsize
+        self.namespace = namespace
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.db = None
+        if filename is not None:
+            self.db = sqlite3.connect(filename, timeout=600)
+            self.db.execute("CREATE TABLE IF NOT EXISTS fitness "
+                            "(namespace TEXT, key BLOB, value REAL, "
+                            "PRIMARY KEY (namespace, key))")
+            self.db.commit()
+
+    def key(self, vector):
+        vector = np.asarray(vector, dtype=float)
+        if self.resolution is not None:
+            vector = np.round(vector / self.resolution)
+        # + 0.0 turns -0.0 into 0.0
+        return (vector + 0.0).tostring()
+
+    def get(self, key):
+        """Return the value of the key or None, without counting.
+        """
+        if key in self.entries:
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+        if self.db is not None:
+            row = self.db.execute("SELECT value FROM fitness WHERE "
+                                  "namespace = ? AND key = ?",
+                                  (self.namespace, sqlite3.Binary(key))
+                                  ).fetchone()
+            if row is not None and row[0] is not None:
+                self.disk_hits += 1
+                self.remember(key, row[0])
+                return row[0]
+        return None
+
+    def lookup(self, vector):
+        """Return the value of the vector or None, and count the lookup.
+        """
+        value = self.get(self.key(vector))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def remember(self, key, value):
+        self.entries[key] = value
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def put(self, vector, value):
+        key = self.key(vector)
+        self.remember(key, value)
+        # sqlite stores NaN as NULL
+        if self.db is not None and value == value:
+            self.db.execute("INSERT OR REPLACE INTO fitness VALUES (?, ?, ?)",
+                            (self.namespace, sqlite3.Binary(key),
+                             float(value)))
+            self.db.commit()
+
+    def hit_rate(self):
+        """Return the fraction of the lookups answered from the cache.
+        """
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
 class DiffEvolver(object):
     """Minimize a function using differential evolution.
 
     Constructors
     ------------
     DiffEvolver(func, pop0, args=(), crossover_rate=0.5, scale=None,
-        strategy=('rand', 2, 'bin'), eps=1e-6)
+        strategy=('rand', 2, 'bin'), eps=1e-6, evaluator=None, cache=None)
       func -- function to minimize
       pop0 -- sequence of initial vectors
       args -- additional arguments to apply to func
@@ -108,19 +383,53 @@ class DiffEvolver(object):
         with eps of each other, convergence has been achieved.
       prng -- a RandomState instance. By default, this is the global
         numpy.random instance.
+      evaluator -- computes the function values of many vectors at once,
+        evaluator(func, vectors, args). One of Evaluator (default, serial),
+        BatchEvaluator for a vectorized func(batch), ThreadPoolEvaluator or
+        ProcessPoolEvaluator. All random numbers of a generation are drawn
+        before the evaluation, so the result does not depend on the number
+        of workers.
+      pop_values -- function values of pop0, if None pop0 is evaluated
+      cache -- a FitnessCache, looked up before the function is evaluated.
+        Its hit counters tell how many evaluations were saved.
 
     DiffEvolver.frombounds(func, lbound, ubound, npop, crossover_rate=0.5,
-        scale=None, strategy=('rand', 2, 'bin'), eps=1e-6)
+        scale=None, strategy=('rand', 2, 'bin'), eps=1e-6, evaluator=None,
+        cache=None)
       Randomly initialize the population within given rectangular bounds.
       lbound -- lower bound vector
       ubound -- upper bound vector
       npop -- size of population
 
+    DiffEvolver.resume(path, func=None, args=None, evaluator=None, prng=None,
+        cache=None)
+      Continue a run from a checkpoint file. func and args default to the
+      ones stored in the checkpoint (if they could be pickled).
+
     Public Methods
     --------------
-    solve(newgens=100)
+    solve(newgens=100, vectorized=False)
       Run the minimizer for newgens more generations. Return the best parameter
-      vector from the whole run.
+      vector from the whole run. With vectorized, the trial vectors of a
+      generation are all made from the same population by get_trials() and
+      the population is updated after the generation. All trials of the
+      generation are passed to the evaluator in one call.
+    solve_async(newgens=100, inflight=None)
+      Run newgens more generation-equivalents (npop trials each) in the
+      steady-state mode: inflight trials are evaluated at the same time, a
+      finished trial replaces its candidate at once and the next trial is
+      started. Return the best parameter vector from the whole run.
+    close()
+      Release the workers of the evaluator.
+    checkpoint(path)
+      Write the state of the run (population, values, history, PRNG state,
+      trials of solve_async() being evaluated) to the .npz file path.
+    set_checkpoint(path, every=1)
+      Write a checkpoint to path after every `every` generations.
+    get_trials(candidates=None)
+      Return trial vectors for the given candidates (default: the whole
+      population) computed with a few array operations. The trials have the
+      same distribution as the ones from get_trial().
 
     Public Members
     --------------
@@ -131,10 +440,12 @@ class DiffEvolver(object):
     population -- current population
     pop_values -- respective function values for each of the current population
     generations -- number of generations already computed
-    func, args, crossover_rate, scale, strategy, eps -- from constructor
+    func, args, crossover_rate, scale, strategy, eps, evaluator -- from
+      constructor
     """
     def __init__(self, func, pop0, args=(), crossover_rate=0.5, scale=None,
-            strategy=('rand', 2, 'bin'), eps=1e-6, prng=np.random):
+            strategy=('rand', 2, 'bin'), eps=1e-6, prng=np.random,
+            evaluator=None, pop_values=None, cache=None):
         self.func = func
         self.population = np.array(pop0)
         self.npop, self.ndim = self.population.shape
@@ -143,10 +454,18 @@ class DiffEvolver(object):
         self.strategy = strategy
         self.eps = eps
         self.prng = prng
+        if evaluator is None:
+            evaluator = Evaluator()
+        self.evaluator = evaluator
+        self.cache = cache
 
-        self.pop_values = [self.func(m, *args) for m in self.population]
+        if pop_values is None:
+            self.pop_values = self.evaluate(self.population)
+        else:
+            self.pop_values = list(pop_values)
         bestidx = np.argmin(self.pop_values)
-        self.best_vector = self.population[bestidx]
+        # A copy, the row of the population changes with the generations.
+        self.best_vector = self.population[bestidx].copy()
         self.best_value = self.pop_values[bestidx]
 
         if scale is None:
@@ -159,6 +478,20 @@ class DiffEvolver(object):
         self.best_vec_history = []
 
         self.bound = None
+        self.bound_mode = 'skip'
+        # How often a rejected trial is drawn again by bound_trials().
+        self.reject_tries = 100
+
+        # State of solve_async(): the trials being evaluated by candidate
+        # (in the order they were started),
+        # the next candidate to get a trial and the number of trials of the
+        # current generation-equivalent.
+        self.pending = collections.OrderedDict()
+        self.next_candidate = 0
+        self.trial_count = 0
+
+        self.checkpoint_path = None
+        self.checkpoint_every = 1
 
         self.jump_table = {
             ('rand', 1, 'bin'): (self.choose_rand, self.diff1, self.bin_crossover),
@@ -173,17 +506,181 @@ class DiffEvolver(object):
         self.best_val_history = []
         self.best_vec_history = []
         self.generations = 0
-        self.pop_values = [self.func(m, *self.args) for m in self.population]
+        self.pending = collections.OrderedDict()
+        self.next_candidate = 0
+        self.trial_count = 0
+        self.pop_values = self.evaluate(self.population)
+
+    def evaluate(self, vectors):
+        """Return the list of function values of the vectors.
+
+        With a cache only the vectors that are not cached are evaluated, and
+        vectors with the same key only once.
+        """
+        if self.cache is None:
+            return list(self.evaluator(self.func, vectors, self.args))
+        values = [None] * len(vectors)
+        missing = collections.OrderedDict()
+        for i, v in enumerate(vectors):
+            key = self.cache.key(v)
+            if key in missing:
+                self.cache.hits += 1
+                missing[key].append(i)
+                continue
+            values[i] = self.cache.lookup(v)
+            if values[i] is None:
+                missing[key] = [i]
+        indices = missing.values()
+        new_values = self.evaluator(self.func,
+                                    [vectors[idx[0]] for idx in indices],
+                                    self.args)
+        for idx, value in zip(indices, new_values):
+            self.cache.put(vectors[idx[0]], value)
+            for i in idx:
+                values[i] = value
+        return values
+
+    def close(self):
+        """Release the workers of the evaluator and the cache database.
+        """
+        self.evaluator.close()
+        if self.cache is not None:
+            self.cache.close()
 
     def frombounds(cls, func, lbound, ubound, npop, crossover_rate=0.5,
-            scale=None, strategy=('rand', 2, 'bin'), eps=1e-6, prng=np.random):
+            scale=None, strategy=('rand', 2, 'bin'), eps=1e-6, prng=np.random,
+            evaluator=None, cache=None):
         lbound = np.asarray(lbound)
         ubound = np.asarray(ubound)
         pop0 = prng.uniform(lbound, ubound, size=(npop, len(lbound)))
         return cls(func, pop0, crossover_rate=crossover_rate, scale=scale,
-            strategy=strategy, eps=eps, prng=prng)
+            strategy=strategy, eps=eps, prng=prng, evaluator=evaluator,
+            cache=cache)
     frombounds = classmethod(frombounds)
 
+    def checkpoint(self, path):
+        """Write the state of the run to the .npz file path.
+
+        The file is written next to path and renamed, a crash while writing
+        leaves the previous checkpoint intact.
+        """
+        if isinstance(self.prng, np.random.RandomState):
+            state = self.prng.get_state()
+        else:
+            state = np.random.get_state()
+        try:
+            funcref = pickle.dumps((self.func, self.args), 2)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            funcref = ''
+        choice, ndiff, crossover = self.strategy
+        pending = self.pending.items()
+        arrays = dict(
+            format=np.array('diffev_checkpoint'), version=np.array(1),
+            population=self.population,
+            pop_values=np.array(self.pop_values, dtype=float),
+            best_vector=np.asarray(self.best_vector),
+            best_value=np.array(self.best_value, dtype=float),
+            best_val_history=np.array(self.best_val_history, dtype=float),
+            best_vec_history=np.array(self.best_vec_history).reshape(
+                len(self.best_vec_history), self.ndim),
+            generations=np.array(self.generations),
+            crossover_rate=np.array(self.crossover_rate),
+            scale=np.array(self.scale), eps=np.array(self.eps),
+            strategy_choice=np.array(choice), strategy_ndiff=np.array(ndiff),
+            strategy_crossover=np.array(crossover),
+            bound_mode=np.array(self.bound_mode),
+            lbound=np.asarray(getattr(self, 'lbound', [])),
+            ubound=np.asarray(getattr(self, 'ubound', [])),
+            reject_tries=np.array(self.reject_tries),
+            pending_candidates=np.array([c for c, t in pending], dtype=int),
+            pending_trials=np.array([t for c, t in pending]).reshape(
+                len(pending), self.ndim),
+            next_candidate=np.array(self.next_candidate),
+            trial_count=np.array(self.trial_count),
+            checkpoint_every=np.array(self.checkpoint_every),
+            prng_name=np.array(state[0]), prng_keys=state[1],
+            prng_pos=np.array(state[2]), prng_has_gauss=np.array(state[3]),
+            prng_gauss=np.array(state[4]),
+            funcref=np.frombuffer(funcref, dtype=np.uint8))
+        tmppath = path + '.tmp'
+        f = open(tmppath, 'wb')
+        try:
+            np.savez_compressed(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        os.rename(tmppath, path)
+
+    def set_checkpoint(self, path, every=1):
+        """Write a checkpoint to path after every `every` generations of
+        solve() (generation-equivalents of solve_async()). None for path
+        switches the checkpoints off.
+        """
+        self.checkpoint_path = path
+        self.checkpoint_every = every
+
+    def auto_checkpoint(self):
+        if (self.checkpoint_path is not None and
+            self.generations % self.checkpoint_every == 0):
+            self.checkpoint(self.checkpoint_path)
+
+    def resume(cls, path, func=None, args=None, evaluator=None, prng=None,
+               cache=None):
+        """Continue the run of the checkpoint file path.
+
+        The population is not evaluated again. The trials of solve_async()
+        that were being evaluated are started again on the evaluator, the
+        next solve_async() call collects them. With the same func, the same
+        evaluator type and a serial evaluator the run continues exactly as
+        it would have without the interruption. Checkpoints are written to
+        path again with the interval of the original run.
+        """
+        data = np.load(path)
+        if 'format' not in data.files or \
+           str(data['format']) != 'diffev_checkpoint':
+            raise ValueError("%s is not a DiffEvolver checkpoint" % path)
+        if func is None:
+            if len(data['funcref']) == 0:
+                raise ValueError("the function of %s could not be stored, "
+                                 "pass func" % path)
+            func, stored_args = pickle.loads(data['funcref'].tostring())
+            if args is None:
+                args = stored_args
+        if args is None:
+            args = ()
+        if prng is None:
+            prng = np.random.RandomState()
+        prng.set_state((str(data['prng_name']), data['prng_keys'],
+                        int(data['prng_pos']), int(data['prng_has_gauss']),
+                        float(data['prng_gauss'])))
+        strategy = (str(data['strategy_choice']), int(data['strategy_ndiff']),
+                    str(data['strategy_crossover']))
+        self = cls(func, data['population'], args=args,
+                   crossover_rate=float(data['crossover_rate']),
+                   scale=float(data['scale']), strategy=strategy,
+                   eps=float(data['eps']), prng=prng, evaluator=evaluator,
+                   pop_values=data['pop_values'], cache=cache)
+        self.best_vector = data['best_vector']
+        self.best_value = float(data['best_value'])
+        self.best_val_history = list(data['best_val_history'])
+        self.best_vec_history = list(data['best_vec_history'])
+        self.generations = int(data['generations'])
+        if len(data['lbound']) > 0:
+            self.set_boundaries(data['lbound'], data['ubound'],
+                                str(data['bound_mode']))
+        self.reject_tries = int(data['reject_tries'])
+        self.next_candidate = int(data['next_candidate'])
+        self.trial_count = int(data['trial_count'])
+        for candidate, trial in zip(data['pending_candidates'],
+                                    data['pending_trials']):
+            self.pending[int(candidate)] = trial
+            self.evaluator.submit(self.func, trial, self.args, int(candidate))
+        self.set_checkpoint(path, int(data['checkpoint_every']))
+        data.close()
+        return self
+    resume = classmethod(resume)
+
     def set_boundaries(self, lbound, ubound, mode='mirror'):
         boundary_table = {'skip': None,
                           'reject': self.bound_reject,
@@ -193,6 +690,7 @@ class DiffEvolver(object):
                           'old': self.bound_old
                           }
         self.bound = boundary_table[mode]
+        self.bound_mode = mode
         self.lbound = lbound
         self.ubound = ubound
 
@@ -278,42 +776,238 @@ class DiffEvolver(object):
             chooser(candidate) + differ(candidate))
         return trial
 
+    def select_samples_all(self, candidates, nsamples):
+        """For each candidate, select nsamples distinct population indices
+        other than the candidate, like select_samples().
+
+        Return an array of shape (len(candidates), nsamples).
+        """
+        candidates = np.asarray(candidates)
+        excluded = candidates[:,np.newaxis]
+        samples = np.empty((len(candidates), nsamples), dtype=int)
+        for j in xrange(nsamples):
+            # A uniform index among the members that are not excluded yet,
+            # mapped to the population by skipping the excluded indices in
+            # ascending order.
+            r = self.prng.randint(0, self.npop - 1 - j, size=len(candidates))
+            for e in np.sort(excluded, axis=1).T:
+                r += r >= e
+            samples[:,j] = r
+            excluded = np.column_stack((excluded, r))
+        return samples
+
+    def get_trials(self, candidates=None):
+        """Return the trial vectors of the candidates (default: all).
+
+        This is get_trial() for many candidates at once. The base vector and
+        the difference vectors are drawn independently, like the choose_*
+        and diff* methods do.
+        """
+        if candidates is None:
+            candidates = np.arange(self.npop)
+        candidates = np.asarray(candidates)
+        if self.strategy not in self.jump_table:
+            raise ValueError("unknown strategy: %s" % (self.strategy,))
+        choice, ndiff, crossover = self.strategy
+        pop = self.population
+        if choice == 'rand':
+            base = pop[self.select_samples_all(candidates, 1)[:,0]]
+        elif choice == 'best':
+            base = self.best_vector
+        else: # 'rand-to-best'
+            base = ((1-self.scale) * pop[candidates] +
+                    self.scale * self.best_vector)
+        samples = self.select_samples_all(candidates, 2*ndiff)
+        diff = pop[samples[:,0]] - pop[samples[:,1]]
+        if ndiff == 2:
+            diff += pop[samples[:,2]] - pop[samples[:,3]]
+        mutants = base + self.scale * diff
+        mask = self.prng.rand(len(candidates), self.ndim) < self.crossover_rate
+        return np.where(mask, mutants, pop[candidates])
+
+    def bound_trials(self, candidates, trials):
+        """Apply the boundary function to the trials of the candidates.
+
+        The bound_* methods work on whole arrays of candidates. Trials
+        rejected by the 'reject' mode are drawn again, up to reject_tries
+        times. Return the trials and a boolean array of the trials that are
+        valid (within the bounds for 'reject', otherwise all).
+        """
+        candidates = np.asarray(candidates)
+        valid = np.ones(len(candidates), dtype=bool)
+        if self.bound is None:
+            return trials, valid
+        if self.bound_mode != 'reject':
+            return self.bound(candidates, trials), valid
+        trials = np.array(trials)
+        for i in xrange(self.reject_tries + 1):
+            valid = np.all((trials >= self.lbound) & (trials <= self.ubound),
+                           axis=1)
+            if valid.all() or i == self.reject_tries:
+                break
+            redo = np.flatnonzero(~valid)
+            trials[redo] = self.get_trials(candidates[redo])
+        return trials, valid
+
+    def select(self, candidates, trials, trial_values):
+        """Replace the candidates by their trials where the trials are
+        better, and update the best vector.
+        """
+        for candidate, trial, value in zip(candidates, trials, trial_values):
+            if value < self.pop_values[candidate]:
+                self.population[candidate] = trial
+                self.pop_values[candidate] = value
+                if value < self.best_value:
+                    self.best_vector = trial
+                    self.best_value = value
+
+    def evolve_generation(self):
+        """Compute one generation from a single population snapshot. The
+        trials are evaluated in one call of the evaluator.
+        """
+        candidates = np.arange(self.npop)
+        trials, valid = self.bound_trials(candidates,
+                                          self.get_trials(candidates))
+        candidates = candidates[valid]
+        trials = trials[valid]
+        trial_values = self.evaluate(trials)
+        self.select(candidates, trials, trial_values)
+
     def converged(self):
         return max(self.pop_values) - min(self.pop_values) <= self.eps
 
-    def solve(self, newgens=100):
+    def evolve_sequential(self):
+        """Compute one generation candidate by candidate. Every trial is made
+        from the population including the replacements of the previous
+        candidates of the generation.
+        """
+        for candidate in range(self.npop):
+            #print "candidate:",candidate
+            trial = self.get_trial(candidate)
+            #print "candidate trial:", str(trial)
+            ## apply boundary function
+            if self.bound:
+                trial = self.bound(candidate,trial)
+                ## check if we have abortet that trial
+                if trial is None:
+                    print ".",
+                    continue
+            trial_value = self.evaluate([trial])[0]
+            #print "current trial value:", trial_value
+            if trial_value < self.pop_values[candidate]:
+                #print "new personal best for candidate", candidate
+                self.population[candidate] = trial
+                self.pop_values[candidate] = trial_value
+                if trial_value < self.best_value:
+                    #print "New Personal Best for candidate", candidate
+                    self.best_vector = trial
+                    self.best_value = trial_value
+
+    def solve(self, newgens=100, vectorized=False):
         """Run for newgens more generations.
 
+        Every generation is computed by evolve_sequential(), or with
+        vectorized by evolve_generation().
         Return best parameter vector from the entire run.
         """
         for gen in xrange(self.generations+1, self.generations+newgens+1):
             #print "gen:",gen, "of", newgens
-            for candidate in range(self.npop):
-                #print "candidate:",candidate
-                trial = self.get_trial(candidate)
-                #print "candidate trial:", str(trial)
-                ## apply boundary function
-                if self.bound:
-                    trial = self.bound(candidate,trial)
-                    ## check if we have abortet that trial
-                    if trial == None:
-                        print ".",
-                        continue
-                trial_value = self.func(trial, *self.args)
-                #print "current trial value:", trial_value
-                if trial_value < self.pop_values[candidate]:
-                    #print "new personal best for candidate", candidate
-                    self.population[candidate] = trial
-                    self.pop_values[candidate] = trial_value
-                    if trial_value < self.best_value:
-                        #print "New Personal Best for candidate", candidate
-                        self.best_vector = trial
-                        self.best_value = trial_value
+            if vectorized:
+                self.evolve_generation()
+            else:
+                self.evolve_sequential()
             self.best_val_history.append(self.best_value)
             self.best_vec_history.append(self.best_vector)
+            self.generations = gen
+            self.auto_checkpoint()
             if self.converged():
                 #print "Generation Converged"
                 break
-        self.generations = gen
         #print "Done solving"
         return self.best_vector
+
+    def count_trial(self):
+        """Count a finished (or rejected) trial of solve_async(). Every npop
+        trials make a generation-equivalent, which is added to the history.
+        Return True if the population has converged at its end.
+        """
+        self.trial_count += 1
+        if self.trial_count < self.npop:
+            return False
+        self.trial_count = 0
+        self.generations += 1
+        self.best_val_history.append(self.best_value)
+        self.best_vec_history.append(self.best_vector)
+        self.auto_checkpoint()
+        return self.converged()
+
+    def issue_trial(self):
+        """Start the trial of the next candidate that is not being evaluated.
+        Return True if a rejected trial ended a converged generation.
+        """
+        for i in xrange(self.npop):
+            candidate = (self.next_candidate + i) % self.npop
+            if candidate not in self.pending:
+                break
+        self.next_candidate = (candidate + 1) % self.npop
+        trials, valid = self.bound_trials([candidate],
+                                          self.get_trials([candidate]))
+        if not valid[0]:
+            return self.count_trial()
+        if self.cache is not None:
+            value = self.cache.lookup(trials[0])
+            if value is not None:
+                self.select([candidate], trials, [value])
+                return self.count_trial()
+        self.pending[candidate] = trials[0]
+        self.evaluator.submit(self.func, trials[0], self.args, candidate)
+        return False
+
+    def collect_trial(self, count=True):
+        """Wait for the next finished trial and select it.
+        """
+        candidate, value = self.evaluator.next_result()
+        trial = self.pending.pop(candidate)
+        if self.cache is not None:
+            self.cache.put(trial, value)
+        self.select([candidate], [trial], [value])
+        if count:
+            return self.count_trial()
+        return False
+
+    def solve_async(self, newgens=100, inflight=None):
+        """Run for newgens more generation-equivalents without a barrier
+        between the generations.
+
+        inflight (default and maximum: npop) trials are evaluated at the same
+        time, each candidate has at most one. When a trial finishes it
+        replaces its candidate if it is better, and the trial of the next
+        free candidate is started from the current population. With a pool
+        evaluator the result depends on the order the trials finish in.
+        Return best parameter vector from the entire run.
+        """
+        if inflight is None:
+            inflight = self.npop
+        inflight = max(1, min(inflight, self.npop))
+        lastgen = self.generations + newgens
+        converged = False
+        try:
+            while self.generations < lastgen and not converged:
+                # Do not start trials beyond the last generation-equivalent.
+                remaining = ((lastgen - self.generations) * self.npop -
+                             self.trial_count - len(self.pending))
+                if len(self.pending) < min(inflight, remaining):
+                    converged = self.issue_trial()
+                else:
+                    converged = self.collect_trial()
+            # After convergence the trials still running are selected, but
+            # not counted.
+            while self.pending:
+                self.collect_trial(count=False)
+        finally:
+            # Interrupted by an exception: the results of the trials still
+            # running must not be taken for later trials of their candidates.
+            if self.pending:
+                self.pending.clear()
+                self.evaluator.cancel()
+        return self.best_vector
@@ -15,19 +15,158 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys, os.path, getopt
+import sys, os, os.path, getopt
+import hashlib
+import collections
+import multiprocessing
+import Queue
 import numpy
+import numpy.lib.stride_tricks
 import tables
 import spice_read
+import spice_catalog
+import spice_hdf5
+import spice_npy
+import spice_pyramid
 
 VERSION="0.0.2"
 AUTHOR='Werner Hoch <werner.ho@gmx.de>'
 
+## number of table rows appended at once
+TABLE_CHUNK_ROWS = 65536
+
+## block size for hashing the raw files
+HASH_BLOCKSIZE = 1 << 20
+
+## chunk size presets (in points) of the layouts:
+##   plain: contiguous arrays, default table chunks, no compression
+##   timeslice: small chunks, for reading short time windows of many vectors
+##   vector: large chunks, for reading whole vectors
+LAYOUTS = {'plain': None, 'timeslice': 4096, 'vector': 262144}
+
+def make_filters(complib="zlib", complevel=0):
+    """
+    Return the PyTables compression filters or None for no compression.
+    complib is one of the libraries supported by PyTables, e.g. "zlib",
+    "lzo", "bzip2" or "blosc".
+    """
+    if complevel <= 0:
+        return None
+    return tables.Filters(complevel=complevel, complib=complib, shuffle=True)
+
+def set_layout_attributes(node, layout, filters):
+    ## record the storage layout in the node attributes
+    node._v_attrs.layout = layout
+    if filters is None:
+        node._v_attrs.complib = "none"
+        node._v_attrs.complevel = 0
+    else:
+        node._v_attrs.complib = filters.complib
+        node._v_attrs.complevel = filters.complevel
+    if getattr(node, "chunkshape", None):
+        node._v_attrs.chunkshape = node.chunkshape[0]
+
+def set_plot_attributes(node, names, types, vector_dimensions, title="",
+                        date="", plotname="", dimensions=[]):
+    ## record the plot header, spice_hdf5 rebuilds the spice_plot from it
+    node._v_attrs.title = title
+    node._v_attrs.date = date
+    node._v_attrs.plotname = plotname
+    node._v_attrs.dimensions = list(dimensions)
+    node._v_attrs.names = list(names)
+    node._v_attrs.types = list(types)
+    node._v_attrs.vector_dimensions = [list(d) for d in vector_dimensions]
+
+def plot_attributes(plot):
+    ## arguments of set_plot_attributes() for a spice_plot
+    vectors = [plot.get_scalevector()] + plot.get_datavectors()
+    return dict(names=[str(v.name) for v in vectors],
+                types=[str(v.type) for v in vectors],
+                vector_dimensions=[v.dimensions for v in vectors],
+                title=plot.title, date=plot.date, plotname=plot.plotname,
+                dimensions=plot.dimensions)
+
+def create_vector_array(h5file, node, name, data, layout, filters,
+                        chunkshape):
+    """
+    Store a single vector as Array (no chunk size and no compression)
+    or as chunked CArray.
+    """
+    if (chunkshape is None and filters is None) or len(data) == 0:
+        array = h5file.createArray(node, name, data)
+    else:
+        if chunkshape is not None:
+            chunkshape = (min(chunkshape, len(data)),)
+        array = h5file.createCArray(node, name,
+                                    tables.Atom.from_dtype(data.dtype),
+                                    data.shape, filters=filters,
+                                    chunkshape=chunkshape)
+        array[:] = data
+    set_layout_attributes(array, layout, filters)
+    return array
+
+def plot_records(plot):
+    """
+    Return the vectors of a plot as numpy structured array with one field
+    for each vector, the scale first.
+    If the vectors are the consecutive float64 columns of a single data
+    block (the common case for real plots from spice_read), the structured
+    array is a view of that block and no data is copied.
+    """
+    vectors = [plot.get_scalevector()] + plot.get_datavectors()
+    arrays = [v.get_data() for v in vectors]
+    fields = [(str(vectors[0].name), numpy.float64)]
+    for v, a in zip(vectors[1:], arrays[1:]):
+        if a.dtype not in (numpy.float64, numpy.complex128):
+            raise TypeError("vector type %s not supported yet" %(a.dtype))
+        fields.append((str(v.name), a.dtype))
+    dtype = numpy.dtype(fields)
+
+    ## check whether the vectors are the columns of one row major block
+    rowsize = 8*len(arrays)
+    first = arrays[0].__array_interface__["data"][0]
+    is_block = True
+    for i, a in enumerate(arrays):
+        if a.dtype != numpy.float64 or a.strides != (rowsize,) or \
+           len(a) != len(arrays[0]) or \
+           a.__array_interface__["data"][0] != first + 8*i:
+            is_block = False
+            break
+    if is_block and len(arrays[0]) > 0:
+        block = numpy.lib.stride_tricks.as_strided(
+            arrays[0], shape=(len(arrays[0]), len(arrays)),
+            strides=(rowsize, 8))
+        return block.view(dtype)[:,0]
+
+    records = numpy.empty(len(arrays[0]), dtype=dtype)
+    for v, a in zip(vectors, arrays):
+        records[str(v.name)] = a.real if v is vectors[0] else a
+    return records
+
 def insert_spiceplot(plot, outfile="out.hdf5", path="/", name="plot",
-                     filemode="a", overwrite=True, format='table'):
+                     filemode="a", overwrite=True, format='table',
+                     layout='plain', complib='zlib', complevel=0,
+                     chunkshape=None, pyramid=False, catalog=True):
+    """
+    Store a spice plot in the HDF5 file outfile at path/name.
+    The file is opened and closed again, see write_spiceplot() for the
+    other arguments.
+    """
     ## open the hdf5-file
     h5file = tables.openFile(outfile, mode=filemode, title = "ngspice plots")
+    write_spiceplot(h5file, plot, path, name, overwrite=overwrite,
+                    format=format, layout=layout, complib=complib,
+                    complevel=complevel, chunkshape=chunkshape,
+                    pyramid=pyramid, catalog=catalog)
+    spice_catalog.reindex(h5file)
+    h5file.flush()
+    h5file.close()
 
+def prepare_node(h5file, path, name, overwrite=True):
+    """
+    Create the groups of path and remove an existing node path/name if
+    overwrite is True. Returns the node path or None if the node exists.
+    """
     ## create the path group
     path_toks = path[1:].split("/")
     last_path = "/"
@@ -36,52 +175,555 @@ def insert_spiceplot(plot, outfile="out.hdf5", path="/", name="plot",
         if test_path not in h5file:
             h5file.createGroup(last_path, path_toks[i])
         last_path = test_path
+    node_path = path.rstrip("/") + "/" + name
 
     ## check if the path / table is already there
-    if path + "/" +  name in h5file:
+    if node_path in h5file:
         if overwrite:
             h5file.removeNode(path, name, recursive=True)
-            h5file.flush()
+            spice_catalog.remove_plot(h5file, node_path)
         else:
             print "Error: path already exists: [%s, %s]" %(path,name)
-            return
+            return None
+    ## the pyramids of the old plot
+    if overwrite and node_path + spice_pyramid.PYRAMID_SUFFIX in h5file:
+        h5file.removeNode(path, name + spice_pyramid.PYRAMID_SUFFIX,
+                          recursive=True)
+    return node_path
+
+def write_pyramids(h5file, path, name, scale, vectors,
+                   factor=spice_pyramid.PYRAMID_FACTOR,
+                   min_bins=spice_pyramid.PYRAMID_MIN_BINS):
+    """
+    Compute and store the min/max pyramids of the plot path/name in the
+    group path/name_pyramid. The group has a subgroup level_k for each
+    level with the bin start values (scale) and a (bins, 2) min/max array
+    for each vector. vectors is an iterable of (name, data) tuples, the
+    vectors are processed one after another.
+    """
+    scales = spice_pyramid.scale_levels(scale, factor, min_bins)
+    group = h5file.createGroup(path, name + spice_pyramid.PYRAMID_SUFFIX)
+    group._v_attrs.pyramid_factor = factor
+    group._v_attrs.pyramid_levels = len(scales)
+    levels = []
+    for k, s in enumerate(scales):
+        levels.append(h5file.createGroup(group, "level_%i" %(k+1)))
+        h5file.createArray(levels[-1], "scale", s)
+    for vname, data in vectors:
+        pyramid = spice_pyramid.minmax_pyramid.from_data(scale, data, factor,
+                                                         min_bins, scales)
+        for level, (s, minmax) in zip(levels, pyramid.levels):
+            h5file.createArray(level, str(vname), minmax)
+
+class pyramid_writer(object):
+    """
+    Store the min/max pyramids of a plot that is written in chunks, in the
+    layout of write_pyramids(). The levels are appended to EArrays while
+    the chunks arrive, only a few bins per level are kept in memory.
+    names are the names of the scale and the data vectors.
+    """
+
+    def __init__(self, h5file, path, name, names,
+                 factor=spice_pyramid.PYRAMID_FACTOR,
+                 min_bins=spice_pyramid.PYRAMID_MIN_BINS):
+        self.h5file = h5file
+        self.group = h5file.createGroup(path,
+                                        name + spice_pyramid.PYRAMID_SUFFIX)
+        self.group._v_attrs.pyramid_factor = factor
+        self.group._v_attrs.pyramid_levels = 0
+        self.builders = [spice_pyramid.level_builder(
+            spice_pyramid.reduce_first, self.storer("scale", ()),
+            factor, min_bins)]
+        for vname in names[1:]:
+            self.builders.append(spice_pyramid.level_builder(
+                spice_pyramid.reduce_minmax, self.storer(str(vname), (2,)),
+                factor, min_bins))
+
+    def level_group(self, k):
+        ## the groups of the levels are created in order
+        for i in xrange(1, k+1):
+            if "level_%i" %(i) not in self.group:
+                self.h5file.createGroup(self.group, "level_%i" %(i))
+        return getattr(self.group, "level_%i" %(k))
+
+    def storer(self, aname, shape):
+        def store(k, rows):
+            level = self.level_group(k)
+            if aname not in level:
+                self.h5file.createEArray(level, aname, tables.Float64Atom(),
+                                         (0,) + shape)
+            getattr(level, aname).append(rows)
+        return store
+
+    def append(self, chunk):
+        """
+        Add a (n, nvars) chunk of the plot data
+        """
+        self.builders[0].add(0, numpy.ascontiguousarray(chunk[:,0].real))
+        for j, builder in enumerate(self.builders[1:]):
+            builder.add(0, spice_pyramid.minmax_rows(chunk[:,j+1]))
+
+    def close(self):
+        """
+        Store the last bins and the number of levels
+        """
+        nlevels = [b.finish() for b in self.builders]
+        self.group._v_attrs.pyramid_levels = nlevels[0]
+
+def write_spiceplot(h5file, plot, path="/", name="plot", overwrite=True,
+                    format='table', layout='plain', complib='zlib',
+                    complevel=0, chunkshape=None, pyramid=False,
+                    catalog=True):
+    """
+    Store a spice plot in the open HDF5 file h5file at path/name.
+    format is 'table' (one table row per point) or 'vectors' (one array
+    per vector). layout is one of LAYOUTS and selects the chunk size
+    (in points) of the data, chunkshape overrides the chunk size of the
+    layout. complib and complevel select the compression. The layout
+    choice is recorded in the node attributes. With pyramid the min/max
+    pyramids of the vectors are stored as well (see write_pyramids()).
+    With catalog the plot is added to the catalog tables (see
+    spice_catalog).
+    Returns False if the plot could not be stored.
+    """
+    if catalog:
+        try:
+            spice_catalog.check_value(spice_catalog.catalog_plot, "path",
+                                      path.rstrip("/") + "/" + name)
+        except ValueError, err:
+            print "Error: %s" %(err)
+            return False
+    node_path = prepare_node(h5file, path, name, overwrite)
+    if node_path is None:
+        return False
 
     scale = plot.get_scalevector()
     data = plot.get_datavectors()
+    filters = make_filters(complib, complevel)
+    if chunkshape is None:
+        chunkshape = LAYOUTS[layout]
 
     if format == 'table':
-        ## create the row description
-        d_cols = {scale.name : tables.Float64Col(pos=0)}
-        for i,v in enumerate(data):
-            if v.get_data().dtype == numpy.float64:
-                d_cols[v.name] = tables.Float64Col(pos=i+1)
-            elif v.get_data().dtype == numpy.complex128:
-                d_cols[v.name] = tables.ComplexCol(pos=i+1, itemsize=16)
-            else:
-                print "vector type " , v.get_data().dtype , "not supported yet"
-                return
+        ## the structured array describes the rows of the table
+        try:
+            records = plot_records(plot)
+        except TypeError, err:
+            print str(err)
+            return False
                 
-        ## create a table and add all data
-        table = h5file.createTable(path, name, d_cols)
-        row = table.row
-        for i,s in enumerate(scale.get_data()):
-            row[scale.name] = s
-            for d in data:
-                row[d.name] = d.get_data()[i]
-            row.append()
+        ## create a table and append the data in large blocks
+        if chunkshape is not None:
+            chunkshape = (chunkshape,)
+        table = h5file.createTable(path, name, records.dtype,
+                                   filters=filters, chunkshape=chunkshape,
+                                   expectedrows=len(records))
+        for start in xrange(0, len(records), TABLE_CHUNK_ROWS):
+            table.append(records[start:start+TABLE_CHUNK_ROWS])
+        set_layout_attributes(table, layout, filters)
+        set_plot_attributes(table, **plot_attributes(plot))
 
     else: # format == vectors
         ## add all data vectors as Arrays, remove it's
         node = h5file.createGroup(path, name)
-        h5file.createArray(node, scale.name, scale.get_data())
+        set_layout_attributes(node, layout, filters)
+        set_plot_attributes(node, **plot_attributes(plot))
+        create_vector_array(h5file, node, scale.name, scale.get_data(),
+                            layout, filters, chunkshape)
         for d in data:
-            if path + "/" + name + "/" + d.name in h5file:
+            if node_path + "/" + d.name in h5file:
                 print "Error: data name is not uniq: [%s]" %(d.name)
-                return
-            h5file.createArray(node, d.name, d.get_data())
-    
-    h5file.flush()
-    h5file.close()
+                return False
+            create_vector_array(h5file, node, d.name, d.get_data(),
+                                layout, filters, chunkshape)
+    if pyramid:
+        write_pyramids(h5file, path, name, scale.get_data(),
+                       [(d.name, d.get_data()) for d in data])
+    if catalog:
+        spice_catalog.add_plot(h5file, node_path, plot)
+    return True
+
+def stream_spicefile(h5file, infile, pathprefix="/spiceplot",
+                     multiple_files=False, chunksize=65536, overwrite=True,
+                     format='table', layout='plain', complib='zlib',
+                     complevel=0, chunkshape=None, pyramid=False,
+                     catalog=True):
+    """
+    Convert all plots of the raw file infile into the open HDF5 file
+    without loading a whole plot. The data block is read in chunks of
+    chunksize points which are appended to a table or to one EArray per
+    vector, the memory usage does not depend on the number of points.
+    The pyramids are built from the same chunks (see pyramid_writer).
+    The other arguments are the same as for write_spiceplot().
+    Returns the number of converted plots.
+    """
+    reader = spice_read.spice_read(infile, lazy=True)
+    index = reader.get_index()
+    locations = plot_locations(infile, len(index), pathprefix,
+                               multiple_files)
+    filters = make_filters(complib, complevel)
+    if chunkshape is None:
+        chunkshape = LAYOUTS[layout]
+    if chunkshape is not None:
+        chunkshape = (chunkshape,)
+
+    for n, (info, (path, name)) in enumerate(zip(index, locations)):
+        node_path = prepare_node(h5file, path, name, overwrite)
+        if node_path is None:
+            continue
+        names = [str(v[1]) for v in info["variables"]]
+        if info["real"]:
+            vtype = numpy.float64
+        else:
+            vtype = numpy.complex128
+        dtype = numpy.dtype([(names[0], numpy.float64)] +
+                            [(v, vtype) for v in names[1:]])
+        if format == 'table':
+            node = h5file.createTable(path, name, dtype, filters=filters,
+                                      chunkshape=chunkshape,
+                                      expectedrows=max(info["npoints"], 1))
+        else: # format == vectors
+            node = h5file.createGroup(path, name)
+            arrays = []
+            for v in names:
+                arrays.append(h5file.createEArray(
+                    node, v, tables.Atom.from_dtype(dtype[v]), (0,),
+                    filters=filters, expectedrows=max(info["npoints"], 1),
+                    chunkshape=chunkshape))
+                set_layout_attributes(arrays[-1], layout, filters)
+        set_layout_attributes(node, layout, filters)
+        if pyramid:
+            pyramids = pyramid_writer(h5file, path, name, names)
+        set_plot_attributes(node, names,
+                            [str(v[2]) for v in info["variables"]],
+                            [list(v[3]) for v in info["variables"]],
+                            str(info["title"]), str(info["date"]),
+                            str(info["plotname"]), info["dimensions"])
+
+        for chunk in reader.iter_chunks(n, chunksize):
+            if format == 'table':
+                if info["real"]:
+                    records = numpy.ascontiguousarray(chunk).view(dtype)[:,0]
+                else:
+                    records = numpy.empty(len(chunk), dtype=dtype)
+                    records[names[0]] = chunk[:,0].real
+                    for j, v in enumerate(names[1:]):
+                        records[v] = chunk[:,j+1]
+                node.append(records)
+            else:
+                arrays[0].append(chunk[:,0].real)
+                for j, array in enumerate(arrays[1:]):
+                    array.append(chunk[:,j+1])
+            if pyramid:
+                pyramids.append(chunk)
+        if pyramid:
+            pyramids.close()
+        if catalog:
+            ## the measures are taken from the stored data
+            spice_catalog.add_plot(h5file, node_path,
+                                   spice_hdf5.node_plot(node))
+        h5file.flush()
+    spice_catalog.reindex(h5file)
+    return len(index)
+
+def plot_locations(infile, nplots, pathprefix="/spiceplot",
+                   multiple_files=False):
+    """
+    Return the list of (path, name) locations of the plots of a file.
+    With multiple input files the file name is added to the path, with
+    multiple plots the plots are named plot_0, plot_1, ...
+    """
+    path = pathprefix
+    if multiple_files:
+        ## need to add the filename as path
+        path = path + '/' + os.path.basename(infile)
+
+    if nplots > 1:
+        ## need to add a plot number to the path
+        return [(path, "plot_%i"%i) for i in xrange(nplots)]
+    toks = path.split('/')
+    if len(toks) == 2:
+        path = '/'
+    else:
+        path = '/'.join(toks[:-1])
+    return [(path, toks[-1])]
+
+def file_fingerprint(filename):
+    """
+    Return a dictionary with the size, the modification time and the sha1
+    hash of the content of a file.
+    """
+    st = os.stat(filename)
+    sha1 = hashlib.sha1()
+    f = open(filename, "rb")
+    try:
+        while True:
+            block = f.read(HASH_BLOCKSIZE)
+            if not block:
+                break
+            sha1.update(block)
+    finally:
+        f.close()
+    return dict(size=st.st_size, mtime=st.st_mtime, sha1=sha1.hexdigest())
+
+class conversion_cache(object):
+    """
+    Record the fingerprint of the converted raw files in the attributes of
+    their plot nodes and find the files that are already converted.
+    A file is unchanged if its size and modification time are the same,
+    or if only the modification time changed but the content hash is the
+    same. options is a string of the store options, plots stored with
+    other options are converted again.
+    The counters hits and misses count the results of lookup().
+    """
+
+    def __init__(self, h5file, pathprefix="/spiceplot", multiple_files=False,
+                 options=""):
+        self.h5file = h5file
+        self.pathprefix = pathprefix
+        self.multiple_files = multiple_files
+        self.options = options
+        self.hits = 0
+        self.misses = 0
+
+    def find_nodes(self, infile):
+        """
+        Return the plot nodes of a converted file or an empty list.
+        The number of plots is taken from the first plot node.
+        """
+        for nplots in (1, 2):
+            path, name = plot_locations(infile, nplots, self.pathprefix,
+                                        self.multiple_files)[0]
+            node_path = path.rstrip("/") + "/" + name
+            if node_path not in self.h5file:
+                continue
+            attrs = self.h5file.getNode(node_path)._v_attrs
+            if "source_nplots" not in attrs or \
+               (attrs.source_nplots == 1) != (nplots == 1):
+                continue
+            nodes = []
+            for path, name in plot_locations(infile, attrs.source_nplots,
+                                             self.pathprefix,
+                                             self.multiple_files):
+                node_path = path.rstrip("/") + "/" + name
+                if node_path not in self.h5file:
+                    return []
+                nodes.append(self.h5file.getNode(node_path))
+            return nodes
+        return []
+
+    def lookup(self, infile):
+        """
+        Return True if the file is converted and unchanged.
+        """
+        nodes = self.find_nodes(infile)
+        st = os.stat(infile)
+        attrs = [n._v_attrs for n in nodes]
+        current = len(nodes) > 0
+        for a in attrs:
+            if a.source_size != st.st_size or \
+               getattr(a, "source_options", "") != self.options:
+                current = False
+        if current and [a for a in attrs if a.source_mtime != st.st_mtime]:
+            ## touched but maybe not modified, compare the content
+            fingerprint = file_fingerprint(infile)
+            for a in attrs:
+                if a.source_sha1 != fingerprint["sha1"]:
+                    current = False
+            if current:
+                for a in attrs:
+                    a.source_mtime = fingerprint["mtime"]
+        if current:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return current
+
+    def store(self, infile, nplots, fingerprint=None):
+        """
+        Record the fingerprint (default: computed from infile) in the
+        nplots plot nodes of the file.
+        """
+        if fingerprint is None:
+            fingerprint = file_fingerprint(infile)
+        for path, name in plot_locations(infile, nplots, self.pathprefix,
+                                         self.multiple_files):
+            attrs = self.h5file.getNode(path.rstrip("/") + "/" + name)._v_attrs
+            attrs.source_file = os.path.abspath(infile)
+            attrs.source_size = fingerprint["size"]
+            attrs.source_mtime = fingerprint["mtime"]
+            attrs.source_sha1 = fingerprint["sha1"]
+            attrs.source_nplots = nplots
+            attrs.source_options = self.options
+
+def options_key(store_options):
+    ## string of the store options, part of the conversion fingerprint
+    return repr(sorted(store_options.items()))
+
+def parse_worker(tasks, results):
+    """
+    Worker process of convert_batch(): parse the raw files from the tasks
+    queue and put (infile, plots, fingerprint, error) into the results
+    queue.
+    """
+    while True:
+        infile = tasks.get()
+        if infile is None:
+            return
+        try:
+            fingerprint = file_fingerprint(infile)
+            plots = spice_read.spice_read(infile, compact=True).get_plots()
+            if len(plots) == 0:
+                results.put((infile, [], None, "no plots found"))
+            else:
+                results.put((infile, plots, fingerprint, None))
+        except Exception, err:
+            results.put((infile, [], None,
+                         "%s: %s" %(err.__class__.__name__, err)))
+
+def convert_batch(infiles, outfile="out.hdf5", pathprefix="/spiceplot",
+                  processes=None, queue_size=16, flush_plots=64,
+                  verbose=False, cache=True, stats=None, poll_interval=1.0,
+                  **store_options):
+    """
+    Convert many raw files into one HDF5 file.
+    The files are parsed by a pool of processes (default: one per CPU).
+    The plots are passed through a queue of at most queue_size files to
+    the calling process, which writes them in a single HDF5 session and
+    flushes the file every flush_plots plots. store_options are passed
+    to write_spiceplot().
+    With cache files that are already converted and unchanged are skipped
+    (see conversion_cache), the hit and miss counts are stored in the
+    dictionary stats if given.
+    The results queue is polled every poll_interval seconds. Files that
+    were not returned when all workers have exited, e.g. because a worker
+    was killed, are recorded as errors.
+    Returns a list of (infile, error message) of the failed files.
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    errors = []
+    workers = []
+    h5file = tables.openFile(outfile, mode="a", title = "ngspice plots")
+    try:
+        converter = conversion_cache(h5file, pathprefix, len(infiles) > 1,
+                                     options_key(store_options))
+        todo = []
+        for infile in infiles:
+            if not (cache and os.path.exists(infile) and
+                    converter.lookup(infile)):
+                todo.append(infile)
+        if stats is not None:
+            stats["hits"] = len(infiles) - len(todo)
+            stats["misses"] = len(todo)
+
+        tasks = multiprocessing.Queue()
+        for infile in todo:
+            tasks.put(infile)
+        for i in xrange(processes):
+            tasks.put(None)
+        results = multiprocessing.Queue(queue_size)
+        workers = [multiprocessing.Process(target=parse_worker,
+                                           args=(tasks, results))
+                   for i in xrange(processes)]
+        for w in workers:
+            w.start()
+
+        unflushed = 0
+        pending = collections.Counter(todo)
+        n = 0
+        while n < len(todo):
+            ## a worker that exits has flushed its results into the queue,
+            ## so nothing more arrives if the queue is empty afterwards
+            stopped = not [w for w in workers if w.is_alive()]
+            try:
+                result = results.get(timeout=poll_interval)
+            except Queue.Empty:
+                if stopped:
+                    break
+                continue
+            infile, plots, fingerprint, error = result
+            pending[infile] -= 1
+            n += 1
+            if error is None:
+                locations = plot_locations(infile, len(plots), pathprefix,
+                                           len(infiles) > 1)
+                for (path, name), plot in zip(locations, plots):
+                    if not write_spiceplot(h5file, plot, path, name,
+                                           **store_options):
+                        error = "could not store %s/%s" %(path, name)
+                    unflushed += 1
+                if error is None:
+                    converter.store(infile, len(plots), fingerprint)
+                if unflushed >= flush_plots:
+                    h5file.flush()
+                    unflushed = 0
+            if error is not None:
+                errors.append((infile, error))
+            if verbose:
+                print "%i/%i %s %s" %(n, len(todo), infile,
+                                      error or "")
+        if n < len(todo):
+            codes = sorted(set([w.exitcode for w in workers if w.exitcode]))
+            error = "lost, worker exit codes %s" %(codes)
+            for infile in todo:
+                if pending[infile] > 0:
+                    pending[infile] -= 1
+                    errors.append((infile, error))
+                    if verbose:
+                        print "%s %s" %(infile, error)
+        spice_catalog.reindex(h5file)
+        h5file.flush()
+    finally:
+        h5file.close()
+        for w in workers:
+            w.terminate()
+            w.join()
+    return errors
+
+def npy_worker(task):
+    """
+    Worker function of convert_npy(): write the plots of a raw file as
+    .npy directories. Returns (infile, error message or None).
+    """
+    infile, outdir, pathprefix, multiple_files = task
+    try:
+        nplots = len(spice_read.spice_read(infile, lazy=True).get_index())
+        if nplots == 0:
+            return infile, "no plots found"
+        locations = plot_locations(infile, nplots, pathprefix,
+                                   multiple_files)
+        spice_npy.write_npyfile(infile,
+                                spice_npy.plot_directories(outdir, locations))
+    except Exception, err:
+        return infile, "%s: %s" %(err.__class__.__name__, err)
+    return infile, None
+
+def convert_npy(infiles, outdir="out.npy", pathprefix="/spiceplot",
+                processes=1, verbose=False):
+    """
+    Convert raw files into .npy directories with a JSON manifest below
+    outdir (see spice_npy). The plot directories follow the HDF5 node
+    paths of plot_locations(). Every file is written by a single process,
+    processes > 1 converts several files at once.
+    Returns a list of (infile, error message) of the failed files.
+    """
+    tasks = [(infile, outdir, pathprefix, len(infiles) > 1)
+             for infile in infiles]
+    if processes == 1:
+        results = map(npy_worker, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(npy_worker, tasks)
+        finally:
+            pool.terminate()
+    errors = []
+    for infile, error in results:
+        if error is not None:
+            errors.append((infile, error))
+        if verbose:
+            print "%s %s" %(infile, error or "")
+    return errors
 
 
 def usage():
@@ -89,77 +731,163 @@ def usage():
     print "usage: " +  sys.argv[0] + """ [options], spicefile, [spicefile2, ..]
   -h --help: print help information
   -v --verbose: print debug messages to stdout
-  -o --outfile: specify the hdf5 output filename (default: out.hdf5)
+  -o --outfile: specify the hdf5 output filename (default: out.hdf5),
+               the output directory with format npy (default: out.npy)
   -p --pathprefix: location to store the spice data
-  -f --format: whether to store the data as single vectors or table
-               (default: table)"""
+  -f --format: whether to store the data as single vectors or table,
+               or as .npy directories with a manifest: npy
+               (default: table)
+  -l --layout: storage layout: plain, timeslice (small chunks for time
+               windows) or vector (large chunks for whole vectors)
+               (default: plain)
+  -k --chunkshape: chunk size in points, overrides the layout preset
+  -c --complib: compression library, e.g. zlib, lzo, bzip2, blosc
+               (default: zlib)
+  -z --complevel: compression level 0..9 (default: 0, no compression)
+  -j --jobs: batch mode, parse the files with this number of processes
+               and write all plots in a single HDF5 session
+  -s --stream: convert the data in chunks with bounded memory usage
+               (not combined with --jobs)
+  -m --pyramid: store min/max pyramids of the vectors for fast plotting
+  -F --force: convert all files, also the unchanged files that are
+               already stored with the same options"""
     
 
 
 #################### MAIN
 
-## default options and options dictionary
-options = dict(verbose=False,
-               format="table",
-               outfile="out.hdf5",
-               pathprefix="/spiceplot")
-
-FORMAT_OPTIONS = ['table', 'vectors']
-
-## getopt parsing
-try:
-    opts, args = getopt.getopt(sys.argv[1:], "hvo:p:f:",
-                               ["help", "verbose","outfile=", "pathprefix=",
-                                "format="])
-except getopt.GetoptError, err:
-    print str(err)
-    usage()
-    sys.exit(2)
-
-if len(args) == 0:
-    usage()
-    sys.exit(2)
-
-## examine the parsed output
-for k,v  in opts:
-    if k in ('-h','--help'):
+if __name__ == "__main__":
+    ## default options and options dictionary
+    options = dict(verbose=False,
+                   format="table",
+                   outfile=None,
+                   pathprefix="/spiceplot",
+                   layout="plain",
+                   chunkshape=None,
+                   complib="zlib",
+                   complevel=0,
+                   jobs=None,
+                   stream=False,
+                   force=False,
+                   pyramid=False)
+
+    FORMAT_OPTIONS = ['table', 'vectors', 'npy']
+
+    ## getopt parsing
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hvo:p:f:l:k:c:z:j:smF",
+                                   ["help", "verbose","outfile=", "pathprefix=",
+                                    "format=", "layout=", "chunkshape=",
+                                    "complib=", "complevel=", "jobs=",
+                                    "stream", "pyramid", "force"])
+    except getopt.GetoptError, err:
+        print str(err)
         usage()
-        sys.exit(0)
-    elif k in ('-v', '--verbose'):
-        options['verbose'] = True
-    elif k in ('-o', '--outfile'):
-        options['outfile'] = v
-    elif k in ('-p', '--pathprefix'):
-        options['pathprefix'] = v
-    elif k in ('-f', '--format'):
-        if v not in FORMAT_OPTIONS:
+        sys.exit(2)
+
+    if len(args) == 0:
+        usage()
+        sys.exit(2)
+
+    ## examine the parsed output
+    for k,v  in opts:
+        if k in ('-h','--help'):
             usage()
-            sys.exit(2)
-        options['format'] = v
-
-## now execute the commands
-args.sort()
-for infile in args:
-    filename = os.path.basename(infile)
-    plots = spice_read.spice_read(infile).get_plots()
-    path = options['pathprefix']
-    if len(args) > 1:
-        ## need to add the filename as path
-        path = path + '/' + filename
+            sys.exit(0)
+        elif k in ('-v', '--verbose'):
+            options['verbose'] = True
+        elif k in ('-o', '--outfile'):
+            options['outfile'] = v
+        elif k in ('-p', '--pathprefix'):
+            options['pathprefix'] = v
+        elif k in ('-f', '--format'):
+            if v not in FORMAT_OPTIONS:
+                usage()
+                sys.exit(2)
+            options['format'] = v
+        elif k in ('-l', '--layout'):
+            if v not in LAYOUTS:
+                usage()
+                sys.exit(2)
+            options['layout'] = v
+        elif k in ('-k', '--chunkshape'):
+            options['chunkshape'] = int(v)
+        elif k in ('-c', '--complib'):
+            options['complib'] = v
+        elif k in ('-z', '--complevel'):
+            options['complevel'] = int(v)
+        elif k in ('-j', '--jobs'):
+            options['jobs'] = int(v)
+        elif k in ('-s', '--stream'):
+            options['stream'] = True
+        elif k in ('-m', '--pyramid'):
+            options['pyramid'] = True
+        elif k in ('-F', '--force'):
+            options['force'] = True
 
-    if len(plots) > 1:
-        ## need to add a plot number to the path
-        for i, p in enumerate(plots):
-            insert_spiceplot(p, path=path, name="plot_%i"%i,
-                             outfile=options['outfile'], format=options['format'])
-    else:
-        toks = path.split('/')
-        if len(toks) == 2:
-            path = '/'
+    store_options = dict(format=options['format'],
+                         layout=options['layout'],
+                         chunkshape=options['chunkshape'],
+                         complib=options['complib'],
+                         complevel=options['complevel'],
+                         pyramid=options['pyramid'])
+
+    ## now execute the commands
+    args.sort()
+    if options['format'] == 'npy':
+        errors = convert_npy(args, outdir=options['outfile'] or "out.npy",
+                             pathprefix=options['pathprefix'],
+                             processes=options['jobs'] or 1,
+                             verbose=options['verbose'])
+        for infile, error in errors:
+            print "Error: %s: %s" %(infile, error)
+        if errors:
+            sys.exit(1)
+        sys.exit(0)
+
+    if options['outfile'] is None:
+        options['outfile'] = "out.hdf5"
+    if options['jobs'] is not None and not options['stream']:
+        stats = {}
+        errors = convert_batch(args, outfile=options['outfile'],
+                               pathprefix=options['pathprefix'],
+                               processes=options['jobs'],
+                               verbose=options['verbose'],
+                               cache=not options['force'], stats=stats,
+                               **store_options)
+        print "%i unchanged, %i converted" %(stats["hits"], stats["misses"])
+        for infile, error in errors:
+            print "Error: %s: %s" %(infile, error)
+        if errors:
+            sys.exit(1)
+        sys.exit(0)
+
+    h5file = tables.openFile(options['outfile'], mode="a",
+                             title = "ngspice plots")
+    converter = conversion_cache(h5file, options['pathprefix'], len(args) > 1,
+                                 options_key(store_options))
+    for infile in args:
+        if not options['force'] and converter.lookup(infile):
+            if options['verbose']:
+                print "unchanged: " + infile
+            continue
+        fingerprint = file_fingerprint(infile)
+        if options['stream']:
+            nplots = stream_spicefile(h5file, infile, options['pathprefix'],
+                                      len(args) > 1, **store_options)
         else:
-            path = '/'.join(toks[:-1])
-        name = toks[-1]
-        insert_spiceplot(plots[0], path=path, name=name,
-                         outfile=options['outfile'], format=options['format'])
-        
-    
+            plots = spice_read.spice_read(infile).get_plots()
+            locations = plot_locations(infile, len(plots),
+                                       options['pathprefix'], len(args) > 1)
+            stored = [write_spiceplot(h5file, p, path, name, **store_options)
+                      for (path, name), p in zip(locations, plots)]
+            nplots = len(plots)
+            if not all(stored):
+                nplots = 0
+        if nplots > 0:
+            converter.store(infile, nplots, fingerprint)
+        h5file.flush()
+    spice_catalog.reindex(h5file)
+    h5file.close()
+    print "%i unchanged, %i converted" %(converter.hits,
+                                         len(args) - converter.hits)
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+
+"""
+Benchmark of the table format of spice2hdf5 on synthetic plots.
+
+Compares the former row by row filling of the table (table.row, one cell
+at a time) with the block appends of structured arrays in
+spice2hdf5.insert_spiceplot and prints the rows per second of both.
+"""
+
+import sys, os, getopt
+import shutil
+import tempfile
+import time
+import tables
+import spice_read
+import spice_synth
+import spice2hdf5
+
+def insert_rows(plot, outfile, path="/", name="plot"):
+    """
+    The former implementation: fill the table one cell at a time
+    """
+    h5file = tables.openFile(outfile, mode="w", title = "ngspice plots")
+    scale = plot.get_scalevector()
+    data = plot.get_datavectors()
+    table = h5file.createTable(path, name,
+                               spice2hdf5.plot_records(plot).dtype)
+    row = table.row
+    for i,s in enumerate(scale.get_data()):
+        row[scale.name] = s
+        for d in data:
+            row[d.name] = d.get_data()[i]
+        row.append()
+    h5file.flush()
+    h5file.close()
+
+def insert_records(plot, outfile, path="/", name="plot"):
+    spice2hdf5.insert_spiceplot(plot, outfile=outfile, path=path, name=name,
+                                filemode="w", format="table")
+
+def measure(func, plot, outfile):
+    t0 = time.time()
+    func(plot, outfile)
+    return time.time() - t0
+
+
+def usage():
+    print "usage: " +  sys.argv[0] + """ [options]
+  -h --help: print help information
+  -n --npoints: number of points of the synthetic plot (default: 200000)
+  -m --nvars: number of variables including the scale (default: 8)
+  -c --complex: use complex ac data instead of real transient data
+  -s --skip-rows: do not run the slow row by row variant"""
+
+
+if __name__ == "__main__":
+    npoints = 200000
+    nvars = 8
+    real = True
+    rows = True
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:m:cs",
+                                   ["help", "npoints=", "nvars=", "complex",
+                                    "skip-rows"])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    for k,v in opts:
+        if k in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif k in ('-n', '--npoints'):
+            npoints = int(v)
+        elif k in ('-m', '--nvars'):
+            nvars = int(v)
+        elif k in ('-c', '--complex'):
+            real = False
+        elif k in ('-s', '--skip-rows'):
+            rows = False
+
+    tmpdir = tempfile.mkdtemp(prefix="spice2hdf5_bench_")
+    rawfile = os.path.join(tmpdir, "bench.raw")
+    outfile = os.path.join(tmpdir, "bench.hdf5")
+    try:
+        spice_synth.write_rawfile(rawfile, nvars=nvars, npoints=npoints,
+                                  real=real)
+        plot = spice_read.spice_read(rawfile).get_plots()[0]
+        print "%i points, %i variables, %s" %(npoints, nvars,
+                                              real and "real" or "complex")
+        variants = [("records", insert_records)]
+        if rows:
+            variants.insert(0, ("rows", insert_rows))
+        for name, func in variants:
+            elapsed = measure(func, plot, outfile)
+            print "%-8s %10.3fs %14.0f rows/s" %(name, elapsed,
+                                                 npoints/max(elapsed, 1e-9))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+"""
+Benchmark of the spice_read parser on synthetic raw files.
+
+Every phase runs in a child process of its own, so that the peak RSS of a
+phase is not hidden by the memory of a previous phase. The results can be
+stored as json file and compared with a baseline to catch regressions.
+"""
+
+import sys, os, getopt
+import json
+import multiprocessing
+import resource
+import tempfile
+import time
+import numpy
+import spice_read
+import spice_synth
+
+def touch_plot(plot):
+    ## access every vector, mapped pages have to be loaded
+    total = 0.0
+    for v in [plot.get_scalevector()] + plot.get_datavectors():
+        total += abs(numpy.sum(v.get_data()))
+    return total
+
+def phase_index(filename):
+    spice_read.spice_read(filename, lazy=True).get_index()
+
+def phase_read(filename):
+    for p in spice_read.spice_read(filename).get_plots():
+        touch_plot(p)
+
+def phase_mmap(filename):
+    for p in spice_read.spice_read(filename, mmap=True).get_plots():
+        touch_plot(p)
+
+def phase_compact(filename):
+    for p in spice_read.spice_read(filename, compact=True).get_plots():
+        touch_plot(p)
+
+def phase_select(filename):
+    for p in spice_read.spice_read(filename, vectors=[1]).get_plots():
+        touch_plot(p)
+
+def phase_chunks(filename):
+    r = spice_read.spice_read(filename, lazy=True)
+    for n in xrange(len(r.get_index())):
+        for chunk in r.iter_chunks(n):
+            abs(numpy.sum(chunk))
+
+## name -> phase function, in the order of execution
+PHASES = [("index", phase_index),
+          ("read", phase_read),
+          ("mmap", phase_mmap),
+          ("compact", phase_compact),
+          ("select", phase_select),
+          ("chunks", phase_chunks)]
+
+def max_rss():
+    ## peak resident set size of this process in bytes (ru_maxrss is in kB)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def run_phase(func, filename, queue):
+    rss0 = max_rss()
+    t0 = time.time()
+    func(filename)
+    queue.put((time.time() - t0, max(max_rss() - rss0, 0)))
+
+def benchmark(filename, phases=None, repeat=1):
+    """
+    Run the benchmark phases (default: all) on the raw file filename.
+    Returns a list with a dictionary for each phase containing the name,
+    the best time of repeat runs in seconds, the throughput in MB/s and
+    the growth of the peak RSS in bytes.
+    """
+    size = os.path.getsize(filename)
+    results = []
+    for name, func in PHASES:
+        if phases is not None and name not in phases:
+            continue
+        best = None
+        for i in xrange(repeat):
+            queue = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=run_phase,
+                                           args=(func, filename, queue))
+            proc.start()
+            elapsed, rss = queue.get()
+            proc.join()
+            if best is None or elapsed < best[0]:
+                best = (elapsed, rss)
+        results.append(dict(phase=name, time=best[0], rss=best[1],
+                            mbps=size/1e6/max(best[0], 1e-9)))
+    return results
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Compare the results with the baseline results. Returns the list of
+    phases that are more than tolerance (relative) slower.
+    """
+    base = dict([(r["phase"], r) for r in baseline])
+    slower = []
+    for r in results:
+        if r["phase"] in base and \
+           r["time"] > base[r["phase"]]["time"] * (1 + tolerance):
+            slower.append(r["phase"])
+    return slower
+
+
+def usage():
+    print "usage: " +  sys.argv[0] + """ [options] [rawfile]
+  -h --help: print help information
+  -n --npoints: number of points of the synthetic file (default: 1000000)
+  -m --nvars: number of variables of the synthetic file (default: 8)
+  -p --plots: number of plots of the synthetic file (default: 1)
+  -c --complex: benchmark complex instead of real data
+  -a --ascii: benchmark ASCII instead of binary data
+  -u --unpadded: set the unpadded flag
+  -r --repeat: number of runs per phase, the best is reported (default: 3)
+  -P --phases: comma separated list of phases (default: all)
+  -o --output: store the results as json file
+  -b --baseline: compare with a json results file, exit 1 on regression
+  -t --tolerance: allowed relative slowdown (default: 0.2)
+If a rawfile is given, it is benchmarked instead of a synthetic file."""
+
+
+if __name__ == "__main__":
+    options = dict(npoints=1000000, nvars=8, nplots=1, real=True,
+                   binary=True, padded=True)
+    repeat = 3
+    phases = None
+    output = None
+    baseline = None
+    tolerance = 0.2
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:m:p:caur:P:o:b:t:",
+                                   ["help", "npoints=", "nvars=", "plots=",
+                                    "complex", "ascii", "unpadded",
+                                    "repeat=", "phases=", "output=",
+                                    "baseline=", "tolerance="])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    for k,v in opts:
+        if k in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif k in ('-n', '--npoints'):
+            options['npoints'] = int(v)
+        elif k in ('-m', '--nvars'):
+            options['nvars'] = int(v)
+        elif k in ('-p', '--plots'):
+            options['nplots'] = int(v)
+        elif k in ('-c', '--complex'):
+            options['real'] = False
+        elif k in ('-a', '--ascii'):
+            options['binary'] = False
+        elif k in ('-u', '--unpadded'):
+            options['padded'] = False
+        elif k in ('-r', '--repeat'):
+            repeat = int(v)
+        elif k in ('-P', '--phases'):
+            phases = v.split(',')
+        elif k in ('-o', '--output'):
+            output = v
+        elif k in ('-b', '--baseline'):
+            baseline = v
+        elif k in ('-t', '--tolerance'):
+            tolerance = float(v)
+
+    if args:
+        filename = args[0]
+        tmpfile = None
+    else:
+        fd, tmpfile = tempfile.mkstemp(suffix=".raw")
+        os.close(fd)
+        filename = tmpfile
+        t0 = time.time()
+        spice_synth.write_rawfile(filename, **options)
+        print "generated %s in %.2fs" %(filename, time.time() - t0)
+
+    try:
+        print "file size: %.1f MB" %(os.path.getsize(filename)/1e6)
+        results = benchmark(filename, phases, repeat)
+    finally:
+        if tmpfile:
+            os.remove(tmpfile)
+
+    print "%-10s %10s %10s %12s" %("phase", "time [s]", "MB/s", "peak RSS MB")
+    for r in results:
+        print "%-10s %10.4f %10.1f %12.1f" %(r["phase"], r["time"], r["mbps"],
+                                             r["rss"]/1e6)
+    if output:
+        json.dump(results, open(output, "w"), indent=1)
+    if baseline:
+        slower = compare(results, json.load(open(baseline)), tolerance)
+        if slower:
+            print "Regression in phases: " + ", ".join(slower)
+            sys.exit(1)
@@ -0,0 +1,223 @@
+#!/usr/bin/python
+
+"""
+Parallel loading of many spice raw files.
+
+The files are parsed by a pool of worker processes. The workers do not
+send the data arrays back through the pool pipe. Each plot is written as
+.npy file into a shared memory directory (/dev/shm if available) and the
+parent process maps these files with numpy.load(mmap_mode="r"). The files
+are unlinked right after mapping, the memory is released with the last
+reference to the plot.
+
+A worker that is killed (e.g. by the OOM killer) does not hang the
+loading. Every worker records the number of the file it is parsing in a
+shared array, the file of a dead worker is reported as failed.
+"""
+
+import sys, os, os.path, getopt, glob
+import shutil
+import tempfile
+import time
+import traceback
+import multiprocessing
+import Queue
+import numpy
+import spice_read
+
+SHM_DIR = "/dev/shm"
+
+## shared array with the pid of the worker that parses each file,
+## set in the worker processes of load_files()
+task_owners = None
+
+def find_raw_files(paths, pattern="*.raw"):
+    """
+    Expand a list of files and directories into a sorted list of raw files.
+    Directories are searched (not recursively) for files matching pattern.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(glob.glob(os.path.join(path, pattern)))
+        else:
+            files.append(path)
+    files.sort()
+    return files
+
+def load_file(task):
+    """
+    Worker function: parse a single raw file and store its plots in the
+    shared memory directory. Returns a report dictionary with the plot
+    metadata, the parse time and the error message of a failure.
+    """
+    number, filename, shmdir, vectors = task
+    if task_owners is not None:
+        task_owners[number] = os.getpid()
+    t0 = time.time()
+    report = dict(filename=filename, plots=[], error=None)
+    try:
+        r = spice_read.spice_read(filename, vectors=vectors, compact=True)
+        for i, p in enumerate(r.get_plots()):
+            path = os.path.join(shmdir, "%i_%i.npy" %(number, i))
+            numpy.save(path, p.data)
+            report["plots"].append(dict(path=path, names=p.names,
+                                        types=p.types,
+                                        vector_dimensions=p.vector_dimensions,
+                                        title=p.title, date=p.date,
+                                        plotname=p.plotname,
+                                        plottype=p.plottype,
+                                        dimensions=p.dimensions,
+                                        data_offset=p.data_offset))
+        if len(report["plots"]) == 0:
+            report["error"] = "no plots found"
+    except Exception, err:
+        report["error"] = "%s: %s" %(err.__class__.__name__, err)
+        report["traceback"] = traceback.format_exc()
+    report["time"] = time.time() - t0
+    return report
+
+def init_worker(owners):
+    ## pool initializer of load_files()
+    global task_owners
+    task_owners = owners
+
+def lost_tasks(pool, workers, owners, outstanding):
+    """
+    Return (task number, exit code) of the outstanding tasks of workers
+    that died.
+    workers is the list of the workers seen so far. The pool replaces
+    dead workers, the dead ones are removed from the list once their
+    tasks are returned.
+    """
+    for w in pool._pool:
+        if w not in workers:
+            workers.append(w)
+    lost = []
+    for w in [w for w in workers if w.exitcode not in (None, 0)]:
+        lost.extend([(n, w.exitcode) for n in outstanding
+                     if owners[n] == w.pid])
+        workers.remove(w)
+    return lost
+
+def attach_plot(info):
+    """
+    Map a plot written by load_file and return it as compact_plot.
+    The .npy file is removed, the mapping stays valid.
+    """
+    data = numpy.load(info["path"], mmap_mode="r")
+    os.remove(info["path"])
+    return spice_read.compact_plot(data, info["names"], info["types"],
+                                   info["vector_dimensions"],
+                                   title=info["title"], date=info["date"],
+                                   plotname=info["plotname"],
+                                   plottype=info["plottype"],
+                                   dimensions=info["dimensions"],
+                                   data_offset=info["data_offset"])
+
+def load_files(filenames, processes=None, vectors=None, poll_interval=1.0):
+    """
+    Parse all raw files with a pool of processes (default: one per CPU).
+    vectors is the vector selection passed to spice_read. The results are
+    polled every poll_interval seconds, in between the workers are checked
+    for dead ones.
+
+    Returns a tuple (catalog, reports):
+      catalog -- dictionary {(filename, plot_number): compact_plot}
+      reports -- list of dictionaries, one for each file, with the keys
+        filename, time (parse time in seconds, 0 for a file lost with its
+        worker), plots (plot metadata) and error (None or the error message
+        of a failed file)
+    """
+    base = tempfile.gettempdir()
+    if os.path.isdir(SHM_DIR):
+        base = SHM_DIR
+    shmdir = tempfile.mkdtemp(prefix="spice_bulk_", dir=base)
+    tasks = [(i, f, shmdir, vectors) for i, f in enumerate(filenames)]
+    catalog = {}
+    reports = []
+    owners = multiprocessing.RawArray("i", len(tasks))
+    results = Queue.Queue()
+    pool = multiprocessing.Pool(processes, init_worker, (owners,))
+    try:
+        workers = []
+        lost_tasks(pool, workers, owners, [])
+        for task in tasks:
+            pool.apply_async(load_file, (task,),
+                             callback=lambda r, n=task[0]: results.put((n, r)))
+        outstanding = set(xrange(len(tasks)))
+        while outstanding:
+            try:
+                number, report = results.get(timeout=poll_interval)
+            except Queue.Empty:
+                for number, code in lost_tasks(pool, workers, owners,
+                                               outstanding):
+                    outstanding.discard(number)
+                    reports.append(dict(filename=tasks[number][1], plots=[],
+                                        error="worker process died (exit "
+                                        "code %i)" %(code), time=0.0))
+                continue
+            outstanding.discard(number)
+            for i, info in enumerate(report["plots"]):
+                catalog[(report["filename"], i)] = attach_plot(info)
+            reports.append(report)
+    finally:
+        pool.terminate()
+        shutil.rmtree(shmdir, ignore_errors=True)
+    reports.sort(key=lambda r: r["filename"])
+    return catalog, reports
+
+
+def usage():
+    print "usage: " +  sys.argv[0] + """ [options], rawfile|directory, [..]
+  -h --help: print help information
+  -v --verbose: print the timing of each file
+  -j --jobs: number of worker processes (default: number of CPUs)
+  -s --select: comma separated list of vectors to load (default: all)"""
+
+
+if __name__ == "__main__":
+    ## default options
+    options = dict(verbose=False, jobs=None, select=None)
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hvj:s:",
+                                   ["help", "verbose", "jobs=", "select="])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    if len(args) == 0:
+        usage()
+        sys.exit(2)
+
+    for k,v in opts:
+        if k in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif k in ('-v', '--verbose'):
+            options['verbose'] = True
+        elif k in ('-j', '--jobs'):
+            options['jobs'] = int(v)
+        elif k in ('-s', '--select'):
+            options['select'] = v.split(',')
+
+    files = find_raw_files(args)
+    t0 = time.time()
+    catalog, reports = load_files(files, processes=options['jobs'],
+                                  vectors=options['select'])
+    elapsed = time.time() - t0
+
+    failed = [r for r in reports if r["error"]]
+    if options['verbose']:
+        for r in reports:
+            print "%8.3fs %3i plots  %s" %(r["time"], len(r["plots"]),
+                                          r["filename"])
+    for r in failed:
+        print "Error: %s: %s" %(r["filename"], r["error"])
+    nbytes = sum([p.data.nbytes for p in catalog.values()])
+    print "%i files, %i plots, %i failed, %.1f MB in %.2fs" \
+          %(len(files), len(catalog), len(failed), nbytes/1e6, elapsed)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,249 @@
+#!/usr/bin/python
+
+"""
+Catalog of the plots stored in a spice2hdf5 file.
+
+The group /catalog holds two indexed tables:
+  plots -- one row per stored plot with the node path, the header
+    attributes and the number of points and vectors
+  measures -- one row per scalar measure of a plot (path, name, value)
+The measures are kept in a table of their own, so plots with different
+measures fit into the same catalog. Selecting plots by metadata or by a
+measure value is a single indexed query:
+
+  select_plots(h5file, 'plotname == "Transient Analysis"')
+  select_measures(h5file, "utp", "value > 1.8")
+
+The columns have a fixed width. The path and the measure names are the
+keys of the queries, values that do not fit are rejected. The title, the
+date and the plot name are only shown and are cut to the column width.
+"""
+
+import sys, getopt
+import numpy
+import tables
+
+CATALOG_PATH = "/catalog"
+
+## vector type of ngspice measure results (.meas and let vectors)
+MEASURE_TYPE = "notype"
+
+class catalog_plot(tables.IsDescription):
+    path = tables.StringCol(256, pos=0)
+    title = tables.StringCol(256, pos=1)
+    date = tables.StringCol(64, pos=2)
+    plotname = tables.StringCol(64, pos=3)
+    npoints = tables.Int64Col(pos=4)
+    nvars = tables.Int32Col(pos=5)
+
+class catalog_measure(tables.IsDescription):
+    path = tables.StringCol(256, pos=0)
+    name = tables.StringCol(64, pos=1)
+    value = tables.Float64Col(pos=2)
+
+## indexed columns of the tables
+PLOT_INDEXES = ["path", "title", "date", "plotname", "npoints"]
+MEASURE_INDEXES = ["path", "name", "value"]
+
+def vector_length(vector):
+    ## lazy vectors (spice_hdf5) know their length without reading
+    if hasattr(vector, "__len__"):
+        return len(vector)
+    return len(vector.get_data())
+
+def first_points(vector):
+    ## lazy vectors (spice_hdf5) read the first point, not the whole vector
+    if hasattr(vector, "read"):
+        return vector.read(0, 1)
+    return vector.get_data()[:1]
+
+def plot_measures(plot):
+    """
+    Return the scalar measures of a plot as dictionary {name: value}.
+    Measures are the data vectors with a single point and the vectors of
+    the type "notype", which ngspice pads to the length of the plot. The
+    value is the (real part of the) first point.
+    """
+    measures = {}
+    for v in plot.get_datavectors():
+        if v.type == MEASURE_TYPE or vector_length(v) == 1:
+            data = first_points(v)
+            if len(data) > 0:
+                measures[v.name] = float(numpy.real(data[0]))
+    return measures
+
+def check_value(description, column, value):
+    """
+    Raise ValueError if value is longer than the string column of the
+    catalog table description (catalog_plot or catalog_measure). A cut
+    path or measure name would never match in a query.
+    """
+    size = description.columns[column].itemsize
+    if len(value) > size:
+        raise ValueError("catalog %s longer than %i characters: %s"
+                         %(column, size, value))
+
+def get_catalog(h5file, create=True):
+    """
+    Return the tables (plots, measures) of the catalog of h5file. The
+    catalog is created if it does not exist and create is True,
+    otherwise (None, None) is returned.
+    """
+    if CATALOG_PATH + "/plots" in h5file:
+        return (h5file.getNode(CATALOG_PATH + "/plots"),
+                h5file.getNode(CATALOG_PATH + "/measures"))
+    if not create:
+        return None, None
+    parent, name = CATALOG_PATH.rsplit("/", 1)
+    group = h5file.createGroup(parent or "/", name, "plot catalog")
+    plots = h5file.createTable(group, "plots", catalog_plot, "stored plots")
+    measures = h5file.createTable(group, "measures", catalog_measure,
+                                  "scalar measures of the plots")
+    for c in PLOT_INDEXES:
+        getattr(plots.cols, c).createIndex()
+    for c in MEASURE_INDEXES:
+        getattr(measures.cols, c).createIndex()
+    return plots, measures
+
+def remove_rows(table, path):
+    ## remove the rows of the plot path, from the last row to the first.
+    ## Queries do not see unflushed rows. The automatic index update is
+    ## switched off until reindex(), otherwise every flush after a removal
+    ## would rebuild the indexes.
+    table.autoIndex = False
+    table.flush()
+    rows = table.getWhereList("path == p", condvars={"p": path})
+    for r in sorted(rows, reverse=True):
+        table.removeRows(r, r+1)
+
+def remove_plot(h5file, path):
+    """
+    Remove the catalog rows of the plot stored at the node path.
+    """
+    plots, measures = get_catalog(h5file, create=False)
+    if plots is not None:
+        remove_rows(plots, path)
+        remove_rows(measures, path)
+
+def reindex(h5file):
+    """
+    Rebuild the catalog indexes that are dirty after removing plots and
+    switch the automatic index update on again. Queries are correct
+    without, but they do not use a dirty index.
+    """
+    plots, measures = get_catalog(h5file, create=False)
+    if plots is not None:
+        for table in (plots, measures):
+            table.flush()
+            table.autoIndex = True
+            table.reIndexDirty()
+
+def add_plot(h5file, path, plot, replace=False):
+    """
+    Add the plot stored at the node path to the catalog. With replace the
+    rows of an older plot at the same path are removed first, otherwise
+    the caller has to do that with remove_plot() (spice2hdf5 does it when
+    a node is overwritten). The rows are written with the next flush of
+    the file, flushing the indexed tables for every plot is slow.
+    Raises ValueError if the path or a measure name does not fit into the
+    catalog, no rows are added then.
+    """
+    check_value(catalog_plot, "path", path)
+    plot_values = sorted(plot_measures(plot).items())
+    for name, value in plot_values:
+        check_value(catalog_measure, "name", name)
+    plots, measures = get_catalog(h5file)
+    if replace:
+        remove_rows(plots, path)
+        remove_rows(measures, path)
+    row = plots.row
+    row["path"] = path
+    row["title"] = plot.title
+    row["date"] = plot.date
+    row["plotname"] = plot.plotname
+    row["npoints"] = vector_length(plot.get_scalevector())
+    row["nvars"] = 1 + len(plot.get_datavectors())
+    row.append()
+    row = measures.row
+    for name, value in plot_values:
+        row["path"] = path
+        row["name"] = name
+        row["value"] = value
+        row.append()
+
+def select_plots(h5file, condition=None):
+    """
+    Return the catalog rows of the plots matching the PyTables condition
+    (default: all plots) as structured array, e.g.
+    select_plots(h5file, "(npoints > 1000) & (plotname == 'AC Analysis')")
+    """
+    plots, measures = get_catalog(h5file, create=False)
+    if plots is None:
+        return numpy.zeros(0, dtype=tables.description.dtype_from_descr(
+            catalog_plot))
+    if condition is None:
+        return plots.read()
+    return plots.readWhere(condition)
+
+def select_measures(h5file, name, condition=None):
+    """
+    Return the catalog rows (path, name, value) of the measure name
+    matching the condition on the column value as structured array, e.g.
+    select_measures(h5file, "utp", "value > 1.8")
+    """
+    plots, measures = get_catalog(h5file, create=False)
+    if plots is None:
+        return numpy.zeros(0, dtype=tables.description.dtype_from_descr(
+            catalog_measure))
+    query = "name == measure_name"
+    if condition is not None:
+        query = "(%s) & (%s)" %(query, condition)
+    return measures.readWhere(query, condvars={"measure_name": name})
+
+
+def usage():
+    print "usage: " +  sys.argv[0] + """ [options] hdf5file
+  -h --help: print help information
+  -w --where: condition on the plot columns: path, title, date, plotname,
+              npoints and nvars, e.g. "npoints > 1000"
+  -m --measure: name of a measure, list the plots with their measure value
+  -c --condition: condition on the measure value, e.g. "value > 1.8\""""
+
+
+if __name__ == "__main__":
+    where = None
+    measure = None
+    condition = None
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hw:m:c:",
+                                   ["help", "where=", "measure=",
+                                    "condition="])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    for k,v in opts:
+        if k in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif k in ('-w', '--where'):
+            where = v
+        elif k in ('-m', '--measure'):
+            measure = v
+        elif k in ('-c', '--condition'):
+            condition = v
+
+    h5file = tables.openFile(args[0], mode="r")
+    if measure is not None:
+        for r in select_measures(h5file, measure, condition):
+            print "%s\t%g" %(r["path"], r["value"])
+    else:
+        for r in select_plots(h5file, where):
+            print "%s\t%s\t%i points" %(r["path"], r["plotname"],
+                                        r["npoints"])
+    h5file.close()
@@ -0,0 +1,241 @@
+#!/usr/bin/python
+
+"""
+Reader for HDF5 files written by spice2hdf5.
+
+The plots of the 'table' and the 'vectors' format are returned as
+spice_plot objects. Their vectors are lazy handles of the HDF5 datasets:
+nothing is read until the data is accessed. Indexing or slicing a vector
+reads only the requested part of the dataset, get_data() reads (and keeps)
+the whole vector.
+The vectors can be read as long as the hdf5_read object is open.
+The min/max pyramids stored with spice2hdf5 --pyramid are returned as
+spice_pyramid.minmax_pyramid objects on the datasets.
+"""
+
+import sys, getopt
+import numpy
+import tables
+import spice_catalog
+import spice_read
+import spice_pyramid
+
+## names of the scale vector, used for files without plot attributes
+SCALE_NAMES = ["time", "frequency"]
+
+class hdf5_vector(spice_read.spice_vector):
+    """
+    spice_vector backed by an HDF5 dataset. node is an Array (format
+    'vectors') or a Table, field is the column name of a Table.
+    """
+
+    def __init__(self, node, field=None, **kwargs):
+        self.node = node
+        self.field = field
+        spice_read.spice_vector.__init__(self, None, **kwargs)
+
+    def _get_data(self):
+        if self._data is None:
+            self._data = self.read()
+        return self._data
+
+    def _set_data(self, data):
+        self._data = data
+
+    ## the data is read on the first access
+    data = property(_get_data, _set_data)
+
+    def is_loaded(self):
+        """
+        returns True if the whole vector has been read from the file
+        """
+        return self._data is not None
+
+    def read(self, start=None, stop=None, step=None):
+        """
+        Read the points start..stop-1 of the vector from the file.
+        """
+        if self.field is None:
+            return self.node.read(start, stop, step)
+        return self.node.read(start, stop, step, field=self.field)
+
+    def __len__(self):
+        return self.node.nrows
+
+    def __getitem__(self, key):
+        if self._data is not None:
+            return self._data[key]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step > 0:
+                return self.read(start, max(start, stop), step)
+        elif isinstance(key, (int, long, numpy.integer)):
+            if key < 0:
+                key += len(self)
+            if key < 0 or key >= len(self):
+                raise IndexError("index out of range: %i" %(key))
+            return self.read(key, key+1)[0]
+        ## everything else (negative steps, index arrays) on the full data
+        return self.get_data()[key]
+
+
+class hdf5_read(object):
+    """
+    Open a HDF5 file written by spice2hdf5 and find all plots below path.
+    """
+
+    def __init__(self, filename, path="/"):
+        self.filename = filename
+        self.h5file = tables.openFile(filename, mode="r")
+        self.plot_paths = self.find_plots(path)
+
+    def close(self):
+        """
+        Close the file, vectors that are not loaded can not be read anymore
+        """
+        self.h5file.close()
+
+    def find_plots(self, path="/"):
+        """
+        Return the node paths of all plots below path: tables and groups
+        of arrays. The catalog and the pyramids are skipped.
+        """
+        paths = []
+        for node in self.h5file.walkNodes(path):
+            if [g for g in node._v_pathname.split("/")
+                if g.endswith(spice_pyramid.PYRAMID_SUFFIX)]:
+                continue
+            if (node._v_pathname + "/").startswith(
+                spice_catalog.CATALOG_PATH + "/"):
+                continue
+            if isinstance(node, tables.Table):
+                paths.append(node._v_pathname)
+            elif isinstance(node, tables.Group):
+                children = node._v_children.values()
+                if "names" in node._v_attrs or \
+                   (children and
+                    all([isinstance(c, tables.Array) for c in children])):
+                    paths.append(node._v_pathname)
+        return paths
+
+    def get_plot(self, path):
+        """
+        Return the plot stored at the node path as spice_plot with
+        hdf5_vector vectors.
+        """
+        return node_plot(self.h5file.getNode(path))
+
+    def get_pyramids(self, path):
+        """
+        Return the min/max pyramids of the plot at the node path as
+        dictionary {vector name: minmax_pyramid}. The dictionary is empty
+        if no pyramids are stored.
+        """
+        node = self.h5file.getNode(path)
+        group_path = path + spice_pyramid.PYRAMID_SUFFIX
+        if group_path not in self.h5file:
+            return {}
+        group = self.h5file.getNode(group_path)
+        factor = group._v_attrs.pyramid_factor
+        nlevels = group._v_attrs.pyramid_levels
+        levels = [self.h5file.getNode(group, "level_%i" %(k+1))
+                  for k in xrange(nlevels)]
+        plot = node_plot(node)
+        scale = plot.get_scalevector()
+        pyramids = {}
+        for v in plot.get_datavectors():
+            pyramids[v.name] = spice_pyramid.minmax_pyramid(
+                scale, v, [(l.scale, getattr(l, v.name))
+                           for l in levels], factor)
+        return pyramids
+
+    def plot(self, n):
+        """
+        returns the n-th plot of the file
+        """
+        return self.get_plot(self.plot_paths[n])
+
+    def get_plots(self):
+        """
+        returns a list of all plots of the file
+        """
+        return [self.get_plot(p) for p in self.plot_paths]
+
+
+def node_plot(node):
+    """
+    Return the plot stored in the table or group node as spice_plot with
+    hdf5_vector vectors.
+    """
+    attrs = node._v_attrs
+    if isinstance(node, tables.Table):
+        names = list(node.colnames)
+    elif "names" in attrs:
+        names = list(attrs.names)
+    else:
+        names = sorted(node._v_children.keys())
+        for s in SCALE_NAMES:
+            if s in names:
+                names.remove(s)
+                names.insert(0, s)
+                break
+
+    types = list(getattr(attrs, "types", [""]*len(names)))
+    dims = list(getattr(attrs, "vector_dimensions", [[]]*len(names)))
+    vectors = []
+    for name, vtype, vdims in zip(names, types, dims):
+        if isinstance(node, tables.Table):
+            vector = hdf5_vector(node, name)
+        else:
+            vector = hdf5_vector(getattr(node, name))
+        vector.set_attributes(name=str(name), type=str(vtype),
+                              dimensions=list(vdims))
+        vectors.append(vector)
+
+    plot = spice_read.spice_plot(vectors[0], vectors[1:])
+    for k in ("title", "date", "plotname"):
+        if k in attrs:
+            plot.set_attributes(**{k: str(getattr(attrs, k))})
+    if "dimensions" in attrs:
+        plot.set_attributes(dimensions=list(attrs.dimensions))
+    return plot
+
+
+def usage():
+    print "usage: " +  sys.argv[0] + """ [options] hdf5file
+  -h --help: print help information
+  -p --path: only list the plots below this path (default: /)"""
+
+
+if __name__ == "__main__":
+    path = "/"
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:", ["help", "path="])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    for k,v in opts:
+        if k in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif k in ('-p', '--path'):
+            path = v
+
+    r = hdf5_read(args[0], path)
+    for p in r.plot_paths:
+        plot = r.get_plot(p)
+        scale = plot.get_scalevector()
+        print p
+        print '    Title: ', plot.title
+        print '    Plotname: ', plot.plotname
+        print '    Points: ', len(scale)
+        print '    Vectors: ', ", ".join([scale.name] +
+                                         [v.name for v in
+                                          plot.get_datavectors()])
+    r.close()
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+
+"""
+Plots as directories of .npy files.
+
+Each plot is stored in a directory with one .npy file per vector and a
+JSON manifest (manifest.json) with the plot attributes and the vector
+table. The files can be mapped with numpy.load(mmap_mode="r") by many
+processes at once, without PyTables and without parsing.
+
+The vectors are written in chunks from the raw file (see
+spice_read.iter_chunks), a plot is never loaded as a whole. The manifest
+is written last and renamed into place, a directory without manifest is
+incomplete and ignored by the reader.
+"""
+
+import sys, os, os.path, getopt
+import json
+import shutil
+import numpy
+import numpy.lib.format
+import spice_read
+
+MANIFEST = "manifest.json"
+MANIFEST_FORMAT = "spice_npy"
+MANIFEST_VERSION = 1
+
+def vector_filename(n):
+    ## file names do not depend on the vector names (e.g. "i(v1)")
+    return "vector_%03i.npy" %(n)
+
+def create_vector_file(filename, dtype, npoints):
+    ## .npy file mapped for writing, empty files can not be mapped
+    if npoints == 0:
+        numpy.save(filename, numpy.zeros(0, dtype=dtype))
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                        shape=(npoints,))
+
+def write_npyfile(infile, directories, chunksize=65536):
+    """
+    Write all plots of the raw file infile. directories is a list with
+    the target directory of each plot (see plot_directories()). Existing
+    plot directories are replaced. Returns the number of written plots.
+    """
+    reader = spice_read.spice_read(infile, lazy=True)
+    index = reader.get_index()
+    for n, (info, directory) in enumerate(zip(index, directories)):
+        tmpdir = directory.rstrip("/") + ".tmp"
+        if os.path.exists(tmpdir):
+            shutil.rmtree(tmpdir)
+        os.makedirs(tmpdir)
+
+        vectors = []
+        arrays = []
+        for i, v in enumerate(info["variables"]):
+            if i == 0 or info["real"]:
+                dtype = numpy.float64
+            else:
+                dtype = numpy.complex128
+            vectors.append(dict(name=str(v[1]), type=str(v[2]),
+                                dimensions=list(v[3]),
+                                file=vector_filename(i),
+                                dtype=numpy.dtype(dtype).str))
+            arrays.append(create_vector_file(
+                os.path.join(tmpdir, vectors[-1]["file"]), dtype,
+                info["npoints"]))
+
+        ## a truncated file has less points than announced
+        npoints = 0
+        for chunk in reader.iter_chunks(n, chunksize):
+            stop = npoints + len(chunk)
+            arrays[0][npoints:stop] = chunk[:,0].real
+            for j, a in enumerate(arrays[1:]):
+                a[npoints:stop] = chunk[:,j+1]
+            npoints = stop
+        for a in arrays:
+            if isinstance(a, numpy.memmap):
+                a.flush()
+        del arrays
+
+        manifest = dict(format=MANIFEST_FORMAT, version=MANIFEST_VERSION,
+                        title=info["title"], date=info["date"],
+                        plotname=info["plotname"],
+                        dimensions=info["dimensions"], npoints=npoints,
+                        source=os.path.abspath(infile), vectors=vectors)
+        f = open(os.path.join(tmpdir, MANIFEST + ".tmp"), "w")
+        json.dump(manifest, f, indent=1)
+        f.close()
+        os.rename(os.path.join(tmpdir, MANIFEST + ".tmp"),
+                  os.path.join(tmpdir, MANIFEST))
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.rename(tmpdir, directory)
+    return len(index)
+
+def plot_directories(outdir, locations):
+    """
+    Return the plot directories below outdir for the (path, name)
+    locations of spice2hdf5.plot_locations().
+    """
+    return [os.path.join(outdir, path.lstrip("/"), name)
+            for path, name in locations]
+
+
+class npy_read(object):
+    """
+    Find the plot directories below directory and return their plots
+    with memory mapped vectors.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.plot_dirs = self.find_plots(directory)
+
+    def find_plots(self, directory):
+        """
+        Return the sorted list of the plot directories (with a manifest)
+        below directory.
+        """
+        dirs = []
+        for root, subdirs, files in os.walk(directory):
+            ## directories that are still written
+            subdirs[:] = [d for d in subdirs if not d.endswith(".tmp")]
+            if MANIFEST in files:
+                dirs.append(root)
+        dirs.sort()
+        return dirs
+
+    def get_plot(self, directory):
+        """
+        Return the plot of a directory as spice_plot. The data of the
+        vectors are read only memory maps of the .npy files.
+        """
+        f = open(os.path.join(directory, MANIFEST))
+        manifest = json.load(f)
+        f.close()
+        if manifest.get("format") != MANIFEST_FORMAT:
+            raise ValueError("no %s manifest: %s" %(MANIFEST_FORMAT,
+                                                     directory))
+        vectors = []
+        for v in manifest["vectors"]:
+            filename = os.path.join(directory, v["file"])
+            if manifest["npoints"] > 0:
+                data = numpy.load(filename, mmap_mode="r")
+            else:   ## empty files can not be mapped
+                data = numpy.load(filename)
+            vectors.append(spice_read.spice_vector(
+                data[:manifest["npoints"]], name=str(v["name"]),
+                type=str(v["type"]), dimensions=list(v["dimensions"])))
+        plot = spice_read.spice_plot(vectors[0], vectors[1:])
+        plot.set_attributes(title=str(manifest["title"]),
+                            date=str(manifest["date"]),
+                            plotname=str(manifest["plotname"]),
+                            dimensions=list(manifest["dimensions"]))
+        return plot
+
+    def plot(self, n):
+        """
+        returns the n-th plot
+        """
+        return self.get_plot(self.plot_dirs[n])
+
+    def get_plots(self):
+        """
+        returns a list of all plots
+        """
+        return [self.get_plot(d) for d in self.plot_dirs]
+
+
+def usage():
+    print "usage: " +  sys.argv[0] + """ [options] directory
+  -h --help: print help information"""
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h", ["help"])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    for k,v in opts:
+        if k in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+
+    r = npy_read(args[0])
+    for d in r.plot_dirs:
+        plot = r.get_plot(d)
+        scale = plot.get_scalevector()
+        print d
+        print '    Title: ', plot.title
+        print '    Plotname: ', plot.plotname
+        print '    Points: ', len(scale.get_data())
+        print '    Vectors: ', ", ".join([scale.name] +
+                                         [v.name for v in
+                                          plot.get_datavectors()])
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+
+"""
+Min/max decimation pyramids for plotting long vectors.
+
+Level k of a pyramid holds the minimum and the maximum of bins of
+factor**k points of the vector, and the scale value at the start of each
+bin. A query for a scale window returns the bins of the coarsest level that
+still has enough resolution, so the cost depends on the number of requested
+points and not on the length of the vector. Complex vectors are decimated
+by their magnitude.
+
+The levels only have to support slicing and len(), so a pyramid can be
+built on HDF5 datasets (see spice2hdf5 and spice_hdf5) as well as on
+numpy arrays.
+"""
+
+import numpy
+
+## number of points per bin of the next level
+PYRAMID_FACTOR = 4
+
+## no more levels are built once a level has at most this number of bins
+PYRAMID_MIN_BINS = 256
+
+## name suffix of the HDF5 group with the pyramids of a plot node
+PYRAMID_SUFFIX = "_pyramid"
+
+def reduce_minmax(minmax, factor):
+    """
+    Combine factor consecutive (min, max) rows of a (bins, 2) array.
+    The last bin may be incomplete.
+    """
+    starts = numpy.arange(0, len(minmax), factor)
+    result = numpy.empty((len(starts), 2))
+    result[:,0] = numpy.minimum.reduceat(minmax[:,0], starts)
+    result[:,1] = numpy.maximum.reduceat(minmax[:,1], starts)
+    return result
+
+def reduce_first(scale, factor):
+    ## the scale value at the start of each bin
+    return scale[::factor]
+
+def envelope_values(data):
+    ## the decimated values: real data or the magnitude of complex data
+    if numpy.iscomplexobj(data):
+        return numpy.abs(data)
+    return numpy.asarray(data, dtype="float64")
+
+def minmax_rows(data):
+    ## level 0 as (n, 2) min/max rows
+    values = envelope_values(data)
+    return numpy.column_stack((values, values))
+
+def scale_levels(scale, factor=PYRAMID_FACTOR, min_bins=PYRAMID_MIN_BINS):
+    """
+    Return the scale values at the bin starts of all levels (level 1 first).
+    """
+    levels = []
+    current = numpy.real(scale)
+    while len(current) > min_bins:
+        current = current[::factor]
+        levels.append(current)
+    return levels
+
+class level_builder(object):
+    """
+    Build the levels 1, 2, ... of a pyramid from chunks of level 0, the
+    scale values or the (n, 2) min/max rows of a vector. reduce(rows,
+    factor) combines the rows of complete bins (reduce_first or
+    reduce_minmax). The rows of level k are passed to store(k, rows) as
+    soon as it is known that level k exists, i.e. level k-1 has more than
+    min_bins rows. Only the incomplete bins of each level and the rows of
+    levels that may not exist are kept in memory.
+    """
+
+    def __init__(self, reduce, store, factor=PYRAMID_FACTOR,
+                 min_bins=PYRAMID_MIN_BINS):
+        self.reduce = reduce
+        self.store = store
+        self.factor = factor
+        self.min_bins = min_bins
+        self.counts = []   ## number of rows of each level
+        self.carry = []    ## rows of each level not yet reduced
+        self.pending = []  ## rows held back, None once the level exists
+
+    def exists(self, k):
+        return k == 0 or self.counts[k-1] > self.min_bins
+
+    def add(self, k, rows):
+        """
+        Append rows to level k (add(0, chunk) for the data chunks)
+        """
+        if k == len(self.counts):
+            self.counts.append(0)
+            self.carry.append(rows[:0])
+            self.pending.append([])
+        self.counts[k] += len(rows)
+        if k > 0:
+            self.flush(k, rows)
+        rows = numpy.concatenate((self.carry[k], rows))
+        n = len(rows) - len(rows) % self.factor
+        self.carry[k] = rows[n:]
+        if n > 0:
+            self.add(k+1, self.reduce(rows[:n], self.factor))
+
+    def flush(self, k, rows=None):
+        ## store the rows of level k if it exists, otherwise hold them
+        if not self.exists(k):
+            if rows is not None:
+                self.pending[k].append(rows)
+            return
+        if self.pending[k] is not None:
+            for r in self.pending[k]:
+                self.store(k, r)
+            self.pending[k] = None
+        if rows is not None:
+            self.store(k, rows)
+
+    def finish(self):
+        """
+        Reduce the incomplete last bins and store the remaining rows.
+        Returns the number of levels.
+        """
+        k = 0
+        while k < len(self.counts) and self.counts[k] > self.min_bins:
+            if len(self.carry[k]) > 0:
+                rows = self.reduce(self.carry[k], self.factor)
+                self.carry[k] = self.carry[k][:0]
+                self.add(k+1, rows)
+            self.flush(k+1)
+            k += 1
+        return k
+
+
+class minmax_pyramid(object):
+    """
+    Min/max pyramid of a single vector.
+      scale -- scale values of the vector (level 0)
+      data -- the vector data (level 0)
+      levels -- list of (scale, minmax) tuples of level 1, 2, ... with the
+        bin start values and the (bins, 2) array of min and max values
+      factor -- number of bins of a level that form one bin of the next
+    """
+
+    def __init__(self, scale, data, levels, factor=PYRAMID_FACTOR):
+        self.scale = scale
+        self.data = data
+        self.levels = levels
+        self.factor = factor
+
+    def from_data(cls, scale, data, factor=PYRAMID_FACTOR,
+                  min_bins=PYRAMID_MIN_BINS, scales=None):
+        """
+        Compute the pyramid of the numpy arrays scale and data.
+        scales are the scale levels from scale_levels(), if they are
+        already computed for another vector of the plot.
+        """
+        if scales is None:
+            scales = scale_levels(scale, factor, min_bins)
+        minmax = minmax_rows(data)
+        levels = []
+        for s in scales:
+            minmax = reduce_minmax(minmax, factor)
+            levels.append((s, minmax))
+        return cls(scale, data, levels, factor)
+    from_data = classmethod(from_data)
+
+    def find_index(self, value):
+        """
+        Return the index of the first point with a scale >= value.
+        The scale has to be increasing. Only a few values of each level
+        are read.
+        """
+        if not self.levels:
+            return int(numpy.searchsorted(numpy.real(self.scale[:]), value))
+        top = self.levels[-1][0]
+        j = int(numpy.searchsorted(numpy.real(top[:]), value))
+        lower = [s for s, minmax in self.levels[:-1]]
+        for s in reversed([self.scale] + lower):
+            a = max((j-1)*self.factor, 0)
+            b = min(j*self.factor, len(s))
+            j = a + int(numpy.searchsorted(numpy.real(s[a:b]), value))
+        return j
+
+    def envelope(self, start=None, stop=None, n=1000):
+        """
+        Return the envelope of the scale window start..stop (default:
+        whole vector) with at most n points as tuple of arrays
+        (scale, minimum, maximum). The bins at the window borders may
+        reach a little beyond the window.
+        """
+        n = max(int(n), 1)
+        i0 = 0
+        i1 = len(self.data)
+        if start is not None:
+            i0 = self.find_index(start)
+        if stop is not None:
+            i1 = max(self.find_index(stop), i0)
+        if i1 - i0 <= n:
+            values = envelope_values(self.data[i0:i1])
+            return numpy.real(self.scale[i0:i1]), values, values
+
+        ## coarsest needed level, the bins of level k have factor**k points
+        level = len(self.levels)
+        for k in xrange(1, len(self.levels)+1):
+            b = self.factor**k
+            if -(-i1 // b) - i0 // b <= n:
+                level = k
+                break
+        if level == 0:
+            values = envelope_values(self.data[i0:i1])
+            scale = numpy.real(self.scale[i0:i1])
+            minmax = numpy.column_stack((values, values))
+        else:
+            b = self.factor**level
+            j0 = i0 // b
+            j1 = -(-i1 // b)
+            scale, minmax = self.levels[level-1]
+            scale = numpy.asarray(scale[j0:j1])
+            minmax = numpy.asarray(minmax[j0:j1])
+
+        ## coarser than the top level: reduce the remaining bins here
+        if len(scale) > n:
+            step = -(-len(scale) // n)
+            minmax = reduce_minmax(minmax, step)
+            scale = scale[::step]
+        return scale, minmax[:,0], minmax[:,1]
+
+
+def plot_pyramids(plot, factor=PYRAMID_FACTOR, min_bins=PYRAMID_MIN_BINS):
+    """
+    Compute the pyramids of all data vectors of a spice_plot.
+    Returns a dictionary {vector name: minmax_pyramid}.
+    """
+    scale = plot.get_scalevector().get_data()
+    scales = scale_levels(scale, factor, min_bins)
+    pyramids = {}
+    for v in plot.get_datavectors():
+        pyramids[v.name] = minmax_pyramid.from_data(scale, v.get_data(),
+                                                    factor, min_bins, scales)
+    return pyramids
@@ -15,9 +15,76 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import numpy
+import os
+import re
 import string
 import sys
+import time
+
+## line that starts the data block of a plot
+DATA_KEYWORD_RE = re.compile(r"^(binary|values):[ \t\r]*\n",
+                             re.MULTILINE | re.IGNORECASE)
+
+## version of the sidecar index, older index files are built again
+INDEX_VERSION = 2
+
+## "No. Points:" line of a plot header
+NPOINTS_RE = re.compile(r"^no\. points:[ \t]*(\d+)",
+                        re.MULTILINE | re.IGNORECASE)
+
+## point index at the beginning of a line in an ASCII "Values:" block
+VALUES_INDEX_RE = re.compile(r"^[ \t]*\d+[ \t]*\t", re.MULTILINE)
+
+## number of values of an ASCII "Values:" block parsed at once
+VALUES_CHUNK = 65536
+
+def parse_values(text, iscomplex=False):
+    """
+    Tokenize the text of an ASCII "Values:" block and return all values
+    as flat float64 array. Complex "re,im" pairs give two values.
+    """
+    text = VALUES_INDEX_RE.sub("\t", text)
+    if iscomplex:
+        text = text.replace(",", " ")
+    return numpy.fromstring(text, dtype="float64", sep=" ")
+
+def parse_dimensions(text):
+    """
+    Parse a dimension list like "3,11" into a list of integers
+    """
+    return [string.atoi(t) for t in string.split(text, ",")
+            if string.strip(t) != ""]
+
+def reshape_dimensions(data, dimensions):
+    """
+    Return a view of the vector data with the shape given by dimensions.
+    Padded points behind the last element are dropped.
+    """
+    if len(dimensions) == 0:
+        return data
+    size = numpy.prod(dimensions)
+    return data[:size].reshape(dimensions)
+
+def count_value_lines(buf, nlines):
+    """
+    Count the complete value lines (lines containing a tab) in the
+    buffer, but not more than nlines. Returns the count and the position
+    after the last counted line.
+    """
+    if nlines <= 0:
+        return 0, 0
+    b = numpy.frombuffer(buf, dtype="uint8")
+    newlines = numpy.flatnonzero(b == ord("\n"))
+    tabs = numpy.flatnonzero(b == ord("\t"))
+    lines = numpy.unique(numpy.searchsorted(newlines, tabs))
+    lines = lines[lines < len(newlines)]
+    if len(lines) >= nlines:
+        return nlines, newlines[lines[nlines-1]] + 1
+    elif len(lines) > 0:
+        return len(lines), newlines[lines[-1]] + 1
+    return 0, 0
 
 class spice_vector(object):
     """
@@ -26,17 +93,22 @@ class spice_vector(object):
     The attributes are:
       * name: vector name
       * type: frequency, voltage or current
+      * dimensions: shape of a multi-dimensional vector, e.g. [3, 11]
+        for a nested dc sweep (outer sweep first)
     """
     
     def __init__(self, vector=numpy.array([]), **kwargs):
         self.data = vector
         self.name = ""
         self.type = ""
+        self.dimensions = []
+        self.derived = {}   ## cache of derived data like "db" or "phase"
+        self.imag = None    ## imaginary part of a real view, see get_imag()
         self.set_attributes(**kwargs)
         
     def set_attributes(self, **kwargs):
         """
-        Set the attribues of the vector "name" and "type"
+        Set the attribues of the vector "name", "type" and "dimensions"
         """
         for k,v in kwargs.items():
             if hasattr(self,k):
@@ -53,12 +125,73 @@ class spice_vector(object):
         set a new numpy.array as data vector
         """
         self.data = data_array
+        self.derived = {}
+        self.imag = None
 
     def get_data(self):
         """
         returns the data vector as numpy.array
         """
         return self.data
+
+    def get_imag(self):
+        """
+        returns the imaginary part of the data. The scale of a complex plot
+        is returned as real view by get_data(), its imaginary part (zero
+        for an ngspice frequency scale) is only read here.
+        """
+        if self.imag is not None:
+            return self.imag
+        return numpy.imag(self.data)
+
+    def get_ndarray(self):
+        """
+        returns the data as N-D numpy.array with the shape of the vector
+        dimensions. The array is a reshaped view of the data vector.
+        Padded points behind the last element are dropped.
+        """
+        return reshape_dimensions(self.data, self.dimensions)
+
+    def get_magnitude(self):
+        """
+        returns the magnitude of the data. The result is cached until the
+        data is changed, like the other derived data below.
+        """
+        if "magnitude" not in self.derived:
+            self.derived["magnitude"] = numpy.abs(self.data)
+        return self.derived["magnitude"]
+
+    def get_db(self):
+        """
+        returns the magnitude of the data in dB (20*log10(abs(data)))
+        """
+        if "db" not in self.derived:
+            self.derived["db"] = 20*numpy.log10(self.get_magnitude())
+        return self.derived["db"]
+
+    def get_phase(self):
+        """
+        returns the unwrapped phase of the data in radians
+        """
+        if "phase" not in self.derived:
+            self.derived["phase"] = numpy.unwrap(numpy.angle(self.data))
+        return self.derived["phase"]
+
+    def get_group_delay(self, frequency):
+        """
+        returns the group delay -dphase/domega in seconds. frequency is
+        the frequency scale of the plot in Hz as numpy.array or
+        spice_vector.
+        """
+        if isinstance(frequency, spice_vector):
+            frequency = frequency.get_data()
+        cached = self.derived.get("group_delay")
+        if cached is None or cached[0] is not frequency:
+            delay = -numpy.gradient(self.get_phase(),
+                                    2*numpy.pi*numpy.real(frequency))
+            cached = (frequency, delay)
+            self.derived["group_delay"] = cached
+        return cached[1]
     
 
 class spice_plot(object):
@@ -79,6 +212,7 @@ class spice_plot(object):
         self.plotname = "plotname undefined"
         self.plottype = "plottype undefined"
         self.dimensions = []
+        self.data_offset = -1   ## byte offset of the data block in the file
 
         ## a single scale vector
         if scale == None:
@@ -92,6 +226,9 @@ class spice_plot(object):
         else:
             self.data_vectors = data     
 
+        ## name -> data vector dictionary
+        self.vector_index = dict([(v.name, v) for v in self.data_vectors])
+
         self.set_attributes(**kwargs)
 
     def set_attributes(self, **kwargs):
@@ -119,12 +256,14 @@ class spice_plot(object):
         Set a list of spice_vector as data of spice_plot
         """
         self.data_vectors = spice_vector_list
+        self.vector_index = dict([(v.name, v) for v in spice_vector_list])
 
     def append_datavector(self, spice_vector):
         """
         Append a single spice_vector to the data section
         """
         self.data_vectors.append(spice_vector)
+        self.vector_index[spice_vector.name] = spice_vector
 
     def get_scalevector(self):
         """
@@ -144,6 +283,167 @@ class spice_plot(object):
         """
         return self.data_vectors
 
+    def get_vector(self, name):
+        """
+        returns the vector with the given name, the scale vector included
+        """
+        if name in self.vector_index:
+            return self.vector_index[name]
+        if hasattr(self, "scale_vector") and self.scale_vector.name == name:
+            return self.scale_vector
+        raise KeyError(name)
+
+    def __getitem__(self, name):
+        return self.get_vector(name)
+
+    def __contains__(self, name):
+        try:
+            self.get_vector(name)
+        except KeyError:
+            return False
+        return True
+
+    def get_axes(self):
+        """
+        returns a list with the scale values of each axis of a
+        multi-dimensional plot. The values are taken from the scale vector.
+        If the scale is constant along an axis (e.g. the outer sweep of a
+        nested dc sweep), the step numbers 0..n-1 are used instead.
+        """
+        scale = self.scale_vector.get_ndarray()
+        axes = []
+        for k in xrange(scale.ndim):
+            index = [0]*scale.ndim
+            index[k] = slice(None)
+            values = scale[tuple(index)]
+            if len(values) > 1 and numpy.all(values == values[0]):
+                values = numpy.arange(len(values))
+            axes.append(values)
+        return axes
+
+
+class compact_vector(object):
+    """
+    Lightweight handle of a single column of a compact_plot.
+    It provides the read access methods of spice_vector.
+    """
+    __slots__ = ("plot", "column", "name", "type", "dimensions")
+
+    def __init__(self, plot, column):
+        self.plot = plot
+        self.column = column
+        self.name = plot.names[column]
+        self.type = plot.types[column]
+        self.dimensions = plot.vector_dimensions[column]
+
+    def get_data(self):
+        """
+        returns the data vector as numpy.array (a view of the plot array)
+        """
+        return self.plot.get_column(self.column)
+
+    def get_ndarray(self):
+        """
+        returns the data as N-D numpy.array, see spice_vector.get_ndarray()
+        """
+        return reshape_dimensions(self.get_data(), self.dimensions)
+
+
+class compact_plot(object):
+    """
+    Memory efficient variant of spice_plot for keeping many plots in memory.
+    All vectors share a single (npoints, nvars) backing array, column 0 is
+    the scale. Vectors are found by name through a dictionary, plot["v(out)"],
+    and are returned as compact_vector handles, which are created on access.
+    For complex plots the backing array is complex, the scale vector returns
+    only the real part.
+    """
+    __slots__ = ("title", "date", "plotname", "plottype", "dimensions",
+                 "data_offset", "data", "names", "types",
+                 "vector_dimensions", "index")
+
+    def __init__(self, data, names, types=None, vector_dimensions=None,
+                 **kwargs):
+        """
+        Initialize a compact plot from the 2-D array data and the list of
+        vector names of the columns. The plot attributes ("title", ...)
+        are provided by **kwargs.
+        """
+        self.title = "title undefined"
+        self.date = "date undefined"
+        self.plotname = "plotname undefined"
+        self.plottype = "plottype undefined"
+        self.dimensions = []
+        self.data_offset = -1
+        self.data = data
+        self.names = list(names)
+        if types is None:
+            types = [""] * len(names)
+        self.types = list(types)
+        if vector_dimensions is None:
+            vector_dimensions = [[] for n in names]
+        self.vector_dimensions = list(vector_dimensions)
+        self.index = dict([(n, i) for i, n in enumerate(self.names)])
+        for k,v in kwargs.items():
+            if k in ("title", "date", "plotname", "plottype", "dimensions",
+                     "data_offset"):
+                setattr(self,k,v)
+            else:
+                print "Warning: unknown attribute \"" + k + "\". Ignored!"
+
+    def from_plot(cls, plot):
+        """
+        Create a compact_plot from a spice_plot. The vectors are copied
+        into the backing array.
+        """
+        vectors = [plot.get_scalevector()] + plot.get_datavectors()
+        data = numpy.column_stack([v.get_data() for v in vectors])
+        return cls(data, [v.name for v in vectors],
+                   [v.type for v in vectors],
+                   [v.dimensions for v in vectors],
+                   title=plot.title, date=plot.date, plotname=plot.plotname,
+                   plottype=plot.plottype, dimensions=plot.dimensions,
+                   data_offset=plot.data_offset)
+    from_plot = classmethod(from_plot)
+
+    def get_column(self, n):
+        """
+        returns the data of the n-th column as numpy.array view
+        """
+        if n == 0 and self.data.dtype.kind == "c":
+            return self.data[:,0].real
+        return self.data[:,n]
+
+    def get_vector(self, name):
+        """
+        returns the vector with the given name
+        """
+        return compact_vector(self, self.index[name])
+
+    def __getitem__(self, name):
+        return self.get_vector(name)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get_scalevector(self):
+        """
+        returns the scale vector as a compact_vector
+        """
+        return compact_vector(self, 0)
+
+    def get_datavector(self, n):
+        """
+        returns the n-th data vector as a compact_vector
+        """
+        return compact_vector(self, n+1)
+
+    def get_datavectors(self):
+        """
+        return a list of all data vectors of the plot
+        """
+        return [compact_vector(self, n) for n in xrange(1, len(self.names))]
+
 
 class spice_read(object):
     """
@@ -154,14 +454,42 @@ class spice_read(object):
     ngspice-rework-17 file ./src/frontend/rawfile.c
     """
 
-    def __init__(self, filename):
-        self.plots = []
-        self.set_default_values()
+    def __init__(self, filename, mmap=False, vectors=None, lazy=False,
+                 compact=False):
+        """
+        Read all plots of the spice file filename.
+        If mmap is True the binary data is not read into memory. The
+        vectors are strided views of a numpy.memmap of the file instead,
+        the pages of the file are only loaded when the data is accessed.
+        vectors may be a list of vector names or column indices. Only
+        these vectors (and the scale vector) are read from the file.
+        If lazy is True only the plot index is loaded (from the sidecar
+        file, if it is up to date) or built by a scan of the plot headers.
+        The plots are read on access by plot(i) or iter_plots().
+        If compact is True the plots are returned as compact_plot objects
+        that use the data block as backing array.
+        """
+        self.set_options(filename, mmap, vectors, lazy, compact)
+        if lazy:
+            self.index = self.read_index()
+            return
         error = self.readfile(filename)
         if error:
             ## FIXME create an assertion
             print "error in reading the file"
 
+    def set_options(self, filename, mmap=False, vectors=None, lazy=False,
+                    compact=False):
+        ## options of the reader, see __init__(); nothing is read yet
+        self.filename = filename
+        self.mmap = mmap
+        self.selection = vectors
+        self.lazy = lazy
+        self.compact = compact
+        self.plots = []
+        self.index = None
+        self.set_default_values()
+
     def set_default_values(self):
         ## Set the default values for some options
         self.current_plot = spice_plot()
@@ -171,13 +499,40 @@ class spice_read(object):
         self.padded = True
         self.real = True
         self.vectors = []
+        self.columns = []
+        self.variables = []
+        self.format = ""
+
+    def is_selected(self, number, name):
+        """
+        Check whether the variable with the column number and name is in
+        the vector selection. The scale vector is always selected.
+        """
+        if self.selection is None or number == 0:
+            return True
+        return number in self.selection or name in self.selection
 
     def readfile(self,filename):
         f = open(filename, "rb")
+        while (1):
+            plot = self.read_plot(f)
+            if plot is None:
+                f.close()
+                return
+            self.plots.append(plot)
+
+    def read_plot(self, f, headers_only=False):
+        """
+        Read the next plot from the file f and return it as spice_plot.
+        None is returned at the end of the file or if the plot is corrupt.
+        If headers_only is True the data block is skipped and the plot
+        contains no vectors.
+        """
+        self.set_default_values()
         while (1):
             line = f.readline()
             if line == "":   ## EOF
-                return
+                return None
 
             tok = [string.strip(t) for t in string.split(line,":",1)]
             keyword = tok[0].lower()  ## don't care the case of the keyword entry
@@ -209,9 +564,9 @@ class spice_read(object):
                 if self.npoints == 0:
                     print 'Error: misplaced "Dimensions:" lineprint'
                     continue
-                print 'Warning: "Dimensions" not supported yet'
-                # FIXME: How can I create such simulation files?
-                # numdims = string.atoi(tok[1])
+                dims = parse_dimensions(tok[1])
+                self.numdims = len(dims)
+                self.current_plot.set_attributes(dimensions=dims)
             elif keyword == "command":
                 print 'Warning: "command" option not implemented yet'
                 print '\t' + line
@@ -225,68 +580,74 @@ class spice_read(object):
                     line = string.split(string.strip(f.readline()))
                     if len(line) >= 3:
                         number = string.atoi(line[0])
+                        ## attributes: min=, max=, color=, grid=, plot=,
+                        ## dims=; only dims is useful for the data
+                        dims = []
+                        for attr in line[3:]:
+                            if attr.lower().startswith("dims="):
+                                dims = parse_dimensions(attr[5:])
+                        ## number, name, type and dimensions
+                        self.variables.append(line[:3] + [dims])
+                        if not self.is_selected(number, line[1]):
+                            continue
                         curr_vector = spice_vector(name=line[1],
-                                                   type=line[2])
+                                                   type=line[2],
+                                                   dimensions=list(dims))
                         self.vectors.append(curr_vector)
-                        if len(line) > 3:
-                            # print "Attributes: ", line[3:]
-                            dummy =1
-                            ## min=, max, color, grid, plot, dim
-                            ## I think only dim is useful and neccesary
+                        self.columns.append(number)
                     else:
                         print "list of variables is to short"
 
             elif keyword in ["values","binary"]:
                 # read the data
                 if self.real:
-                    if keyword == "values":
-                        i = 0
-                        a = numpy.zeros(self.npoints*self.nvars, dtype="float64")
-                        while (i < self.npoints*self.nvars):
-                            t = string.split(f.readline(),"\t")
-                            if len(t) < 2:
-                                continue
-                            else:
-                                a[i] = string.atof(t[1])
-                            i += 1
-                    else: ## keyword = "binary"
-                        a = numpy.frombuffer(f.read(self.nvars*self.npoints*8),
-                                             dtype="float64")
-                    aa = a.reshape(self.npoints,self.nvars)
-                    self.vectors[0].set_data(aa[:,0])
-                    self.current_plot.set_scalevector(self.vectors[0])
-                    for n in xrange(1,self.nvars):
-                        self.vectors[n].set_data(aa[:,n])
-                        self.current_plot.append_datavector(self.vectors[n])
-                        
-                else: # complex data
-                    if keyword == "values":
-                        i = 0
-                        a = numpy.zeros(self.npoints*self.nvars*2, dtype="float64")
-                        while (i < self.npoints*self.nvars*2):
-                            t = string.split(f.readline(),"\t")
-                            if len(t) < 2:  ## empty lines
-                                continue
-                            else:
-                                t = string.split(t[1],",")
-                                a[i] = string.atof(t[0])
-                                i += 1
-                                a[i] = string.atof(t[1])
-                                i += 1
-                    else: ## keyword = "binary"
-                        a = numpy.frombuffer(f.read(self.nvars*self.npoints*8*2),
-                                             dtype="float64")
-                    aa = a.reshape(self.npoints, self.nvars*2)
-                    self.vectors[0].set_data(aa[:,0]) ## only the real part!
-                    self.current_plot.set_scalevector(self.vectors[0])
-                    for n in xrange(1,self.nvars):
-                        self.vectors[n].set_data(numpy.array(aa[:,2*n]+
-                                                             1j*aa[:,2*n+1]))
-                        self.current_plot.append_datavector(self.vectors[n])
+                    ncols = self.nvars
+                else:
+                    ncols = self.nvars*2
+                self.format = keyword
+                ## vectors without own dims= get the plot dimensions
+                for variable in self.variables:
+                    if len(variable[3]) == 0:
+                        variable[3] = list(self.current_plot.dimensions)
+                for vector in self.vectors:
+                    if len(vector.dimensions) == 0:
+                        vector.dimensions = list(self.current_plot.dimensions)
+                if headers_only:
+                    self.skip_data(f, ncols)
+                    return self.current_plot
+                if keyword == "values":
+                    aa = self.read_values(f, ncols)
+                else: ## keyword = "binary"
+                    aa = self.read_binary(f, ncols)
+                if self.compact:
+                    return self.make_compact_plot(aa)
+                if not self.real:
+                    ## complex view of the interleaved data, no copy
+                    cc = aa.view("complex128")
+
+                ## without mmap the selected columns are copied, the
+                ## full data block can be released afterwards
+                copy = self.selection is not None and not self.mmap
+                for n, vector in zip(self.columns, self.vectors):
+                    if self.real or n == 0:
+                        ## a complex scale is a real view, the pages of
+                        ## the imaginary part are not touched
+                        data = aa[:,n]
+                    else:
+                        data = cc[:,n]
+                    if copy and data.base is not None:
+                        data = numpy.array(data)
+                    vector.set_data(data)
+                    if n == 0 and not self.real:
+                        vector.imag = aa[:,1]
+                        if copy:
+                            vector.imag = numpy.array(vector.imag)
+                    if n == 0:
+                        self.current_plot.set_scalevector(vector)
+                    else:
+                        self.current_plot.append_datavector(vector)
                         
-                # create new plot after the data
-                self.plots.append(self.current_plot)
-                self.set_default_values()
+                return self.current_plot
 
             elif string.strip(keyword) == "": ## ignore empty lines
                 continue
@@ -294,12 +655,468 @@ class spice_read(object):
             else:
                 print 'Error: strange line in rawfile:\n\t"'  \
                       +line + '"\n\t load aborted'
-                return 0
+                return None
+
+    def make_compact_plot(self, aa):
+        """
+        Create a compact_plot of the current plot from the data block aa
+        """
+        if not self.real:
+            aa = aa.view("complex128")
+        if self.selection is not None:
+            ## the selected columns are copied into a new array
+            aa = aa[:,self.columns]
+        p = self.current_plot
+        return compact_plot(aa, [v.name for v in self.vectors],
+                            [v.type for v in self.vectors],
+                            [v.dimensions for v in self.vectors],
+                            title=p.title, date=p.date, plotname=p.plotname,
+                            plottype=p.plottype, dimensions=p.dimensions,
+                            data_offset=p.data_offset)
+
+    def read_binary(self, f, ncols):
+        """
+        Read the binary data block of the current plot and return it as
+        (npoints, ncols) float64 array. In mmap mode only the data offset
+        is recorded and the array is a numpy.memmap of the file. The
+        memmap is used for a vector selection, too.
+        """
+        nbytes = self.npoints*ncols*8
+        offset = f.tell()
+        self.current_plot.data_offset = offset
+        if (self.mmap or self.selection is not None) and nbytes > 0:
+            aa = numpy.memmap(self.filename, dtype="float64", mode="r",
+                              offset=offset, shape=(self.npoints, ncols))
+            f.seek(offset + nbytes)
+        else:
+            aa = numpy.frombuffer(f.read(nbytes), dtype="float64")
+            aa = aa.reshape(self.npoints, ncols)
+        return aa
+
+    def read_values(self, f, ncols):
+        """
+        Read the ASCII "Values:" block of the current plot and return it as
+        (npoints, ncols) float64 array. Complex values are written as
+        "re,im" pairs, each of them counts as two columns.
+
+        Each value is on a line of its own that contains a tab, the first
+        value of a point is prefixed by the point index. The block is
+        tokenized with numpy in chunks of about VALUES_CHUNK values (see
+        iter_values_rows()), so only the array and one chunk of text are
+        held in memory. If the file is truncated, only the complete points
+        are returned.
+        """
+        offset = f.tell()
+        self.current_plot.data_offset = offset
+        aa = numpy.empty((self.npoints, ncols))
+        npoints = 0
+        for rows in self.iter_values_rows(f, self.npoints*self.nvars, ncols,
+                                          ncols != self.nvars,
+                                          max(VALUES_CHUNK // ncols, 1)):
+            rows = rows[:self.npoints-npoints]
+            aa[npoints:npoints+len(rows)] = rows
+            npoints += len(rows)
+
+        if npoints < self.npoints:
+            print 'Warning: "Values" block truncated, only %i of %i points' \
+                  ' read' %(npoints, self.npoints)
+            self.npoints = npoints
+            aa = aa[:npoints]
+        return aa
+
+    def iter_chunks(self, n=0, chunksize=65536):
+        """
+        Iterate over the data of the n-th plot in chunks of chunksize
+        points without reading the whole data block. Each chunk is an
+        (points, columns) array with a column for the scale and for each
+        selected vector (see the vectors option of spice_read). The chunks
+        of complex plots are complex128 arrays, including the scale.
+        """
+        info = self.get_index()[n]
+        columns = [int(v[0]) for v in info["variables"]
+                   if self.is_selected(int(v[0]), v[1])]
+        if info["real"]:
+            ncols = info["nvars"]
+        else:
+            ncols = info["nvars"]*2
+        f = open(self.filename, "rb")
+        try:
+            f.seek(info["data_offset"])
+            if info["format"] == "binary":
+                rows = self.iter_binary_rows(f, info["npoints"], ncols,
+                                             chunksize)
+            else:
+                rows = self.iter_values_rows(f, info["npoints"]*info["nvars"],
+                                             ncols, not info["real"],
+                                             chunksize)
+            for aa in rows:
+                if not info["real"]:
+                    aa = aa.view("complex128")
+                yield aa[:,columns]
+        finally:
+            f.close()
+
+    def iter_binary_rows(self, f, npoints, ncols, chunksize):
+        """
+        Iterate over a binary data block in (chunksize, ncols) arrays.
+        """
+        while npoints > 0:
+            buf = f.read(min(chunksize, npoints)*ncols*8)
+            rows = len(buf) // (ncols*8)
+            if rows == 0:  ## EOF, truncated file
+                return
+            yield numpy.frombuffer(buf, dtype="float64",
+                                   count=rows*ncols).reshape(rows, ncols)
+            npoints -= rows
+
+    def iter_values_rows(self, f, nlines, ncols, iscomplex, chunksize):
+        """
+        Iterate over an ASCII data block with nlines value lines in
+        (chunksize, ncols) arrays. The text is read in blocks of about
+        the size of a chunk. At the end the file position is behind the
+        last value line.
+        """
+        blocksize = max(chunksize*ncols*24, 65536)
+        pending = numpy.zeros(0)
+        carry = ""
+        while nlines > 0:
+            chunk = f.read(blocksize)
+            text = carry + chunk
+            if chunk:
+                n, end = count_value_lines(text, nlines)
+            else:  ## EOF, truncated file
+                n, end = nlines, len(text)
+            nlines -= n
+            carry = text[end:]
+            pending = numpy.concatenate((pending,
+                                         parse_values(text[:end], iscomplex)))
+            while len(pending) >= chunksize*ncols:
+                yield pending[:chunksize*ncols].reshape(chunksize, ncols)
+                pending = pending[chunksize*ncols:]
+            if not chunk:
+                break
+        f.seek(-len(carry), 1)
+        rows = len(pending) // ncols
+        if rows > 0:
+            yield pending[:rows*ncols].reshape(rows, ncols)
+
+    def skip_data(self, f, ncols):
+        """
+        Move the file position behind the data block of the current plot
+        without parsing the data.
+        """
+        offset = f.tell()
+        self.current_plot.data_offset = offset
+        if self.format == "binary":
+            f.seek(offset + self.npoints*ncols*8)
+            return
+        ## count the ASCII value lines block by block, the memory usage
+        ## does not depend on the size of the block
+        nlines = self.npoints*self.nvars
+        carry = ""
+        while nlines > 0:
+            chunk = f.read(1 << 20)
+            if chunk == "":  ## EOF, truncated file
+                return
+            text = carry + chunk
+            n, end = count_value_lines(text, nlines)
+            nlines -= n
+            offset += end
+            carry = text[end:]
+        f.seek(offset)
+
+    def build_index(self):
+        """
+        Scan the headers of all plots in the file and return the plot index.
+        The index is a list with a dictionary for each plot containing the
+        header attributes, the variable table (number, name, type and
+        dimensions of each vector) and the byte offsets of the
+        plot header and its data block.
+        """
+        index = []
+        f = open(self.filename, "rb")
+        while (1):
+            offset = f.tell()
+            plot = self.read_plot(f, headers_only=True)
+            if plot is None:
+                break
+            index.append(dict(offset=offset,
+                              data_offset=plot.data_offset,
+                              title=plot.title,
+                              date=plot.date,
+                              plotname=plot.plotname,
+                              real=self.real,
+                              padded=self.padded,
+                              format=self.format,
+                              nvars=self.nvars,
+                              npoints=self.npoints,
+                              dimensions=plot.dimensions,
+                              variables=self.variables))
+        f.close()
+        self.set_default_values()
+        return index
+
+    def index_filename(self):
+        return self.filename + ".index"
+
+    def write_index(self, filename=None):
+        """
+        Write the plot index as json sidecar file. The size and the
+        modification time of the raw file are stored to detect changes.
+        """
+        if filename is None:
+            filename = self.index_filename()
+        st = os.stat(self.filename)
+        json.dump(dict(version=INDEX_VERSION, size=st.st_size,
+                       mtime=st.st_mtime, plots=self.get_index()),
+                  open(filename, "w"))
+
+    def read_index(self, filename=None):
+        """
+        Return the plot index from the sidecar file. If the sidecar file
+        is missing or outdated, the raw file is scanned instead.
+        """
+        if filename is None:
+            filename = self.index_filename()
+        try:
+            sidecar = json.load(open(filename))
+            st = os.stat(self.filename)
+            if sidecar.get("version") == INDEX_VERSION and \
+               sidecar["size"] == st.st_size and \
+               sidecar["mtime"] == st.st_mtime:
+                return sidecar["plots"]
+        except (IOError, ValueError, KeyError):
+            pass
+        return self.build_index()
+
+    def get_index(self):
+        """
+        Return the plot index, see build_index()
+        """
+        if self.index is None:
+            self.index = self.build_index()
+        return self.index
+
+    def plot(self, n):
+        """
+        Return the n-th plot of the file. In lazy mode the plot is read
+        starting at its offset from the plot index.
+        """
+        if not self.lazy:
+            return self.plots[n]
+        f = open(self.filename, "rb")
+        f.seek(self.get_index()[n]["offset"])
+        plot = self.read_plot(f)
+        f.close()
+        return plot
+
+    def iter_plots(self):
+        """
+        Iterate over all plots of the file. In lazy mode only a single
+        plot is read at a time.
+        """
+        if not self.lazy:
+            for plot in self.plots:
+                yield plot
+        else:
+            for n in xrange(len(self.get_index())):
+                yield self.plot(n)
 
     def get_plots(self):
+        if self.lazy:
+            return list(self.iter_plots())
         return self.plots
 
 
+class growing_array(object):
+    """
+    A 2-D array that grows along the first axis. The capacity is doubled
+    when it is exhausted, so appending rows costs amortized O(1).
+    """
+
+    def __init__(self, ncols, dtype="float64", capacity=1024):
+        self.buffer = numpy.empty((capacity, ncols), dtype=dtype)
+        self.size = 0
+
+    def append(self, rows):
+        """
+        Append the rows of a (n, ncols) array
+        """
+        size = self.size + len(rows)
+        if size > len(self.buffer):
+            capacity = max(size, 2*len(self.buffer))
+            buffer = numpy.empty((capacity, self.buffer.shape[1]),
+                                 dtype=self.buffer.dtype)
+            buffer[:self.size] = self.buffer[:self.size]
+            self.buffer = buffer
+        self.buffer[self.size:size] = rows
+        self.size = size
+
+    def get_data(self):
+        """
+        returns a view of the filled part of the buffer
+        """
+        return self.buffer[:self.size]
+
+
+class spice_follow(spice_read):
+    """
+    Follow the first plot of a raw file that is still written by the
+    simulator, like "tail -f". Each call of update() appends the newly
+    completed points to the vectors of the plot.
+
+    The "No. Points:" header is not reliable while the file is written:
+    ngspice writes "No. Points: 0" first and patches the real number when
+    the simulation ends. While it is zero the header is read again by each
+    update(). The plot is only considered complete if it is not zero and
+    that number of points has been read.
+    """
+
+    def __init__(self, filename, vectors=None):
+        self.set_options(filename, vectors=vectors)
+        self.plot_buffer = None
+        self.data_offset = 0
+        self.position = 0   ## file position of the first unread point
+
+    def header_complete(self):
+        """
+        Check whether the simulator has written the whole plot header
+        """
+        f = open(self.filename, "rb")
+        text = ""
+        while True:
+            chunk = f.read(65536)
+            if chunk == "":
+                f.close()
+                return False
+            text += chunk
+            if DATA_KEYWORD_RE.search(text):
+                f.close()
+                return True
+
+    def read_header(self):
+        """
+        Read the plot header and prepare the vectors and the buffer
+        """
+        f = open(self.filename, "rb")
+        plot = self.read_plot(f, headers_only=True)
+        f.close()
+        if plot is None:
+            return False
+        if self.real:
+            dtype = "float64"
+        else:
+            dtype = "complex128"
+        self.plot_buffer = growing_array(len(self.columns), dtype=dtype)
+        self.position = plot.data_offset
+        self.data_offset = plot.data_offset
+        for n, vector in zip(self.columns, self.vectors):
+            if n == 0:
+                plot.set_scalevector(vector)
+            else:
+                plot.append_datavector(vector)
+        self.plots = [plot]
+        self.set_vector_data()
+        return True
+
+    def read_npoints(self):
+        """
+        Read the "No. Points:" line of the header again, the simulator
+        patches it when it is finished
+        """
+        f = open(self.filename, "rb")
+        header = f.read(self.data_offset)
+        f.close()
+        m = NPOINTS_RE.search(header)
+        if m:
+            self.npoints = int(m.group(1))
+        return self.npoints
+
+    def set_vector_data(self):
+        ## the buffer may be reallocated, update the views of the vectors
+        data = self.plot_buffer.get_data()
+        for i, (n, vector) in enumerate(zip(self.columns, self.vectors)):
+            if n == 0 and not self.real:
+                vector.set_data(data[:,0].real)  ## only the real part!
+            else:
+                vector.set_data(data[:,i])
+
+    def complete(self):
+        """
+        Check whether all points of the plot header have been read
+        """
+        return self.plot_buffer is not None and self.npoints > 0 \
+               and self.plot_buffer.size >= self.npoints
+
+    def update(self):
+        """
+        Read the points that have been completed since the last update and
+        append them to the vectors of the plot.
+        Returns the number of new points.
+        """
+        if self.plot_buffer is None:
+            if not self.header_complete() or not self.read_header():
+                return 0
+        if self.npoints == 0:
+            self.read_npoints()
+        if self.complete():
+            return 0
+        if self.real:
+            ncols = self.nvars
+        else:
+            ncols = self.nvars*2
+
+        f = open(self.filename, "rb")
+        f.seek(self.position)
+        buf = f.read()
+        f.close()
+        if self.format == "binary":
+            rows = len(buf) // (ncols*8)
+            end = rows*ncols*8
+            a = numpy.frombuffer(buf, dtype="float64", count=rows*ncols)
+        else:
+            ## only use complete points, each value has its own line
+            n, end = count_value_lines(buf, len(buf))
+            n, end = count_value_lines(buf, n - n % self.nvars)
+            a = parse_values(buf[:end], not self.real)
+            rows = len(a) // ncols
+        if self.npoints > 0:
+            rows = min(rows, self.npoints - self.plot_buffer.size)
+        if rows == 0:
+            return 0
+        aa = a[:rows*ncols].reshape(rows, ncols)
+        if not self.real:
+            aa = aa.view("complex128")
+        self.plot_buffer.append(aa[:,self.columns])
+        self.position += end
+        self.set_vector_data()
+        return rows
+
+    def follow(self, interval=0.5, done=None):
+        """
+        Generator that polls the file every interval seconds and yields
+        the plot whenever new points have been appended. It stops when the
+        plot is complete or when the callable done returns True, e.g.
+        done=lambda: process.poll() is not None for a running ngspice.
+        Breaking out of the loop aborts the reading at any time.
+        """
+        while True:
+            finished = done is not None and done()
+            if self.update() > 0:
+                yield self.plots[0]
+            if finished or self.complete():
+                return
+            time.sleep(interval)
+
+    def get_plot(self):
+        """
+        returns the followed plot or None if the header is not written yet
+        """
+        if self.plots:
+            return self.plots[0]
+        return None
+
+
 if __name__ == "__main__":
     ## plot out some informations about the spice files given by commandline
     for f in sys.argv[1:]:
@@ -310,6 +1127,7 @@ if __name__ == "__main__":
             print '    Date: ', p.date
             print '    Plotname: ', p.plotname
             print '    Plottype: ' , p.plottype
+            print '    Dimensions: ', p.dimensions
 
             s = p.get_scalevector()
             print '    The Scale vector has the following properties:'
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+"""
+Generator for synthetic ngspice raw files.
+
+The files follow the layout of raw_write() in ngspice ./src/frontend/rawfile.c
+and can be used to test and benchmark spice_read without a simulator.
+The data of a plot is a deterministic function of the point index, it can
+be recreated with synthetic_data() to check the parsed values.
+"""
+
+import sys, getopt
+import numpy
+
+## number of points that are generated and written at once
+CHUNK_POINTS = 16384
+
+def synthetic_data(start, stop, nvars, real=True, plot=0):
+    """
+    Return the points start..stop-1 of a synthetic plot as (points, nvars)
+    array. Real plots have a time scale and sine waves, complex plots a
+    logarithmic frequency scale and first order lowpass responses.
+    """
+    n = numpy.arange(start, stop, dtype="float64")[:,numpy.newaxis]
+    k = numpy.arange(1, nvars, dtype="float64")[numpy.newaxis,:]
+    if real:
+        scale = n * 1e-9
+        data = numpy.sin(2*numpy.pi*1e6*scale*k + plot) * k
+    else:
+        scale = 10**(n/1000.0) + 0j
+        data = k / (1 + 1j*scale.real/(1e3*k)) + plot
+    return numpy.hstack((scale, data))
+
+def format_ascii(data, start):
+    """
+    Format the points of data, starting with point number start, as
+    ngspice ASCII values.
+    """
+    npoints, nvars = data.shape
+    if numpy.iscomplexobj(data):
+        value = "%.15e,%.15e"
+        values = numpy.empty((npoints, 2*nvars+1))
+        values[:,1::2] = data.real
+        values[:,2::2] = data.imag
+    else:
+        value = "%.15e"
+        values = numpy.empty((npoints, nvars+1))
+        values[:,1:] = data
+    values[:,0] = numpy.arange(start, start+npoints)
+    fmt = " %d\t" + value + "\n" + ("\t" + value + "\n")*(nvars-1) + "\n"
+    return (fmt*npoints) %tuple(values.ravel())
+
+def write_rawfile(filename, nvars=4, npoints=1000, nplots=1, real=True,
+                  binary=True, padded=True):
+    """
+    Write a synthetic raw file with nplots plots of nvars variables
+    (including the scale) and npoints points each.
+    real selects real (transient) or complex (ac) data, binary selects
+    a "Binary:" or an ASCII "Values:" block. padded only sets the flag,
+    all vectors have the full length.
+    """
+    f = open(filename, "wb")
+    for plot in xrange(nplots):
+        if real:
+            flags = "real"
+            plotname = "Transient Analysis"
+            variables = ["\t0\ttime\ttime"]
+            vtype = "voltage"
+        else:
+            flags = "complex"
+            plotname = "AC Analysis"
+            variables = ["\t0\tfrequency\tfrequency grid=3"]
+            vtype = "voltage"
+        if not padded:
+            flags += " unpadded"
+        for i in xrange(1, nvars):
+            variables.append("\t%i\tv(%i)\t%s" %(i, i, vtype))
+        f.write("Title: synthetic plot %i\n" %(plot))
+        f.write("Date: Thu Jan  1 00:00:00  1970\n")
+        f.write("Plotname: %s\n" %(plotname))
+        f.write("Flags: %s\n" %(flags))
+        f.write("No. Variables: %i\n" %(nvars))
+        f.write("No. Points: %i\n" %(npoints))
+        f.write("Variables:\n" + "\n".join(variables) + "\n")
+        if binary:
+            f.write("Binary:\n")
+        else:
+            f.write("Values:\n")
+        for start in xrange(0, npoints, CHUNK_POINTS):
+            stop = min(start + CHUNK_POINTS, npoints)
+            data = synthetic_data(start, stop, nvars, real, plot)
+            if binary:
+                f.write(data.tostring())
+            else:
+                f.write(format_ascii(data, start))
+    f.close()
+
+
+def usage():
+    print "usage: " +  sys.argv[0] + """ [options] rawfile
+  -h --help: print help information
+  -n --npoints: number of points per plot (default: 1000)
+  -m --nvars: number of variables including the scale (default: 4)
+  -p --plots: number of plots (default: 1)
+  -c --complex: write complex ac data instead of real transient data
+  -a --ascii: write ASCII values instead of binary data
+  -u --unpadded: set the unpadded flag"""
+
+
+if __name__ == "__main__":
+    options = dict(npoints=1000, nvars=4, nplots=1, real=True, binary=True,
+                   padded=True)
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hn:m:p:cau",
+                                   ["help", "npoints=", "nvars=", "plots=",
+                                    "complex", "ascii", "unpadded"])
+    except getopt.GetoptError, err:
+        print str(err)
+        usage()
+        sys.exit(2)
+
+    if len(args) != 1:
+        usage()
+        sys.exit(2)
+
+    for k,v in opts:
+        if k in ('-h', '--help'):
+            usage()
+            sys.exit(0)
+        elif k in ('-n', '--npoints'):
+            options['npoints'] = int(v)
+        elif k in ('-m', '--nvars'):
+            options['nvars'] = int(v)
+        elif k in ('-p', '--plots'):
+            options['nplots'] = int(v)
+        elif k in ('-c', '--complex'):
+            options['real'] = False
+        elif k in ('-a', '--ascii'):
+            options['binary'] = False
+        elif k in ('-u', '--unpadded'):
+            options['padded'] = False
+
+    write_rawfile(args[0], **options)
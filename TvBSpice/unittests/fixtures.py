@@ -0,0 +1,38 @@
+'''
+temporary files shared by the TvBSpice unittests
+'''
+import os
+import shutil
+import tempfile
+
+def make_tempfile(suffix):
+    '''
+    Create an empty temporary file and return its name
+    '''
+    fd, filename = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return filename
+
+def tempfile_name(suffix):
+    '''
+    Return the name of a temporary file that does not exist yet
+    '''
+    filename = make_tempfile(suffix)
+    os.remove(filename)
+    return filename
+
+def remove_files(*filenames):
+    '''
+    Remove the files that exist
+    '''
+    for f in filenames:
+        if os.path.exists(f):
+            os.remove(f)
+
+def make_tempdir(testcase):
+    '''
+    Create a temporary directory that is removed after the test
+    '''
+    tmpdir = tempfile.mkdtemp()
+    testcase.addCleanup(shutil.rmtree, tmpdir, True)
+    return tmpdir
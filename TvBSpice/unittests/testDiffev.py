@@ -0,0 +1,339 @@
+'''
+tests the diffev module for TvBSpice
+'''
+import unittest
+import fixtures
+import diffev
+import multiprocessing.pool
+import numpy as np
+import threading
+import time
+import os
+
+def sphere(x):
+    return float(np.sum(x**2))
+
+def sphere_batch(batch):
+    return np.sum(batch**2, axis=1)
+
+def kill_worker(x):
+    os._exit(9)
+
+class DiffevTest(unittest.TestCase):
+    '''
+    Compare the vectorized generation with the candidate by candidate one
+    '''
+    def setUp(self):
+        self.prng = np.random.RandomState(42)
+        self.de = diffev.DiffEvolver.frombounds(sphere, [-5, -1, 0], [5, 1, 10], 20,
+                                                prng=self.prng)
+
+    def testSelectSamples(self):
+        candidates = np.arange(20).repeat(500)
+        samples = self.de.select_samples_all(candidates, 4)
+        self.assertEqual(samples.shape, (10000, 4))
+        self.assertFalse(np.any(samples == candidates[:,np.newaxis]))
+        self.assertTrue(np.all(np.diff(np.sort(samples, axis=1), axis=1) > 0))
+        ## every other member is drawn equally often at every position
+        counts = np.bincount(samples[candidates == 3][:,0], minlength=20)
+        self.assertEqual(counts[3], 0)
+        self.assertTrue(np.all(np.abs(counts[counts > 0] - 500/19.) < 20))
+
+    def testTrialDistribution(self):
+        n = 20000
+        for strategy in self.de.jump_table:
+            self.de.strategy = strategy
+            sequential = np.array([self.de.get_trial(5) for i in xrange(n)])
+            vectorized = self.de.get_trials([5]*n)
+            std = sequential.std(axis=0)
+            self.assertTrue(np.all(np.abs(sequential.mean(axis=0) - vectorized.mean(axis=0))
+                                   < 0.05*std + 1e-12), strategy)
+            self.assertTrue(np.all(np.abs(std - vectorized.std(axis=0)) < 0.05*std + 1e-12),
+                            strategy)
+            ## unchanged components by the crossover
+            self.assertTrue(abs(np.mean(sequential == self.de.population[5]) -
+                                np.mean(vectorized == self.de.population[5])) < 0.02)
+
+    def testBounds(self):
+        trials = self.prng.uniform(-20, 20, size=(20, 3))
+        candidates = np.arange(20)
+        for mode in ('limit', 'mirror', 'halfway', 'old'):
+            self.de.set_boundaries(np.array([-5, -1, 0]), np.array([5, 1, 10]), mode)
+            bounded, valid = self.de.bound_trials(candidates, trials)
+            self.assertTrue(valid.all())
+            for c in candidates:
+                self.assertTrue(np.all(bounded[c] == self.de.bound(c, trials[c])), mode)
+
+    def testReject(self):
+        self.de.set_boundaries(np.array([-5, -1, 0]), np.array([5, 1, 10]), 'reject')
+        self.de.scale = 2.0
+        trials, valid = self.de.bound_trials(np.arange(20), self.de.get_trials())
+        self.assertTrue(valid.all())
+        self.assertTrue(np.all((trials >= self.de.lbound) & (trials <= self.de.ubound)))
+        self.de.reject_tries = 0
+        self.de.lbound = np.array([10, 10, 10])
+        trials, valid = self.de.bound_trials(np.arange(20), self.de.get_trials())
+        self.assertFalse(valid.any())
+
+    def testSolve(self):
+        self.de.set_boundaries(np.array([-5, -1, 0]), np.array([5, 1, 10]), 'mirror')
+        best = self.de.solve(200, vectorized=True)
+        self.assertTrue(sphere(best) < 1e-4)
+        self.assertEqual(self.de.best_value, min(self.de.pop_values))
+        self.assertEqual(len(self.de.best_val_history), self.de.generations)
+        self.assertTrue(np.all(np.diff(self.de.best_val_history) <= 0))
+
+    def solve_with(self, evaluator, func=sphere):
+        de = diffev.DiffEvolver.frombounds(func, [-5, -1, 0], [5, 1, 10], 16,
+                                           prng=np.random.RandomState(3),
+                                           evaluator=evaluator)
+        de.set_boundaries(np.array([-5, -1, 0]), np.array([5, 1, 10]), 'reject')
+        de.solve(20, vectorized=True)
+        de.close()
+        return de
+
+    def testEvaluators(self):
+        serial = self.solve_with(None)
+        for evaluator, func in [(diffev.ThreadPoolEvaluator(3), sphere),
+                                (diffev.ProcessPoolEvaluator(2), sphere),
+                                (diffev.ProcessPoolEvaluator(4, chunksize=3), sphere),
+                                (diffev.PoolEvaluator(multiprocessing.pool.ThreadPool, 2), sphere),
+                                (diffev.Evaluator(), sphere),
+                                (diffev.BatchEvaluator(), sphere_batch)]:
+            de = self.solve_with(evaluator, func)
+            self.assertTrue(np.all(de.population == serial.population))
+            self.assertEqual(de.best_val_history, serial.best_val_history)
+            self.assertEqual(getattr(evaluator, 'pool', None), None)
+        ## the sequential mode passes single vectors to the evaluator
+        de = diffev.DiffEvolver(sphere_batch, self.de.population,
+                                evaluator=diffev.BatchEvaluator())
+        self.assertEqual(de.pop_values, self.de.pop_values)
+        de.solve(2)
+        self.assertRaises(ValueError, diffev.BatchEvaluator(), sphere,
+                          self.de.population)
+
+    def testAsync(self):
+        self.de.set_boundaries(np.array([-5, -1, 0]), np.array([5, 1, 10]), 'reject')
+        best = self.de.solve_async(300)
+        self.assertTrue(sphere(best) < 1e-4)
+        self.assertEqual(len(self.de.best_val_history), self.de.generations)
+        self.assertTrue(np.all(np.diff(self.de.best_val_history) <= 0))
+        self.assertEqual(self.de.pending, {})
+        self.assertEqual(self.de.best_value, min(self.de.pop_values))
+
+    def testAsyncInflight(self):
+        lock = threading.Lock()
+        running = [0, 0, 0]   ## running, maximum, calls
+        def slow(x):
+            lock.acquire()
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+            running[2] += 1
+            lock.release()
+            time.sleep(0.001 + 0.01*(x[0] > 0))
+            lock.acquire()
+            running[0] -= 1
+            lock.release()
+            return sphere(x)
+        de = diffev.DiffEvolver.frombounds(slow, [-5, -1, 0], [5, 1, 10], 8,
+                                           prng=self.prng,
+                                           evaluator=diffev.ThreadPoolEvaluator(8))
+        de.eps = 0
+        running[1] = running[2] = 0
+        de.solve_async(5, inflight=4)
+        self.assertEqual(running[1], 4)
+        self.assertEqual(running[2], 40)
+        self.assertEqual(de.generations, 5)
+        self.assertEqual(len(de.best_val_history), 5)
+        self.assertEqual(de.pending, {})
+
+        def fail(x):
+            raise ValueError("simulation failed")
+        de.func = fail
+        self.assertRaises(ValueError, de.solve_async, 1)
+        ## the trials and results of the failed run are dropped
+        self.assertEqual(de.pending, {})
+        de.func = slow
+        de.solve_async(1, inflight=4)
+        self.assertEqual(de.generations, 6)
+        de.close()
+
+    def testLostWorker(self):
+        evaluator = diffev.ProcessPoolEvaluator(2, poll_interval=0.1)
+        de = diffev.DiffEvolver.frombounds(sphere, [-5, -1, 0], [5, 1, 10], 8,
+                                           prng=self.prng, evaluator=evaluator)
+        de.func = kill_worker
+        self.assertRaises(RuntimeError, de.solve_async, 1)
+        self.assertEqual(de.pending, {})
+        de.func = sphere
+        de.solve_async(1)
+        self.assertEqual(de.generations, 1)
+        de.close()
+
+class CacheTest(unittest.TestCase):
+    '''
+    Look up function values in memory and in a shared database
+    '''
+    def setUp(self):
+        self.tmpdir = fixtures.make_tempdir(self)
+        self.filename = os.path.join(self.tmpdir, 'fitness.db')
+
+    def testCache(self):
+        cache = diffev.FitnessCache(resolution=[0.1, 1], maxsize=2)
+        cache.put([1.02, 5.3], 1.0)
+        self.assertEqual(cache.lookup([0.98, 4.7]), 1.0)
+        self.assertEqual(cache.lookup([1.06, 5.3]), None)
+        cache.put([-0.01, 0], 2.0)
+        self.assertEqual(cache.lookup([0.01, 0]), 2.0)
+        cache.put([3, 3], 3.0)
+        ## least recently used
+        self.assertEqual(cache.lookup([1, 5]), None)
+        self.assertEqual(cache.lookup([0, 0]), 2.0)
+        self.assertEqual((cache.hits, cache.misses), (3, 2))
+        self.assertAlmostEqual(cache.hit_rate(), 0.6)
+
+    def testDatabase(self):
+        first = diffev.FitnessCache(filename=self.filename, namespace='schmitt')
+        first.put([1, 2], 0.5)
+        first.put([1, 3], float('nan'))
+        second = diffev.FitnessCache(filename=self.filename, namespace='schmitt')
+        other = diffev.FitnessCache(filename=self.filename, namespace='other')
+        self.assertEqual(second.lookup([1, 2]), 0.5)
+        self.assertEqual(second.lookup([1, 2]), 0.5)
+        self.assertEqual(second.lookup([1, 3]), None)
+        self.assertEqual(other.lookup([1, 2]), None)
+        self.assertEqual((second.hits, second.disk_hits), (2, 1))
+        for c in (first, second, other):
+            c.close()
+
+    def solve_with(self, cache, asynchronous=False):
+        calls = [0]
+        def counted(x):
+            calls[0] += 1
+            return sphere(x)
+        de = diffev.DiffEvolver.frombounds(counted, [-5, -1, 0], [5, 1, 10], 12,
+                                           prng=np.random.RandomState(5),
+                                           cache=cache)
+        de.set_boundaries(np.array([-5, -1, 0]), np.array([5, 1, 10]), 'limit')
+        de.scale = 1.5
+        de.eps = 0
+        if asynchronous:
+            de.solve_async(10, inflight=4)
+        else:
+            de.solve(10, vectorized=True)
+        return de, calls[0]
+
+    def testDiffEvolver(self):
+        ref, ncalls = self.solve_with(None)
+        self.assertEqual(ncalls, 12*11)
+        cache = diffev.FitnessCache(filename=self.filename)
+        de, ncalls = self.solve_with(cache)
+        ## the clamped trials hit the corners of the bounds again
+        self.assertTrue(cache.hits > 0)
+        self.assertEqual(ncalls, cache.misses)
+        self.assertEqual(cache.hits + cache.misses, 12*11)
+        self.assertTrue(np.all(de.population == ref.population))
+        self.assertEqual(de.best_val_history, ref.best_val_history)
+        de.close()
+        ## a second run finds everything in the database
+        cache = diffev.FitnessCache(filename=self.filename)
+        de, ncalls = self.solve_with(cache)
+        self.assertEqual(ncalls, 0)
+        self.assertEqual(cache.hit_rate(), 1.0)
+        de.close()
+
+    def testAsync(self):
+        ## a hit finishes its trial at once, before the trials in flight
+        runs = []
+        for i in xrange(2):
+            cache = diffev.FitnessCache()
+            de, ncalls = self.solve_with(cache, asynchronous=True)
+            self.assertTrue(cache.hits > 0)
+            self.assertEqual(ncalls, cache.misses)
+            self.assertEqual(cache.hits + cache.misses, 12*11)
+            runs.append(de)
+        self.assertTrue(np.all(runs[0].population == runs[1].population))
+
+class Crash(Exception):
+    pass
+
+class CheckpointTest(unittest.TestCase):
+    '''
+    Interrupt runs and resume them from their checkpoints
+    '''
+    def setUp(self):
+        self.tmpdir = fixtures.make_tempdir(self)
+        self.path = os.path.join(self.tmpdir, 'run.npz')
+
+    def make(self, func=sphere, mode='reject'):
+        de = diffev.DiffEvolver.frombounds(func, [-5, -1, 0], [5, 1, 10], 12,
+                                           prng=np.random.RandomState(7))
+        de.set_boundaries(np.array([-5, -1, 0]), np.array([5, 1, 10]), mode)
+        de.eps = 0
+        return de
+
+    def crashing(self, ncalls):
+        calls = [0]
+        def func(x):
+            calls[0] += 1
+            if calls[0] > ncalls:
+                raise Crash()
+            return sphere(x)
+        return func
+
+    def assertSameRun(self, de, ref):
+        self.assertTrue(np.all(de.population == ref.population))
+        self.assertEqual(list(de.pop_values), list(ref.pop_values))
+        self.assertEqual(de.best_val_history, ref.best_val_history)
+        self.assertTrue(np.all(np.array(de.best_vec_history) ==
+                               np.array(ref.best_vec_history)))
+        self.assertEqual(de.generations, ref.generations)
+        self.assertTrue(np.all(de.prng.rand(3) == ref.prng.rand(3)))
+
+    def testSequential(self):
+        ref = self.make(mode='mirror')
+        ref.solve(10)
+        de = self.make(self.crashing(12 + 5*12 + 5), mode='mirror')
+        de.set_checkpoint(self.path, every=2)
+        self.assertRaises(Crash, de.solve, 10)
+        self.assertEqual(os.listdir(self.tmpdir), ['run.npz'])
+
+        calls = [0]
+        def counted(x):
+            calls[0] += 1
+            return sphere(x)
+        de = diffev.DiffEvolver.resume(self.path, counted)
+        self.assertEqual(de.generations, 4)
+        self.assertEqual(calls[0], 0)
+        de.solve(6)
+        self.assertEqual(calls[0], 6*12)
+        self.assertSameRun(de, ref)
+
+    def testAsync(self):
+        ref = self.make()
+        ref.solve_async(10, inflight=5)
+        de = self.make(self.crashing(12 + 50))
+        de.set_checkpoint(self.path)
+        self.assertRaises(Crash, de.solve_async, 10, 5)
+
+        de = diffev.DiffEvolver.resume(self.path, sphere)
+        self.assertTrue(len(de.pending) > 0)
+        de.solve_async(10 - de.generations, inflight=5)
+        self.assertSameRun(de, ref)
+
+    def testErrors(self):
+        np.savez(self.path, population=np.zeros((3, 2)))
+        self.assertRaises(ValueError, diffev.DiffEvolver.resume, self.path)
+        de = self.make(lambda x: sphere(x))
+        de.checkpoint(self.path)
+        self.assertRaises(ValueError, diffev.DiffEvolver.resume, self.path)
+        de = diffev.DiffEvolver.resume(self.path, sphere)
+        self.assertEqual(de.bound_mode, 'reject')
+        ## func and args are restored from the checkpoint
+        self.make().checkpoint(self.path)
+        de = diffev.DiffEvolver.resume(self.path)
+        self.assertEqual(de.func, sphere)
+        self.assertEqual(de.args, ())
+
+if __name__ == "__main__":
+    unittest.main()
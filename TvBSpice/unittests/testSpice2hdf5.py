@@ -0,0 +1,184 @@
+'''
+tests the spice2hdf5 module for TvBSpice
+'''
+import unittest
+import fixtures
+import spice2hdf5
+import spice_read
+import spice_synth
+import numpy
+import tables
+import os
+
+class Spice2hdf5Test(unittest.TestCase):
+    '''
+    Store synthetic plots in HDF5 files and read them back with PyTables
+    '''
+    def setUp(self):
+        self.rawfile = fixtures.make_tempfile('.raw')
+        self.outfile = fixtures.tempfile_name('.hdf5')
+        
+    def tearDown(self):
+        fixtures.remove_files(self.rawfile, self.outfile)
+    
+    def readPlot(self, real=True, npoints=1000):
+        spice_synth.write_rawfile(self.rawfile, nvars=4, npoints=npoints, real=real)
+        return spice_read.spice_read(self.rawfile).get_plots()[0]
+        
+    def testRecords(self):
+        p = self.readPlot()
+        records = spice2hdf5.plot_records(p)
+        self.assertEqual(records.dtype.names, ('time', 'v(1)', 'v(2)', 'v(3)'))
+        self.assertTrue(numpy.may_share_memory(records, p.get_scalevector().get_data()),
+                        "Records of a real plot are not a view of the data block")
+        self.assertTrue(numpy.all(records['v(2)'] == p['v(2)'].get_data()))
+        
+        c = self.readPlot(real=False)
+        records = spice2hdf5.plot_records(c)
+        self.assertEqual(records.dtype['v(1)'], numpy.complex128)
+        self.assertEqual(records.dtype['frequency'], numpy.float64)
+        self.assertTrue(numpy.all(records['v(3)'] == c['v(3)'].get_data()))
+        
+    def testTable(self):
+        for real in (True, False):
+            p = self.readPlot(real=real, npoints=spice2hdf5.TABLE_CHUNK_ROWS + 10)
+            spice2hdf5.insert_spiceplot(p, outfile=self.outfile, path='/spiceplot', name='run')
+            h5file = tables.openFile(self.outfile)
+            table = h5file.getNode('/spiceplot/run')
+            self.assertEqual(table.nrows, spice2hdf5.TABLE_CHUNK_ROWS + 10)
+            self.assertTrue(numpy.all(table.col('v(3)') == p['v(3)'].get_data()))
+            h5file.close()
+    
+    def testVectors(self):
+        p = self.readPlot()
+        spice2hdf5.insert_spiceplot(p, outfile=self.outfile, path='/spiceplot', name='run',
+                                    format='vectors')
+        h5file = tables.openFile(self.outfile)
+        self.assertTrue(numpy.all(h5file.getNode('/spiceplot/run/v(1)').read() == p['v(1)'].get_data()))
+        h5file.close()
+
+    def testLayouts(self):
+        p = self.readPlot(npoints=10000)
+        spice2hdf5.insert_spiceplot(p, outfile=self.outfile, path='/spiceplot', name='vec',
+                                    format='vectors', layout='vector', complevel=5)
+        spice2hdf5.insert_spiceplot(p, outfile=self.outfile, path='/spiceplot', name='tab',
+                                    layout='timeslice', complib='zlib', complevel=1)
+        spice2hdf5.insert_spiceplot(p, outfile=self.outfile, path='/spiceplot', name='own',
+                                    format='vectors', chunkshape=1000)
+        h5file = tables.openFile(self.outfile)
+        group = h5file.getNode('/spiceplot/vec')
+        self.assertEqual(group._v_attrs.layout, 'vector')
+        array = h5file.getNode('/spiceplot/vec/v(2)')
+        self.assertTrue(isinstance(array, tables.CArray))
+        self.assertEqual(array.chunkshape, (10000,))
+        self.assertEqual(array.filters.complevel, 5)
+        self.assertEqual(array._v_attrs.complib, 'zlib')
+        self.assertTrue(numpy.all(array.read() == p['v(2)'].get_data()))
+        table = h5file.getNode('/spiceplot/tab')
+        self.assertEqual(table.chunkshape, (4096,))
+        self.assertEqual(table._v_attrs.chunkshape, 4096)
+        self.assertEqual(table._v_attrs.complevel, 1)
+        self.assertEqual(h5file.getNode('/spiceplot/own/v(1)').chunkshape, (1000,))
+        h5file.close()
+
+    def testLocations(self):
+        self.assertEqual(spice2hdf5.plot_locations('/tmp/a.raw', 1, '/spiceplot'), [('/', 'spiceplot')])
+        self.assertEqual(spice2hdf5.plot_locations('/tmp/a.raw', 2, '/spiceplot', True),
+                         [('/spiceplot/a.raw', 'plot_0'), ('/spiceplot/a.raw', 'plot_1')])
+        
+    def testBatch(self):
+        tmpdir = fixtures.make_tempdir(self)
+        infiles = []
+        for i in xrange(6):
+            infiles.append(os.path.join(tmpdir, 'run%i.raw'%(i)))
+            spice_synth.write_rawfile(infiles[-1], nvars=3, npoints=100+i, nplots=1+i%2)
+        infiles.append(os.path.join(tmpdir, 'broken.raw'))
+        open(infiles[-1], 'w').write('No. Points: foo\n')
+        errors = spice2hdf5.convert_batch(infiles, self.outfile, processes=3, queue_size=2,
+                                          flush_plots=2, format='vectors')
+        self.assertEqual([e[0] for e in errors], [infiles[-1]])
+        h5file = tables.openFile(self.outfile)
+        self.assertEqual(len(h5file.getNode('/spiceplot/run0.raw/v(1)')), 100)
+        self.assertEqual(len(h5file.getNode('/spiceplot/run3.raw/plot_1/v(2)')), 103)
+        h5file.close()
+
+    def testLostWorker(self):
+        tmpdir = fixtures.make_tempdir(self)
+        fingerprint = spice2hdf5.file_fingerprint
+        def crash(infile):
+            ## the worker dies without reporting the file
+            if infile.endswith('killed.raw'):
+                os._exit(9)
+            return fingerprint(infile)
+        spice2hdf5.file_fingerprint = crash
+        try:
+            infiles = []
+            for name in ('run0.raw', 'killed.raw', 'run1.raw', 'run2.raw'):
+                infiles.append(os.path.join(tmpdir, name))
+                spice_synth.write_rawfile(infiles[-1], nvars=2, npoints=100)
+            errors = spice2hdf5.convert_batch(infiles, self.outfile, processes=2,
+                                              poll_interval=0.1)
+            ## results still buffered in the killed worker are lost as well
+            failed = [e[0] for e in errors]
+            self.assertTrue(infiles[1] in failed)
+            self.assertTrue('9' in dict(errors)[infiles[1]])
+            h5file = tables.openFile(self.outfile)
+            for infile in infiles:
+                node = '/spiceplot/' + os.path.basename(infile)
+                self.assertNotEqual(infile in failed, node in h5file)
+            h5file.close()
+        finally:
+            spice2hdf5.file_fingerprint = fingerprint
+
+    def testCache(self):
+        tmpdir = fixtures.make_tempdir(self)
+        infiles = []
+        for i in xrange(3):
+            infiles.append(os.path.join(tmpdir, 'run%i.raw'%(i)))
+            spice_synth.write_rawfile(infiles[-1], nvars=3, npoints=100, nplots=1+i%2)
+        stats = {}
+        spice2hdf5.convert_batch(infiles, self.outfile, processes=2, stats=stats)
+        self.assertEqual(stats, {'hits': 0, 'misses': 3})
+        spice2hdf5.convert_batch(infiles, self.outfile, processes=2, stats=stats)
+        self.assertEqual(stats, {'hits': 3, 'misses': 0})
+        
+        ## touched: same content, modified: other content
+        os.utime(infiles[0], (0, 1000000))
+        spice_synth.write_rawfile(infiles[1], nvars=3, npoints=100, nplots=2, real=False)
+        spice2hdf5.convert_batch(infiles, self.outfile, processes=2, stats=stats)
+        self.assertEqual(stats, {'hits': 2, 'misses': 1})
+        spice2hdf5.convert_batch(infiles, self.outfile, processes=2, stats=stats,
+                                 format='vectors')
+        self.assertEqual(stats, {'hits': 0, 'misses': 3})
+        
+        h5file = tables.openFile(self.outfile, mode='a')
+        cache = spice2hdf5.conversion_cache(h5file, '/spiceplot', True,
+                                            spice2hdf5.options_key({'format': 'vectors'}))
+        self.assertTrue(cache.lookup(infiles[0]))
+        self.assertEqual(h5file.getNode('/spiceplot/run0.raw')._v_attrs.source_mtime, 1000000)
+        self.assertEqual(cache.find_nodes(os.path.join(tmpdir, 'other.raw')), [])
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        h5file.close()
+
+    def testStream(self):
+        for real in (True, False):
+            spice_synth.write_rawfile(self.rawfile, nvars=4, npoints=1000, nplots=2, real=real)
+            plots = spice_read.spice_read(self.rawfile).get_plots()
+            h5file = tables.openFile(self.outfile, mode='w')
+            n = spice2hdf5.stream_spicefile(h5file, self.rawfile, '/tab', chunksize=300)
+            spice2hdf5.stream_spicefile(h5file, self.rawfile, '/vec', chunksize=300,
+                                        format='vectors', layout='timeslice')
+            self.assertEqual(n, 2)
+            table = h5file.getNode('/tab/plot_1')
+            self.assertEqual(table.nrows, 1000)
+            self.assertTrue(numpy.all(table.col('v(3)') == plots[1]['v(3)'].get_data()))
+            array = h5file.getNode('/vec/plot_0/v(2)')
+            self.assertTrue(isinstance(array, tables.EArray))
+            self.assertEqual(array._v_attrs.layout, 'timeslice')
+            self.assertTrue(numpy.all(array.read() == plots[0]['v(2)'].get_data()))
+            scale = h5file.getNode('/vec/plot_0/' + plots[0].get_scalevector().name).read()
+            self.assertEqual(scale.dtype, numpy.float64)
+            h5file.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+'''
+tests the spice_bulk module for TvBSpice
+'''
+import unittest
+import fixtures
+import spice_bulk
+import spice_read
+import numpy
+import os
+import shutil
+
+class SpiceBulkTest(unittest.TestCase):
+    '''
+    Load copies of results.raw and a broken file with a process pool
+    '''
+    def setUp(self):
+        self.tmpdir = fixtures.make_tempdir(self)
+        self.source = os.path.join(os.path.dirname(__file__), 'data', 'results.raw')
+        for i in xrange(4):
+            shutil.copy(self.source, os.path.join(self.tmpdir, 'run%i.raw'%(i)))
+        open(os.path.join(self.tmpdir, 'broken.raw'), 'w').write('No. Points: foo\n')
+        
+    def testLoadFiles(self):
+        files = spice_bulk.find_raw_files([self.tmpdir])
+        self.assertEqual(len(files), 5)
+        catalog, reports = spice_bulk.load_files(files, processes=2, vectors=['utp', 'ltp'])
+        self.assertEqual(len(catalog), 4)
+        self.assertEqual(len(reports), 5)
+        failed = [r['filename'] for r in reports if r['error']]
+        self.assertEqual(failed, [os.path.join(self.tmpdir, 'broken.raw')])
+        self.assertTrue(min([r['time'] for r in reports]) >= 0)
+        
+        p = spice_read.spice_read(self.source).get_plots()[0]
+        c = catalog[(os.path.join(self.tmpdir, 'run2.raw'), 0)]
+        self.assertEqual(c.names, ['time', 'utp', 'ltp'])
+        self.assertTrue(isinstance(c.data, numpy.memmap))
+        self.assertTrue(numpy.all(c['utp'].get_data() == p['utp'].get_data()))
+
+    def testLostWorker(self):
+        parse = spice_read.spice_read
+        def crash(filename, **kwargs):
+            ## the worker dies without a report
+            if filename.endswith('run1.raw'):
+                os._exit(9)
+            return parse(filename, **kwargs)
+        spice_read.spice_read = crash
+        try:
+            files = spice_bulk.find_raw_files([self.tmpdir])
+            catalog, reports = spice_bulk.load_files(files, processes=2,
+                                                     poll_interval=0.1)
+        finally:
+            spice_read.spice_read = parse
+        self.assertEqual(len(reports), 5)
+        errors = dict([(r['filename'], r['error']) for r in reports if r['error']])
+        self.assertEqual(sorted(errors), [os.path.join(self.tmpdir, f)
+                                          for f in ('broken.raw', 'run1.raw')])
+        self.assertTrue('9' in errors[os.path.join(self.tmpdir, 'run1.raw')])
+        self.assertEqual(len(catalog), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+'''
+tests the spice_catalog module for TvBSpice
+'''
+import unittest
+import fixtures
+import spice2hdf5
+import spice_catalog
+import spice_hdf5
+import spice_synth
+import tables
+import os
+import shutil
+
+class SpiceCatalogTest(unittest.TestCase):
+    '''
+    Convert raw files and query the catalog of the HDF5 file
+    '''
+    def setUp(self):
+        self.tmpdir = fixtures.make_tempdir(self)
+        self.outfile = os.path.join(self.tmpdir, 'out.hdf5')
+        self.infiles = []
+        for i in xrange(3):
+            self.infiles.append(os.path.join(self.tmpdir, 'run%i.raw'%(i)))
+            spice_synth.write_rawfile(self.infiles[-1], nvars=3, npoints=100+i,
+                                      nplots=1+i%2, real=(i != 2))
+        self.infiles.append(os.path.join(self.tmpdir, 'schmitt.raw'))
+        shutil.copy(os.path.join(os.path.dirname(__file__), 'data', 'results.raw'),
+                    self.infiles[-1])
+
+    def testQueries(self):
+        spice2hdf5.convert_batch(self.infiles, self.outfile, processes=2)
+        h5file = tables.openFile(self.outfile)
+        plots = spice_catalog.select_plots(h5file)
+        self.assertEqual(sorted(plots['path']),
+                         ['/spiceplot/run0.raw', '/spiceplot/run1.raw/plot_0',
+                          '/spiceplot/run1.raw/plot_1', '/spiceplot/run2.raw',
+                          '/spiceplot/schmitt.raw'])
+        rows = spice_catalog.select_plots(h5file, '(npoints > 100) & (plotname == "AC Analysis")')
+        self.assertEqual(list(rows['path']), ['/spiceplot/run2.raw'])
+        self.assertEqual(rows['nvars'][0], 3)
+
+        rows = spice_catalog.select_measures(h5file, 'utp', 'value > 1.7')
+        self.assertEqual(list(rows['path']), ['/spiceplot/schmitt.raw'])
+        self.assertAlmostEqual(rows['value'][0], 1.746955)
+        self.assertEqual(len(spice_catalog.select_measures(h5file, 'utp', 'value > 1.8')), 0)
+        self.assertEqual(len(spice_catalog.select_measures(h5file, 'ltp')), 1)
+
+        catalog = h5file.getNode('/catalog/plots')
+        self.assertTrue(catalog.cols.npoints.index is not None)
+        h5file.close()
+        r = spice_hdf5.hdf5_read(self.outfile)
+        self.assertEqual(len(r.plot_paths), 5)
+        r.close()
+
+    def testReplace(self):
+        spice2hdf5.convert_batch(self.infiles, self.outfile, processes=2)
+        spice_synth.write_rawfile(self.infiles[1], nvars=3, npoints=50, nplots=2)
+        spice2hdf5.convert_batch(self.infiles, self.outfile, processes=2)
+        h5file = tables.openFile(self.outfile, mode='a')
+        spice2hdf5.stream_spicefile(h5file, self.infiles[3], '/spiceplot', True)
+        plots = spice_catalog.select_plots(h5file)
+        self.assertEqual(len(plots), 5)
+        rows = spice_catalog.select_plots(h5file, 'path == "/spiceplot/run1.raw/plot_1"')
+        self.assertEqual(list(rows['npoints']), [50])
+        self.assertEqual(len(spice_catalog.select_measures(h5file, 'utp')), 1)
+        self.assertFalse(h5file.getNode('/catalog/measures').cols.name.index.dirty)
+        h5file.close()
+
+    def testLazyMeasures(self):
+        spice2hdf5.convert_batch(self.infiles[3:], self.outfile)
+        r = spice_hdf5.hdf5_read(self.outfile)
+        plot = r.get_plot(r.plot_paths[0])
+        measures = spice_catalog.plot_measures(plot)
+        self.assertAlmostEqual(measures['utp'], 1.746955)
+        self.assertEqual(sorted(measures), ['ltp', 'utp'])
+        for v in plot.get_datavectors():
+            self.assertFalse(v.is_loaded(), v.name)
+        r.close()
+
+    def testLongPath(self):
+        longfile = os.path.join(self.tmpdir, 'r'*246 + '.raw')
+        shutil.copy(self.infiles[0], longfile)
+        errors = spice2hdf5.convert_batch([self.infiles[0], longfile], self.outfile)
+        self.assertEqual([e[0] for e in errors], [longfile])
+        h5file = tables.openFile(self.outfile, mode='a')
+        self.assertFalse('/spiceplot/' + os.path.basename(longfile) in h5file)
+        plot = spice_hdf5.node_plot(h5file.getNode('/spiceplot/run0.raw'))
+        self.assertRaises(ValueError, spice_catalog.add_plot, h5file, '/' + 'x'*256, plot)
+        self.assertEqual(len(spice_catalog.select_plots(h5file)), 1)
+        ## a path of the full column width is found again
+        spice_catalog.add_plot(h5file, '/' + 'x'*255, plot)
+        h5file.flush()
+        self.assertEqual(len(spice_catalog.select_plots(h5file)), 2)
+        spice_catalog.remove_plot(h5file, '/' + 'x'*255)
+        self.assertEqual(len(spice_catalog.select_plots(h5file)), 1)
+        h5file.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+'''
+tests the spice_hdf5 reader for TvBSpice
+'''
+import unittest
+import fixtures
+import spice2hdf5
+import spice_hdf5
+import spice_read
+import spice_synth
+import numpy
+import tables
+import os
+
+class SpiceHdf5Test(unittest.TestCase):
+    '''
+    Read plots stored by spice2hdf5 back as lazy spice_plots
+    '''
+    def setUp(self):
+        self.rawfile = fixtures.make_tempfile('.raw')
+        self.outfile = fixtures.tempfile_name('.hdf5')
+
+    def tearDown(self):
+        fixtures.remove_files(self.rawfile, self.outfile)
+
+    def testFormats(self):
+        for real in (True, False):
+            spice_synth.write_rawfile(self.rawfile, nvars=4, npoints=5000, real=real)
+            p = spice_read.spice_read(self.rawfile).get_plots()[0]
+            spice2hdf5.insert_spiceplot(p, self.outfile, '/runs', 'tab')
+            spice2hdf5.insert_spiceplot(p, self.outfile, '/runs', 'vec', format='vectors',
+                                        layout='timeslice')
+            r = spice_hdf5.hdf5_read(self.outfile)
+            self.assertEqual(r.plot_paths, ['/runs/tab', '/runs/vec'])
+            for h in r.get_plots():
+                self.assertEqual(h.plotname, p.plotname)
+                self.assertEqual(h.get_scalevector().name, p.get_scalevector().name)
+                self.assertEqual([v.name for v in h.get_datavectors()],
+                                 ['v(1)', 'v(2)', 'v(3)'])
+                self.assertEqual(h['v(1)'].type, 'voltage')
+                v = h['v(2)']
+                self.assertTrue(numpy.all(v[1000:1010] == p['v(2)'].get_data()[1000:1010]))
+                self.assertTrue(numpy.all(v[::7] == p['v(2)'].get_data()[::7]))
+                self.assertEqual(v[-1], p['v(2)'].get_data()[-1])
+                self.assertFalse(v.is_loaded(), "slicing read the whole vector")
+                self.assertTrue(numpy.all(v.get_data() == p['v(2)'].get_data()))
+                self.assertTrue(v.is_loaded())
+                self.assertTrue(numpy.all(h['v(3)'].get_db() == p['v(3)'].get_db()))
+            r.close()
+            os.remove(self.outfile)
+
+    def testStreamed(self):
+        spice_synth.write_rawfile(self.rawfile, nvars=3, npoints=500, nplots=2)
+        plots = spice_read.spice_read(self.rawfile).get_plots()
+        h5file = tables.openFile(self.outfile, mode='w')
+        spice2hdf5.stream_spicefile(h5file, self.rawfile, '/s', format='vectors')
+        h5file.close()
+        r = spice_hdf5.hdf5_read(self.outfile, '/s')
+        self.assertEqual(len(r.plot_paths), 2)
+        h = r.plot(1)
+        self.assertEqual(h.title, plots[1].title)
+        self.assertTrue(numpy.all(h['time'][:] == plots[1]['time'].get_data()))
+        r.close()
+
+    def testStreamedDimensions(self):
+        rawfile = os.path.join(os.path.dirname(__file__), 'data', 'results.raw')
+        p = spice_read.spice_read(rawfile).get_plots()[0]
+        h5file = tables.openFile(self.outfile, mode='w')
+        spice2hdf5.stream_spicefile(h5file, rawfile, '/s')
+        h5file.close()
+        r = spice_hdf5.hdf5_read(self.outfile)
+        h = r.plot(0)
+        self.assertEqual([v.dimensions for v in h.get_datavectors()],
+                         [v.dimensions for v in p.get_datavectors()])
+        self.assertEqual(h['utp'].dimensions, [1])
+        r.close()
+
+    def testWithoutAttributes(self):
+        h5file = tables.openFile(self.outfile, mode='w')
+        group = h5file.createGroup('/', 'old')
+        h5file.createArray(group, 'v1', numpy.arange(10.0))
+        h5file.createArray(group, 'time', numpy.arange(10.0)*1e-9)
+        h5file.close()
+        r = spice_hdf5.hdf5_read(self.outfile)
+        h = r.plot(0)
+        self.assertEqual(h.get_scalevector().name, 'time')
+        self.assertEqual(h['v1'][3], 3.0)
+        r.close()
+
+if __name__ == "__main__":
+    unittest.main()
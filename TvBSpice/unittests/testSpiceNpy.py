@@ -0,0 +1,70 @@
+'''
+tests the spice_npy module for TvBSpice
+'''
+import unittest
+import fixtures
+import spice2hdf5
+import spice_npy
+import spice_read
+import spice_synth
+import numpy
+import os
+
+class SpiceNpyTest(unittest.TestCase):
+    '''
+    Convert raw files into .npy directories and map them again
+    '''
+    def setUp(self):
+        self.tmpdir = fixtures.make_tempdir(self)
+        self.outdir = os.path.join(self.tmpdir, 'out.npy')
+
+    def testConvert(self):
+        infiles = []
+        for i, real in enumerate((True, False)):
+            infiles.append(os.path.join(self.tmpdir, 'run%i.raw'%(i)))
+            spice_synth.write_rawfile(infiles[-1], nvars=4, npoints=1000, nplots=2, real=real)
+        infiles.append(os.path.join(self.tmpdir, 'broken.raw'))
+        open(infiles[-1], 'w').write('No. Points: foo\n')
+        errors = spice2hdf5.convert_npy(infiles, self.outdir, processes=2)
+        self.assertEqual([e[0] for e in errors], [infiles[-1]])
+
+        r = spice_npy.npy_read(self.outdir)
+        self.assertEqual(r.plot_dirs, [os.path.join(self.outdir, 'spiceplot', f, p)
+                                       for f in ('run0.raw', 'run1.raw')
+                                       for p in ('plot_0', 'plot_1')])
+        for infile, plots in zip(infiles, (r.get_plots()[:2], r.get_plots()[2:])):
+            for p, q in zip(plots, spice_read.spice_read(infile).get_plots()):
+                self.assertEqual(p.title, q.title)
+                self.assertEqual(p.get_scalevector().name, q.get_scalevector().name)
+                v = p['v(3)'].get_data()
+                self.assertTrue(isinstance(v, numpy.memmap))
+                self.assertFalse(v.flags.writeable)
+                self.assertTrue(numpy.all(v == q['v(3)'].get_data()))
+                self.assertTrue(numpy.all(p.get_scalevector().get_data() ==
+                                          numpy.real(q.get_scalevector().get_data())))
+
+    def testDimensions(self):
+        rawfile = os.path.join(os.path.dirname(__file__), 'data', 'results.raw')
+        spice2hdf5.convert_npy([rawfile], self.outdir)
+        p = spice_npy.npy_read(self.outdir).plot(0)
+        q = spice_read.spice_read(rawfile).get_plots()[0]
+        self.assertEqual([v.dimensions for v in p.get_datavectors()],
+                         [v.dimensions for v in q.get_datavectors()])
+        self.assertEqual(p['ltp'].dimensions, [1])
+
+    def testReplace(self):
+        rawfile = os.path.join(self.tmpdir, 'run.raw')
+        spice_synth.write_rawfile(rawfile, nvars=3, npoints=100)
+        spice2hdf5.convert_npy([rawfile], self.outdir)
+        old = spice_npy.npy_read(self.outdir).plot(0)
+        spice_synth.write_rawfile(rawfile, nvars=2, npoints=0)
+        spice2hdf5.convert_npy([rawfile], self.outdir)
+        r = spice_npy.npy_read(self.outdir)
+        self.assertEqual(r.plot_dirs, [os.path.join(self.outdir, 'spiceplot')])
+        self.assertEqual(len(r.plot(0).get_datavectors()), 1)
+        self.assertEqual(len(r.plot(0)['v(1)'].get_data()), 0)
+        ## the old mapping is still valid
+        self.assertEqual(len(old['v(2)'].get_data()), 100)
+
+if __name__ == "__main__":
+    unittest.main()
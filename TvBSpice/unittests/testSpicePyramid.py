@@ -0,0 +1,93 @@
+'''
+tests the spice_pyramid module for TvBSpice
+'''
+import unittest
+import fixtures
+import spice2hdf5
+import spice_hdf5
+import spice_pyramid
+import spice_read
+import spice_synth
+import numpy
+import tables
+
+class SpicePyramidTest(unittest.TestCase):
+    '''
+    Compare the envelopes of min/max pyramids with the full vectors
+    '''
+    def setUp(self):
+        self.rawfile = fixtures.make_tempfile('.raw')
+        self.outfile = fixtures.tempfile_name('.hdf5')
+        spice_synth.write_rawfile(self.rawfile, nvars=3, npoints=100000)
+        self.plot = spice_read.spice_read(self.rawfile).get_plots()[0]
+
+    def tearDown(self):
+        fixtures.remove_files(self.rawfile, self.outfile)
+
+    def checkEnvelope(self, pyramid, start, stop, n):
+        time = self.plot.get_scalevector().get_data()
+        data = self.plot['v(2)'].get_data()
+        window = data[(time >= start) & (time < stop)]
+        scale, lo, hi = pyramid.envelope(start, stop, n)
+        self.assertTrue(0 < len(scale) <= n)
+        self.assertEqual(len(lo), len(scale))
+        self.assertTrue(numpy.all(lo <= hi))
+        self.assertTrue(lo.min() <= window.min() and hi.max() >= window.max())
+        return scale, lo, hi
+
+    def testEnvelope(self):
+        pyramids = spice_pyramid.plot_pyramids(self.plot)
+        p = pyramids['v(2)']
+        self.assertEqual(len(p.levels), 5)
+        time = self.plot.get_scalevector().get_data()
+        for t in (-1.0, 0.0, 1.234567e-5, time[4096], time[-1], 1.0):
+            self.assertEqual(p.find_index(t), numpy.searchsorted(time, t))
+        scale, lo, hi = self.checkEnvelope(p, time[0], time[-1]+1, 100)
+        data = self.plot['v(2)'].get_data()
+        self.assertEqual((lo.min(), hi.max()), (data.min(), data.max()))
+        self.checkEnvelope(p, 1e-5, 5e-5, 1000)
+        self.checkEnvelope(p, 1e-5, 5e-5, 7)
+        ## short windows return the points themselves
+        scale, lo, hi = p.envelope(time[10], time[20], 100)
+        self.assertTrue(numpy.all(lo == data[10:20]))
+
+    def testBuilder(self):
+        for npoints in (0, 16, 17, 64, 65, 1000, 4097):
+            data = numpy.sin(numpy.arange(npoints) * 0.37)
+            scale = numpy.arange(npoints) * 1e-3
+            expected = spice_pyramid.minmax_pyramid.from_data(scale, data, 4, 16)
+            for chunksize in (1, 5, 64, 5000):
+                stored = {}
+                def store(k, rows):
+                    stored.setdefault(k, []).append(rows)
+                minmax = spice_pyramid.level_builder(spice_pyramid.reduce_minmax,
+                                                     store, 4, 16)
+                for i in xrange(0, npoints, chunksize):
+                    minmax.add(0, spice_pyramid.minmax_rows(data[i:i+chunksize]))
+                self.assertEqual(minmax.finish(), len(expected.levels))
+                self.assertEqual(sorted(stored), range(1, len(expected.levels)+1))
+                for k, (s, mm) in enumerate(expected.levels):
+                    self.assertTrue(numpy.all(numpy.concatenate(stored[k+1]) == mm))
+                ## only incomplete bins are kept
+                self.assertTrue(max([len(c) for c in minmax.carry] + [0]) < 4)
+
+    def testStored(self):
+        memory = spice_pyramid.plot_pyramids(self.plot)['v(1)']
+        spice2hdf5.insert_spiceplot(self.plot, self.outfile, '/runs', 'tab', pyramid=True)
+        h5file = tables.openFile(self.outfile, mode='a')
+        spice2hdf5.stream_spicefile(h5file, self.rawfile, '/runs/vec', format='vectors',
+                                    chunksize=3000, pyramid=True)
+        h5file.close()
+        r = spice_hdf5.hdf5_read(self.outfile)
+        self.assertEqual(r.plot_paths, ['/runs/tab', '/runs/vec'])
+        for path in r.plot_paths:
+            p = r.get_pyramids(path)['v(1)']
+            for window in ((None, None, 500), (2e-5, 3e-5, 100), (2e-5, 2.001e-5, 100)):
+                for a, b in zip(p.envelope(*window), memory.envelope(*window)):
+                    self.assertTrue(numpy.all(a == b))
+            self.assertFalse(p.data.is_loaded(), "the query read the whole vector")
+        self.assertEqual(r.get_pyramids('/runs'), {})
+        r.close()
+
+if __name__ == "__main__":
+    unittest.main()
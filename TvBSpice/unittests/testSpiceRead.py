@@ -0,0 +1,378 @@
+'''
+tests the spice_read module for TvBSpice
+'''
+import unittest
+import fixtures
+import spice_read
+import spice_synth
+import numpy
+import os
+
+def write_ascii_raw(filename, names, data, truncate=None, dimensions=None):
+    '''
+    Write the (npoints, nvars) array data as ngspice ASCII raw file.
+    If truncate is given, the file is cut after that many characters.
+    '''
+    iscomplex = numpy.iscomplexobj(data)
+    lines = ["Title: ascii test", "Date: today", "Plotname: AC Analysis",
+             "Flags: " + ("complex" if iscomplex else "real"),
+             "No. Variables: %i"%(len(names)), "No. Points: %i"%(len(data))]
+    if dimensions:
+        lines.append("Dimensions: " + ",".join([str(d) for d in dimensions]))
+    lines.append("Variables:")
+    for i, n in enumerate(names):
+        lines.append("\t%i\t%s\tvoltage"%(i, n))
+    lines.append("Values:")
+    for i, row in enumerate(data):
+        for j, v in enumerate(row):
+            if iscomplex:
+                s = "%.15e,%.15e"%(v.real, v.imag)
+            else:
+                s = "%.15e"%(v)
+            if j == 0:
+                lines.append(" %i\t%s"%(i, s))
+            else:
+                lines.append("\t%s"%(s))
+        lines.append("")
+    text = "\n".join(lines) + "\n"
+    if truncate:
+        text = text[:truncate]
+    open(filename, "wb").write(text)
+
+class SpiceReadTest(unittest.TestCase):
+    '''
+    Test reading of the binary transient results.raw
+    
+    The file contains a single plot with the vectors
+    time, v(in), v(out), utp and ltp with 544 points
+    '''
+    def setUp(self):
+        self.filename = os.path.join(os.path.dirname(__file__), 'data', 'results.raw')
+        
+    def testReadFile(self):
+        plots = spice_read.spice_read(self.filename).get_plots()
+        self.assertEqual(len(plots), 1, "Expected a single plot, got %i"%(len(plots)))
+        p = plots[0]
+        self.assertEqual(p.get_scalevector().name, 'time')
+        self.assertEqual([d.name for d in p.get_datavectors()], ['v(in)', 'v(out)', 'utp', 'ltp'])
+        self.assertEqual(len(p.get_scalevector().get_data()), 544)
+        
+    def testMmap(self):
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        m = spice_read.spice_read(self.filename, mmap=True).get_plots()[0]
+        self.assertTrue(m.data_offset > 0, "Data offset not recorded")
+        self.assertEqual(m.data_offset, p.data_offset)
+        for a, b in zip([p.get_scalevector()] + p.get_datavectors(),
+                        [m.get_scalevector()] + m.get_datavectors()):
+            self.assertTrue(isinstance(b.get_data().base, numpy.memmap) or 
+                            isinstance(b.get_data(), numpy.memmap),
+                            "Vector %s is not a view of the memmap"%(b.name))
+            self.assertTrue(numpy.all(a.get_data() == b.get_data()),
+                            "Vector %s differs in mmap mode"%(b.name))
+
+    def testDimensions(self):
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        self.assertEqual(p.get_datavector(2).dimensions, [1])
+        self.assertEqual(p.get_datavector(2).get_ndarray().shape, (1,))
+        self.assertEqual(p.get_datavector(0).get_ndarray().shape, (544,))
+        self.assertEqual(len(p.get_axes()), 1)
+
+    def testNameLookup(self):
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        self.assertTrue(p['v(out)'] is p.get_datavector(1))
+        self.assertTrue(p['time'] is p.get_scalevector())
+        self.assertTrue('utp' in p)
+        self.assertFalse('v(foo)' in p)
+        self.assertRaises(KeyError, p.get_vector, 'v(foo)')
+
+    def testCompact(self):
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        for kwargs in ({}, {'mmap': True}, {'vectors': ['ltp']}):
+            c = spice_read.spice_read(self.filename, compact=True, **kwargs).get_plots()[0]
+            self.assertTrue(isinstance(c, spice_read.compact_plot))
+            self.assertEqual(c.title, p.title)
+            self.assertTrue(numpy.all(c['ltp'].get_data() == p['ltp'].get_data()))
+            self.assertTrue(numpy.all(c.get_scalevector().get_data() == p.get_scalevector().get_data()))
+            self.assertEqual(c['ltp'].dimensions, [1])
+            self.assertRaises(AttributeError, setattr, c['ltp'], 'foo', 1)
+        c = spice_read.compact_plot.from_plot(p)
+        self.assertEqual(c.data.shape, (544, 5))
+        self.assertEqual([v.name for v in c.get_datavectors()], ['v(in)', 'v(out)', 'utp', 'ltp'])
+        self.assertTrue(numpy.all(c.get_datavector(1).get_data() == p.get_datavector(1).get_data()))
+
+    def testVectorSelection(self):
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        for mmap in (False, True):
+            s = spice_read.spice_read(self.filename, mmap=mmap, vectors=['utp', 2]).get_plots()[0]
+            self.assertEqual(s.get_scalevector().name, 'time')
+            self.assertEqual([d.name for d in s.get_datavectors()], ['v(out)', 'utp'])
+            self.assertTrue(numpy.all(s.get_datavector(0).get_data() == p.get_datavector(1).get_data()))
+            self.assertTrue(numpy.all(s.get_datavector(1).get_data() == p.get_datavector(2).get_data()))
+            if not mmap:
+                self.assertFalse(isinstance(s.get_datavector(1).get_data().base, numpy.memmap),
+                                 "Selected vector still references the memmap")
+
+class SpiceReadIndexTest(unittest.TestCase):
+    '''
+    Test the plot index and the lazy plot access on a file with
+    three copies of the binary results.raw and one ASCII plot
+    '''
+    def setUp(self):
+        self.filename = fixtures.make_tempfile('.raw')
+        self.ascii_data = numpy.arange(12, dtype='float64').reshape(4, 3)
+        write_ascii_raw(self.filename, ['time', 'a', 'b'], self.ascii_data)
+        ascii_text = open(self.filename, "rb").read()
+        binary_text = open(os.path.join(os.path.dirname(__file__), 'data', 'results.raw'), "rb").read()
+        open(self.filename, "wb").write(binary_text*2 + ascii_text + binary_text)
+        
+    def tearDown(self):
+        fixtures.remove_files(self.filename, self.filename + '.index')
+        
+    def testIndex(self):
+        r = spice_read.spice_read(self.filename, lazy=True)
+        index = r.get_index()
+        self.assertEqual(len(index), 4)
+        self.assertEqual([i['format'] for i in index], ['binary', 'binary', 'values', 'binary'])
+        self.assertEqual(index[2]['npoints'], 4)
+        self.assertEqual([v[1] for v in index[0]['variables']], ['time', 'v(in)', 'v(out)', 'utp', 'ltp'])
+        self.assertEqual([v[3] for v in index[0]['variables']], [[], [], [], [1], [1]])
+        self.assertEqual(r.plots, [], "Lazy mode must not parse the plots")
+        
+    def testLazyPlots(self):
+        full = spice_read.spice_read(self.filename).get_plots()
+        r = spice_read.spice_read(self.filename, lazy=True)
+        p = r.plot(2)
+        self.assertTrue(numpy.all(p.get_datavector(1).get_data() == self.ascii_data[:,2]))
+        lazy = list(r.iter_plots())
+        self.assertEqual(len(lazy), len(full))
+        for a, b in zip(full, lazy):
+            self.assertEqual(a.data_offset, b.data_offset)
+            self.assertTrue(numpy.all(a.get_datavector(0).get_data() == b.get_datavector(0).get_data()))
+            
+    def testChunks(self):
+        full = spice_read.spice_read(self.filename).get_plots()
+        r = spice_read.spice_read(self.filename, lazy=True, vectors=['v(out)', 'b'])
+        for n in (1, 2):
+            chunks = list(r.iter_chunks(n, chunksize=100))
+            self.assertTrue(max([len(c) for c in chunks]) <= 100)
+            data = numpy.concatenate(chunks)
+            self.assertEqual(data.shape, (len(full[n].get_scalevector().get_data()), 2))
+            self.assertTrue(numpy.all(data[:,0] == full[n].get_scalevector().get_data()))
+            self.assertTrue(numpy.all(data[:,1] == full[n].get_datavector(1).get_data()))
+            
+    def testSidecar(self):
+        r = spice_read.spice_read(self.filename)
+        r.write_index()
+        self.assertTrue(os.path.isfile(self.filename + '.index'))
+        r2 = spice_read.spice_read(self.filename, lazy=True)
+        self.assertEqual([i['offset'] for i in r2.get_index()], [i['offset'] for i in r.get_index()])
+        self.assertEqual(r2.plot(3).get_scalevector().name, 'time')
+
+class SpiceFollowTest(unittest.TestCase):
+    '''
+    Test following a raw file while it is written
+    '''
+    def setUp(self):
+        self.filename = fixtures.make_tempfile('.raw')
+        self.source = os.path.join(os.path.dirname(__file__), 'data', 'results.raw')
+        
+    def tearDown(self):
+        os.remove(self.filename)
+        
+    def testBinary(self):
+        text = open(self.source, "rb").read()
+        full = spice_read.spice_read(self.source).get_plots()[0]
+        offset = full.data_offset
+        r = spice_read.spice_follow(self.filename, vectors=['v(out)'])
+        steps = [offset - 3, offset + 100*40 + 17, offset + 400*40, len(text)]
+        expected = [0, 100, 300, 144]
+        for end, n in zip(steps, expected):
+            open(self.filename, "wb").write(text[:end])
+            self.assertEqual(r.update(), n)
+        self.assertTrue(r.complete())
+        p = r.get_plot()
+        self.assertTrue(numpy.all(p.get_scalevector().get_data() == full.get_scalevector().get_data()))
+        self.assertTrue(numpy.all(p.get_datavector(0).get_data() == full.get_datavector(1).get_data()))
+
+    def testPatchedPoints(self):
+        ## ngspice writes "No. Points: 0" and patches it at the end
+        text = open(self.source, "rb").read()
+        offset = spice_read.spice_read(self.source).get_plots()[0].data_offset
+        unpatched = text.replace("No. Points: 544", "No. Points: 0  ")
+        open(self.filename, "wb").write(unpatched[:offset + 100*40])
+        r = spice_read.spice_follow(self.filename)
+        self.assertEqual(r.update(), 100)
+        open(self.filename, "wb").write(unpatched)
+        self.assertEqual(r.update(), 444)
+        self.assertFalse(r.complete())
+        open(self.filename, "wb").write(text)
+        self.assertEqual(list(r.follow(interval=0)), [])
+        self.assertTrue(r.complete())
+        self.assertEqual(r.npoints, 544)
+        ## the reader methods of spice_read work on the file, too
+        f = open(self.filename, "rb")
+        self.assertEqual(len(r.read_plot(f).get_scalevector().get_data()), 544)
+        f.close()
+
+    def testAscii(self):
+        data = numpy.arange(30, dtype='float64').reshape(10, 3) * (1+2j)
+        write_ascii_raw(self.filename, ['frequency', 'v(in)', 'v(out)'], data)
+        text = open(self.filename, "rb").read()
+        r = spice_read.spice_follow(self.filename)
+        open(self.filename, "wb").write(text[:text.index(" 4\t") + 5])
+        self.assertEqual(r.update(), 4)
+        open(self.filename, "wb").write(text)
+        plots = list(r.follow(interval=0))
+        self.assertEqual(len(plots), 1)
+        self.assertTrue(numpy.allclose(plots[0].get_datavector(1).get_data(), data[:,2]))
+        self.assertTrue(numpy.allclose(plots[0].get_scalevector().get_data(), data[:,0].real))
+
+class SpiceReadAsciiTest(unittest.TestCase):
+    '''
+    Test the vectorized parser of ASCII "Values:" blocks
+    '''
+    def setUp(self):
+        self.filename = fixtures.make_tempfile('.raw')
+        self.names = ['frequency', 'v(in)', 'v(out)']
+        self.data = numpy.arange(30, dtype='float64').reshape(10, 3) * 1.5e-3
+    
+    def tearDown(self):
+        os.remove(self.filename)
+        
+    def testReal(self):
+        write_ascii_raw(self.filename, self.names, self.data)
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        self.assertTrue(numpy.allclose(p.get_scalevector().get_data(), self.data[:,0]))
+        for j, d in enumerate(p.get_datavectors()):
+            self.assertTrue(numpy.allclose(d.get_data(), self.data[:,j+1]))
+            
+    def testComplex(self):
+        data = self.data + 1j*self.data[::-1]
+        write_ascii_raw(self.filename, self.names, data)
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        for j, d in enumerate(p.get_datavectors()):
+            self.assertTrue(numpy.allclose(d.get_data(), data[:,j+1]))
+        c = spice_read.spice_read(self.filename, compact=True).get_plots()[0]
+        self.assertTrue(numpy.allclose(c['v(out)'].get_data(), data[:,2]))
+        self.assertEqual(c.get_scalevector().get_data().dtype, numpy.float64)
+            
+    def testMultiplePlots(self):
+        write_ascii_raw(self.filename, self.names, self.data)
+        text = open(self.filename, "rb").read()
+        open(self.filename, "wb").write(text + text)
+        plots = spice_read.spice_read(self.filename).get_plots()
+        self.assertEqual(len(plots), 2)
+        self.assertTrue(numpy.allclose(plots[1].get_datavector(1).get_data(), self.data[:,2]))
+            
+    def testSmallChunks(self):
+        data = self.data + 1j*self.data[::-1]
+        write_ascii_raw(self.filename, self.names, data)
+        text = open(self.filename, "rb").read()
+        write_ascii_raw(self.filename, self.names, self.data)
+        open(self.filename, "ab").write(text)
+        chunk = spice_read.VALUES_CHUNK
+        spice_read.VALUES_CHUNK = 4
+        try:
+            plots = spice_read.spice_read(self.filename).get_plots()
+        finally:
+            spice_read.VALUES_CHUNK = chunk
+        self.assertEqual(len(plots), 2)
+        self.assertTrue(numpy.allclose(plots[0].get_datavector(1).get_data(), self.data[:,2]))
+        self.assertTrue(numpy.allclose(plots[1].get_datavector(1).get_data(), data[:,2]))
+            
+    def testVectorSelection(self):
+        data = self.data + 1j*self.data[::-1]
+        write_ascii_raw(self.filename, self.names, data)
+        p = spice_read.spice_read(self.filename, vectors=['v(out)']).get_plots()[0]
+        self.assertEqual(len(p.get_datavectors()), 1)
+        self.assertTrue(numpy.allclose(p.get_datavector(0).get_data(), data[:,2]))
+            
+    def testChunks(self):
+        data = self.data + 1j*self.data[::-1]
+        write_ascii_raw(self.filename, self.names, data)
+        chunks = list(spice_read.spice_read(self.filename, lazy=True).iter_chunks(chunksize=3))
+        self.assertEqual([len(c) for c in chunks], [3, 3, 3, 1])
+        self.assertTrue(numpy.allclose(numpy.concatenate(chunks)[:,1:], data[:,1:]))
+            
+    def testDimensions(self):
+        inner = numpy.linspace(0, 1, 4)
+        data = numpy.zeros((12, 3))
+        data[:,0] = numpy.tile(inner, 3)
+        data[:,1] = numpy.arange(12)
+        data[:,2] = numpy.repeat([1., 2., 3.], 4)
+        write_ascii_raw(self.filename, ['v-sweep', 'v(out)', 'i(v2)'], data, dimensions=[3, 4])
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        self.assertEqual(p.dimensions, [3, 4])
+        nd = p.get_datavector(0).get_ndarray()
+        self.assertEqual(nd.shape, (3, 4))
+        self.assertTrue(numpy.may_share_memory(nd, p.get_datavector(0).get_data()))
+        self.assertEqual(nd[2,1], 9)
+        axes = p.get_axes()
+        self.assertTrue(numpy.all(axes[0] == [0, 1, 2]))
+        self.assertTrue(numpy.allclose(axes[1], inner))
+        self.assertTrue(numpy.all(p.get_datavector(1).get_ndarray()[:,0] == [1, 2, 3]))
+            
+    def testTruncated(self):
+        write_ascii_raw(self.filename, self.names, self.data)
+        size = os.path.getsize(self.filename)
+        write_ascii_raw(self.filename, self.names, self.data, truncate=size-60)
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        self.assertEqual(len(p.get_scalevector().get_data()), 9)
+        self.assertTrue(numpy.allclose(p.get_datavector(0).get_data(), self.data[:9,1]))
+
+class SpiceSynthTest(unittest.TestCase):
+    '''
+    Read synthetic files of all formats and compare with the generator data
+    '''
+    def setUp(self):
+        self.filename = fixtures.make_tempfile('.raw')
+    
+    def tearDown(self):
+        os.remove(self.filename)
+        
+    def testFormats(self):
+        for real in (True, False):
+            for binary in (True, False):
+                spice_synth.write_rawfile(self.filename, nvars=3, npoints=20000, nplots=2,
+                                          real=real, binary=binary, padded=binary)
+                plots = spice_read.spice_read(self.filename).get_plots()
+                self.assertEqual(len(plots), 2)
+                for n, p in enumerate(plots):
+                    data = spice_synth.synthetic_data(0, 20000, 3, real, n)
+                    self.assertTrue(numpy.allclose(p.get_scalevector().get_data(), data[:,0].real))
+                    self.assertTrue(numpy.allclose(p['v(2)'].get_data(), data[:,2]))
+
+    def testComplexViews(self):
+        spice_synth.write_rawfile(self.filename, nvars=3, npoints=5000, real=False)
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        v1, v2 = p['v(1)'], p['v(2)']
+        self.assertEqual(v1.get_data().dtype, numpy.complex128)
+        self.assertEqual(p.get_scalevector().get_data().dtype, numpy.float64)
+        self.assertTrue(numpy.may_share_memory(v1.get_data(), v2.get_data()),
+                        "Complex vectors are not views of the data block")
+        self.assertTrue(v2.get_db() is v2.get_db())
+        self.assertTrue(numpy.allclose(v2.get_db(), 20*numpy.log10(abs(v2.get_data()))))
+        self.assertTrue(v2.get_phase() is v2.get_phase())
+        f = p.get_scalevector().get_data()
+        fc = 2e3
+        expected = 1/(2*numpy.pi*fc) / (1 + (f/fc)**2)
+        delay = v2.get_group_delay(p.get_scalevector())
+        self.assertTrue(delay is v2.get_group_delay(p.get_scalevector()))
+        self.assertTrue(numpy.allclose(delay[1:-1], expected[1:-1], rtol=1e-3))
+        v2.set_data(v1.get_data())
+        self.assertTrue(numpy.allclose(v2.get_db(), v1.get_db()), "Cache not cleared by set_data")
+
+    def testComplexScale(self):
+        spice_synth.write_rawfile(self.filename, nvars=3, npoints=5000, real=False)
+        p = spice_read.spice_read(self.filename).get_plots()[0]
+        for kwargs in ({'mmap': True}, {'vectors': ['v(1)']}):
+            m = spice_read.spice_read(self.filename, **kwargs).get_plots()[0]
+            scale = m.get_scalevector()
+            self.assertEqual(scale.get_data().dtype, numpy.float64)
+            self.assertTrue(numpy.all(scale.get_data() == p.get_scalevector().get_data()))
+            self.assertTrue(numpy.all(scale.get_imag() == 0))
+            self.assertEqual(len(scale.get_imag()), 5000)
+        self.assertTrue(numpy.all(m['v(1)'].get_imag() == p['v(1)'].get_data().imag))
+
+if __name__ == "__main__":
+    unittest.main()